@@ -1,13 +1,16 @@
+from importlib.util import find_spec
 from pathlib import Path
 import os
-from dotenv import load_dotenv
-import cloudinary
 import dj_database_url
-
-load_dotenv()
+from django.core.exceptions import ImproperlyConfigured
 
 BASE_DIR = Path(__file__).resolve().parent.parent
 
+# Local development reads backend/.env; deployed workers get a real environment and skip dotenv
+if (BASE_DIR / '.env').is_file():
+    from dotenv import load_dotenv
+    load_dotenv(BASE_DIR / '.env')
+
 # Security
 SECRET_KEY = os.getenv("SECRET_KEY", "unsafe-secret-key")  # Ensure this is set in .env in prod
 DEBUG = os.getenv("DEBUG", "False") == "True"
@@ -31,9 +34,11 @@ INSTALLED_APPS = [
 
 # Middleware
 MIDDLEWARE = [
+    "core.middleware.InstrumentationMiddleware",
+    "core.middleware.CompressionMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "corsheaders.middleware.CorsMiddleware", 
-    "whitenoise.middleware.WhiteNoiseMiddleware",
+    "core.middleware.StaticFilesMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
@@ -65,9 +70,25 @@ WSGI_APPLICATION = 'cloudbite.wsgi.application'
 
 # Database
 DATABASES = {
-    'default': dj_database_url.config(default=os.getenv("DATABASE_URL"))
+    'default': dj_database_url.config(default=f"sqlite:///{BASE_DIR / 'db.sqlite3'}")
 }
 
+if DATABASES['default'].get('ENGINE') == 'django.db.backends.sqlite3':
+    # Take the write lock up front so parallel workers wait instead of failing with "database is locked"
+    DATABASES['default'].setdefault('OPTIONS', {}).update({'transaction_mode': 'IMMEDIATE', 'timeout': 20})
+
+# Read replicas (comma-separated URLs) for menu, review and order GETs; see core/routers.py.
+# As test mirrors they get no test database of their own; run the test suite without them.
+DATABASE_REPLICAS = []
+for _number, _url in enumerate(filter(None, os.getenv("DATABASE_REPLICA_URLS", "").split(",")), 1):
+    DATABASES[f'replica{_number}'] = {**dj_database_url.parse(_url), 'TEST': {'MIRROR': 'default'}}
+    DATABASE_REPLICAS.append(f'replica{_number}')
+DATABASE_ROUTERS = ['core.routers.PrimaryReplicaRouter']
+# After a write, that user's reads (and, after a menu change, menu reads) stay on the primary this long;
+# keep it above the replicas' usual lag. Pins are kept in this cache, which must be file or redis (checked below).
+DATABASE_REPLICA_PIN_SECONDS = int(os.getenv("DATABASE_REPLICA_PIN_SECONDS", "10"))
+DATABASE_PIN_CACHE = os.getenv("DATABASE_PIN_CACHE", "menu")
+
 # Password Validation
 AUTH_PASSWORD_VALIDATORS = [
     {'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator'},
@@ -98,25 +119,120 @@ else:
     # Production deploy
     CORS_ALLOW_CREDENTIALS = True
     CORS_ALLOW_ALL_ORIGINS = False
-    CORS_ALLOWED_ORIGINS = os.getenv("CORS_ALLOWED_ORIGINS", "").split(",")
+    CORS_ALLOWED_ORIGINS = [origin for origin in os.getenv("CORS_ALLOWED_ORIGINS", "").split(",") if origin]
 
 # REST Framework
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'core.authentication.ClaimsJWTAuthentication',
     ),
+    # orjson-backed JSON (same output as DRF's JSONRenderer), plus MessagePack for clients that ask for it
+    'DEFAULT_RENDERER_CLASSES': [
+        'core.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'core.renderers.ORJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
+}
+if find_spec("msgpack"):
+    REST_FRAMEWORK['DEFAULT_RENDERER_CLASSES'].append('core.renderers.MessagePackRenderer')
+    REST_FRAMEWORK['DEFAULT_PARSER_CLASSES'].append('core.renderers.MessagePackParser')
+# Responses smaller than this are sent uncompressed; gzip costs more than it saves on them
+GZIP_MIN_LENGTH = int(os.getenv("GZIP_MIN_LENGTH", "1024"))
+
+# Tokens carry username/is_active so authenticated requests skip the User query
+SIMPLE_JWT = {
+    "TOKEN_OBTAIN_SERIALIZER": "core.authentication.ClaimsTokenObtainPairSerializer",
+}
+# Per-process cache of full User rows, for handlers that need more than the token claims
+AUTH_USER_CACHE_TTL = int(os.getenv("AUTH_USER_CACHE_TTL", "60"))
+AUTH_USER_CACHE_SIZE = int(os.getenv("AUTH_USER_CACHE_SIZE", "10000"))
+# How often each process reloads the revoked access tokens; a logout reaches other processes within this
+REVOKED_TOKENS_SYNC_SECONDS = int(os.getenv("REVOKED_TOKENS_SYNC_SECONDS", "5"))
+
+# Cursor pagination for menu items, orders and reviews
+API_PAGE_SIZE = int(os.getenv("API_PAGE_SIZE", "20"))
+API_MAX_PAGE_SIZE = int(os.getenv("API_MAX_PAGE_SIZE", "100"))
+
+# Cache
+# The "menu" alias holds rendered catalog responses and the catalog version: file (shared
+# by the workers on one host, the default) or redis (shared across hosts). locmem is per
+# process, so an edit in one worker would leave the others serving the old menu; it is
+# only allowed with DEBUG (a single runserver process). Tests run on locmem (core/test_runner.py).
+MENU_CACHE_BACKEND = os.getenv("MENU_CACHE_BACKEND", "locmem" if DEBUG else "file")
+if MENU_CACHE_BACKEND == "locmem" and not DEBUG:
+    raise ImproperlyConfigured("MENU_CACHE_BACKEND=locmem is per process; use file or redis when DEBUG is off")
+MENU_CACHE_TIMEOUT = int(os.getenv("MENU_CACHE_TIMEOUT", "3600"))
+
+MENU_CACHES = {
+    "locmem": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "cloudbite-menu",
+        "OPTIONS": {"MAX_ENTRIES": 5000},
+    },
+    "file": {
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        "LOCATION": os.getenv("MENU_CACHE_DIR", os.path.join(BASE_DIR, ".cache", "menu")),
+    },
+    "redis": {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": os.getenv("REDIS_URL", "redis://127.0.0.1:6379/1"),
+    },
+}
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    "menu": {**MENU_CACHES[MENU_CACHE_BACKEND], "TIMEOUT": MENU_CACHE_TIMEOUT},
 }
 
-# Stripe
+# A pin set by one process (the Stripe worker creating an order) has to reach every web worker
+if DATABASE_REPLICAS and CACHES.get(DATABASE_PIN_CACHE, {}).get("BACKEND") not in (
+    MENU_CACHES["file"]["BACKEND"], MENU_CACHES["redis"]["BACKEND"],
+):
+    raise ImproperlyConfigured(
+        "DATABASE_REPLICA_URLS needs DATABASE_PIN_CACHE to name a file or redis cache shared by every process; "
+        "with the default, set MENU_CACHE_BACKEND=file or redis"
+    )
+
+TEST_RUNNER = "core.test_runner.TestRunner"
+
+# Search
+# Ranked menu search returns at most this many items
+SEARCH_RESULT_LIMIT = int(os.getenv("SEARCH_RESULT_LIMIT", "200"))
+
+# Instrumentation
+# Requests slower than this log their slowest queries, if sampled
+SLOW_REQUEST_MS = int(os.getenv("SLOW_REQUEST_MS", "500"))
+# Share of requests (0-1) that keep their query list in case they turn out slow
+SLOW_REQUEST_QUERY_SAMPLE_RATE = float(os.getenv("SLOW_REQUEST_QUERY_SAMPLE_RATE", "0"))
+# Bearer token Prometheus must send to /metrics; without one it is only served when DEBUG
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+# Metrics are per process unless the PROMETHEUS_MULTIPROC_DIR environment variable names a
+# directory all workers share (prometheus_client reads it at import; empty it before they start)
+
+# Stripe (the SDK is imported and configured on first use, see core/integrations.py)
 STRIPE_SECRET_KEY = os.getenv("STRIPE_SECRET_KEY")
+# Point the SDK at stripe-mock or another fake instead of the real API
+STRIPE_API_BASE = os.getenv("STRIPE_API_BASE", "https://api.stripe.com")
 STRIPE_WEBHOOK_SECRET = os.getenv("STRIPE_WEBHOOK_SECRET")
-
-# Cloudinary
-cloudinary.config( 
-    cloud_name = os.getenv("CLOUDINARY_CLOUD_NAME"),
-    api_key = os.getenv("CLOUDINARY_API_KEY"),
-    api_secret = os.getenv("CLOUDINARY_API_SECRET")
-)
+# Outbound HTTP to Stripe (seconds). Under ASGI, checkouts share a keep-alive pool of this size per
+# process; under WSGI each worker thread keeps one requests session instead
+STRIPE_TIMEOUT = float(os.getenv("STRIPE_TIMEOUT", "20"))
+STRIPE_CONNECT_TIMEOUT = float(os.getenv("STRIPE_CONNECT_TIMEOUT", "5"))
+STRIPE_MAX_CONNECTIONS = int(os.getenv("STRIPE_MAX_CONNECTIONS", "200"))
+STRIPE_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("STRIPE_MAX_KEEPALIVE_CONNECTIONS", "50"))
+# Create/refresh the Stripe Price when a MenuItem is saved (see `manage.py sync_stripe_prices`)
+STRIPE_PRICE_SYNC_ON_SAVE = os.getenv("STRIPE_PRICE_SYNC_ON_SAVE", "True") == "True"
+
+# Cloudinary (configured on first use, see core/integrations.py)
+CLOUDINARY_CLOUD_NAME = os.getenv("CLOUDINARY_CLOUD_NAME")
+CLOUDINARY_API_KEY = os.getenv("CLOUDINARY_API_KEY")
+CLOUDINARY_API_SECRET = os.getenv("CLOUDINARY_API_SECRET")
 
 # Auto Field
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
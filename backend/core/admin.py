@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import MenuItem, CartItem, Order, Review
+from .models import MenuItem, CartItem, CheckoutSession, Order, Review, StripeEvent, StripePrice
 
 @admin.register(MenuItem)
 class MenuItemAdmin(admin.ModelAdmin):
@@ -22,3 +22,22 @@ class OrderAdmin(admin.ModelAdmin):
 class ReviewAdmin(admin.ModelAdmin):
     list_display = ['user', 'menu_item', 'rating', 'created_at']
     search_fields = ['comment']
+
+
+@admin.register(StripeEvent)
+class StripeEventAdmin(admin.ModelAdmin):
+    list_display = ['event_id', 'type', 'status', 'attempts', 'created_at']
+    list_filter = ['status', 'type']
+    search_fields = ['event_id']
+
+
+@admin.register(StripePrice)
+class StripePriceAdmin(admin.ModelAdmin):
+    list_display = ['menu_item', 'price_id', 'unit_amount', 'currency', 'synced_at']
+    search_fields = ['menu_item__title', 'price_id', 'product_id']
+
+
+@admin.register(CheckoutSession)
+class CheckoutSessionAdmin(admin.ModelAdmin):
+    list_display = ['stripe_session_id', 'user', 'total_amount', 'created_at']
+    search_fields = ['stripe_session_id']
@@ -0,0 +1,69 @@
+"""
+Async views that keep DRF's request and response path.
+
+DRF's APIView.dispatch is sync, so an async handler can't simply be
+dropped into one. AsyncAPIView runs the same steps (parsers, content
+negotiation, authentication, permissions, throttling, exception handling
+and renderers) around an awaited handler, so a checkout can wait on Stripe
+without holding a worker.
+
+Database work goes through db_call(). Under ASGI it runs on any thread of
+the loop's executor rather than the single thread asgiref keeps for
+thread-sensitive code, so many requests' queries run side by side instead
+of queueing there. Under WSGI the whole view already runs on the worker's
+thread, which holds the connection, so it stays there.
+"""
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.db import close_old_connections
+from rest_framework.views import APIView
+
+
+def db_call(func, serving_asgi):
+    """``func`` as a coroutine function, run where its queries belong (see above)."""
+    if not serving_asgi:
+        return sync_to_async(func)
+
+    def run(*args, **kwargs):
+        try:
+            return func(*args, **kwargs)
+        finally:
+            # Executor threads outlive the request, so close their connections the way request_finished would
+            close_old_connections()
+
+    return sync_to_async(run, thread_sensitive=False)
+
+
+class AsyncAPIView(APIView):
+    """An APIView whose handlers are coroutines; use self.db_call() for the ORM."""
+
+    serving_asgi = False
+
+    def db_call(self, func):
+        return db_call(func, self.serving_asgi)
+
+    async def dispatch(self, request, *args, **kwargs):
+        self.serving_asgi = isinstance(request, ASGIRequest)
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            # Authentication can query (tokens without claims, the revocation reload), as can throttles
+            await self.db_call(self.initial)(request, *args, **kwargs)
+            if request.method.lower() in self.http_method_names:
+                handler = getattr(self, request.method.lower(), self.http_method_not_allowed)
+            else:
+                handler = self.http_method_not_allowed
+            response = handler(request, *args, **kwargs)
+            if asyncio.iscoroutine(response):
+                response = await response
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
@@ -0,0 +1,241 @@
+"""
+JWT authentication without a User query per request.
+
+Tokens issued by login_view and /api/token/ carry the user's username and
+is_active next to the id, and request.user is built from those claims as a
+ClaimsUser: a real User instance (so ORM filters and foreign keys accept it)
+whose other fields are deferred. The first access to one of them loads the
+whole row through ``user_cache``, a small per-process TTL cache that User
+saves and token revocation keep current.
+
+Logout blacklists the refresh token and revokes the access token by jti.
+Deactivating or deleting a user revokes every access token issued to them so far.
+The revocation check runs against ``revoked_tokens``, an in-memory copy of
+the unexpired RevokedToken rows reloaded every REVOKED_TOKENS_SYNC_SECONDS,
+so other processes pick up a logout or deactivation within that interval.
+"""
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import DEFAULT_DB_ALIAS
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .models import ClaimsUser, RevokedToken
+
+# User fields copied into every token; access tokens inherit them from the refresh token
+CLAIM_FIELDS = ("username", "is_active")
+# RevokedToken rows with this jti prefix revoke all of a user's access tokens issued before revoked_at
+USER_REVOCATION_PREFIX = "user:"
+
+
+class TTLCache:
+    """A thread-safe LRU mapping, bounded to ``maxsize`` entries that expire after ``ttl`` seconds."""
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires <= time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+# user id -> {attname: value} for every concrete User field
+user_cache = TTLCache(settings.AUTH_USER_CACHE_SIZE, settings.AUTH_USER_CACHE_TTL)
+
+
+def user_fields(user):
+    return {field.attname: getattr(user, field.attname) for field in User._meta.concrete_fields}
+
+
+def load_user_fields(user_id):
+    values = user_cache.get(user_id)
+    if values is None:
+        values = User.objects.filter(pk=user_id).values(*(field.attname for field in User._meta.concrete_fields)).first()
+        if values is not None:
+            user_cache.set(user_id, values)
+    return values
+
+
+def remember_user(user):
+    # Only a fully loaded instance is a safe cache entry; anything else just drops the stale one
+    if user.get_deferred_fields():
+        user_cache.invalidate(user.pk)
+    else:
+        user_cache.set(user.pk, user_fields(user))
+
+
+def forget_user(user_id):
+    user_cache.invalidate(user_id)
+
+
+def user_revocation(user_id):
+    return f"{USER_REVOCATION_PREFIX}{user_id}"
+
+
+class RevokedTokens:
+    """The jtis of revoked access tokens that have not expired yet, and the users whose tokens were all revoked."""
+
+    def __init__(self):
+        self._expiry = {}  # jti -> exp (unix time)
+        self._users = {}  # user id -> revoked_at (unix time)
+        self._synced_at = None
+        self._lock = threading.Lock()
+
+    def __contains__(self, jti):
+        self.sync_if_due()
+        return jti in self._expiry
+
+    def user_revoked_at(self, user_id):
+        self.sync_if_due()
+        return self._users.get(str(user_id))
+
+    def sync_if_due(self):
+        synced_at = self._synced_at
+        if synced_at is None or time.monotonic() - synced_at >= settings.REVOKED_TOKENS_SYNC_SECONDS:
+            with self._lock:
+                if self._synced_at == synced_at:
+                    self.sync()
+
+    def sync(self):
+        # Only access tokens live here, so the table holds at most ACCESS_TOKEN_LIFETIME worth of revocations
+        now = datetime.now(timezone.utc)
+        rows = RevokedToken.objects.filter(expires_at__gt=now).values_list("jti", "expires_at", "revoked_at")
+        expiry, users = {}, {}
+        for jti, expires_at, revoked_at in rows:
+            if jti.startswith(USER_REVOCATION_PREFIX):
+                users[jti.removeprefix(USER_REVOCATION_PREFIX)] = revoked_at.timestamp()
+            else:
+                expiry[jti] = expires_at.timestamp()
+        self._expiry, self._users = expiry, users
+        self._synced_at = time.monotonic()
+
+    def add(self, jti, exp):
+        # Local revocations apply straight away; expired entries are dropped at the next sync
+        self._expiry[jti] = exp
+
+    def add_user(self, user_id, revoked_at):
+        self._users[str(user_id)] = revoked_at
+
+    def clear(self):
+        with self._lock:
+            self._expiry = {}
+            self._users = {}
+            self._synced_at = None
+
+
+revoked_tokens = RevokedTokens()
+
+
+def revoke_access_token(token):
+    jti, exp = token[api_settings.JTI_CLAIM], token["exp"]
+    RevokedToken.objects.bulk_create(
+        [RevokedToken(jti=jti, expires_at=datetime.fromtimestamp(exp, timezone.utc))], ignore_conflicts=True
+    )
+    revoked_tokens.add(jti, exp)
+    forget_user(token[api_settings.USER_ID_CLAIM])
+
+
+def revoke_user_tokens(user_id):
+    """Revokes every access token issued to the user until now; refresh tokens check is_active themselves."""
+    now = datetime.now(timezone.utc)
+    RevokedToken.objects.update_or_create(
+        jti=user_revocation(user_id),
+        defaults={"expires_at": now + api_settings.ACCESS_TOKEN_LIFETIME, "revoked_at": now},
+    )
+    revoked_tokens.add_user(user_id, now.timestamp())
+
+
+def revoke_refresh_token(token, user):
+    # RefreshToken.blacklist() without its User lookup and get_or_create savepoints
+    outstanding, _ = OutstandingToken.objects.get_or_create(
+        jti=token[api_settings.JTI_CLAIM],
+        defaults={"user": user, "token": str(token), "expires_at": datetime.fromtimestamp(token["exp"], timezone.utc)},
+    )
+    BlacklistedToken.objects.bulk_create([BlacklistedToken(token=outstanding)], ignore_conflicts=True)
+
+
+class ClaimsRefreshToken(RefreshToken):
+    @classmethod
+    def for_user(cls, user):
+        token = super().for_user(user)
+        for field in CLAIM_FIELDS:
+            token[field] = getattr(user, field)
+        return token
+
+
+class ClaimsTokenObtainPairSerializer(TokenObtainPairSerializer):
+    token_class = ClaimsRefreshToken
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    def get_validated_token(self, raw_token):
+        token = super().get_validated_token(raw_token)
+        if token.get(api_settings.JTI_CLAIM) in revoked_tokens:
+            raise InvalidToken(_("Token has been revoked"))
+        # Issued before the user was deactivated (iat is whole seconds, so the same second counts)
+        revoked_at = revoked_tokens.user_revoked_at(token.get(api_settings.USER_ID_CLAIM))
+        if revoked_at is not None and token.get("iat", 0) <= revoked_at:
+            raise InvalidToken(_("Token has been revoked"))
+        return token
+
+    def get_user(self, validated_token):
+        if any(field not in validated_token for field in CLAIM_FIELDS):
+            # Issued before tokens carried claims; look the user up as simplejwt does
+            return super().get_user(validated_token)
+
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+        values = user_cache.get(user_id)
+        # A recycled id (or a row replaced behind the cache's back) must not borrow another user's fields
+        if values is None or values["username"] != validated_token["username"]:
+            values = {api_settings.USER_ID_FIELD: user_id, **{field: validated_token[field] for field in CLAIM_FIELDS}}
+
+        if api_settings.CHECK_USER_IS_ACTIVE and not values["is_active"]:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+
+        # from_db expects the values in model field order
+        names = [field.attname for field in User._meta.concrete_fields if field.attname in values]
+        return ClaimsUser.from_db(DEFAULT_DB_ALIAS, names, [values[name] for name in names])
+
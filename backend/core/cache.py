@@ -0,0 +1,188 @@
+import hashlib
+import time
+
+from django.core.cache import caches
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.http import parse_etags, quote_etag
+from rest_framework.response import Response
+
+from .routers import CATALOG_PIN, pin_to_primary
+
+CATALOG_CACHE_ALIAS = "menu"
+VERSION_KEY = "menu:version"
+HITS_KEY = "menu:stats:hits"
+MISSES_KEY = "menu:stats:misses"
+RATINGS_SCOPE = "ratings"
+
+
+def get_cache():
+    return caches[CATALOG_CACHE_ALIAS]
+
+
+def scope_key(scope):
+    return f"{VERSION_KEY}:{scope}"
+
+
+def item_scope(menu_item_id):
+    return f"item:{menu_item_id}"
+
+
+def _seed_version(cache, key):
+    # Seed from the clock so an evicted version never reuses old keys
+    cache.add(key, int(time.time() * 1000), None)
+    return cache.get(key)
+
+
+def _bump(key):
+    cache = get_cache()
+    try:
+        return cache.incr(key)
+    except ValueError:
+        _seed_version(cache, key)
+        return cache.incr(key)
+
+
+def get_catalog_version():
+    cache = get_cache()
+    version = cache.get(VERSION_KEY)
+    return _seed_version(cache, VERSION_KEY) if version is None else version
+
+
+def bump_catalog_version():
+    # Until the replicas catch up, refilling the cache must read from the primary
+    pin_to_primary(CATALOG_PIN)
+    return _bump(VERSION_KEY)
+
+
+def get_versions(*scopes):
+    """The catalog version followed by the version of each scope, in one cache round trip."""
+    cache = get_cache()
+    keys = [VERSION_KEY, *map(scope_key, scopes)]
+    versions = cache.get_many(keys)
+    return [versions[key] if key in versions else _seed_version(cache, key) for key in keys]
+
+
+def bump_scopes(*scopes):
+    """Invalidates only the entries cached under these scopes, leaving the rest of the catalog cached."""
+    pin_to_primary(CATALOG_PIN)
+    for scope in scopes:
+        _bump(scope_key(scope))
+
+
+def _incr(key):
+    cache = get_cache()
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, 0, None)
+        cache.incr(key)
+
+
+def get_stats():
+    cache = get_cache()
+    hits = cache.get(HITS_KEY, 0)
+    misses = cache.get(MISSES_KEY, 0)
+    total = hits + misses
+    return {
+        "version": get_catalog_version(),
+        "hits": hits,
+        "misses": misses,
+        "hit_ratio": round(hits / total, 4) if total else 0.0,
+    }
+
+
+def reset_stats():
+    get_cache().delete_many([HITS_KEY, MISSES_KEY])
+
+
+def build_key(request, *parts, scopes=()):
+    query = sorted(
+        (key, value)
+        for key, values in request.query_params.lists()
+        for value in values
+    )
+    digest = hashlib.md5(repr(query).encode(), usedforsecurity=False).hexdigest()
+    versions = "-".join(map(str, get_versions(*scopes)))
+    return ":".join(["menu", f"v{versions}", *map(str, parts), request.accepted_renderer.format, digest])
+
+
+def etag_for(key):
+    # The key holds the catalog version, so the tag changes whenever the response could
+    return quote_etag(hashlib.md5(key.encode(), usedforsecurity=False).hexdigest())
+
+
+def etag_matches(request, etag):
+    # GZipMiddleware weakens the ETags it sends, so compare the way If-None-Match does: weakly
+    tags = {tag.removeprefix("W/") for tag in parse_etags(request.headers.get("If-None-Match", ""))}
+    return etag in tags or "*" in tags
+
+
+class CatalogCacheMixin:
+    """
+    Serves list/detail GETs from the rendered bytes cached under the current
+    catalog version. MenuItem saves and deletes bump the version (see signals).
+    Review writes only bump the scopes of what they change (see ratings): the
+    top-rated and changes feeds, and the item's detail and reviews. Menu list
+    pages may show ratings up to MENU_CACHE_TIMEOUT old.
+    Responses carry an ETag derived from the same key, and a matching
+    If-None-Match is answered with a 304 before the cache is even read.
+    """
+
+    cached_actions = ("list", "retrieve", "top_rated", "reviews", "changes")
+    ratings_actions = ("top_rated", "changes")
+    item_actions = ("retrieve", "reviews")
+
+    def _catalog_cache_key(self, request):
+        if request.method != "GET" or self.action not in self.cached_actions:
+            return None
+        # The browsable API embeds the current user, so only cache data formats
+        if request.accepted_renderer.format == "api":
+            return None
+        lookup = self.kwargs.get(self.lookup_url_kwarg or self.lookup_field, "")
+        scopes = ()
+        if self.action in self.ratings_actions:
+            scopes = (RATINGS_SCOPE,)
+        elif self.action in self.item_actions:
+            scopes = (item_scope(lookup),)
+        return build_key(request, self.action, lookup, scopes=scopes)
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(request, super().list, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(request, super().retrieve, *args, **kwargs)
+
+    def cached_response(self, request, handler, *args, **kwargs):
+        key = self._catalog_cache_key(request)
+        if key is None:
+            return handler(request, *args, **kwargs)
+
+        etag = etag_for(key)
+        if etag_matches(request, etag):
+            _incr(HITS_KEY)
+            response = HttpResponseNotModified()
+            response["ETag"] = etag
+            return response
+
+        entry = get_cache().get(key)
+        if entry is not None:
+            _incr(HITS_KEY)
+            content, content_type = entry
+            response = HttpResponse(content, content_type=content_type)
+            response["X-Cache"] = "HIT"
+            response["ETag"] = etag
+            return response
+
+        _incr(MISSES_KEY)
+        request._catalog_cache_key = key
+        return handler(request, *args, **kwargs)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        key = getattr(request, "_catalog_cache_key", None)
+        if key and isinstance(response, Response) and response.status_code == 200:
+            response.render()
+            get_cache().set(key, (response.content, response["Content-Type"]))
+            response["X-Cache"] = "MISS"
+            response["ETag"] = etag_for(key)
+        return response
@@ -0,0 +1,37 @@
+from django.db import transaction
+from django.db.models import Case, F, PositiveIntegerField, Value, When
+
+from .models import CartItem, MenuItem
+from .routers import pin_to_primary, user_pin
+
+
+def merge_cart_items(user, quantities):
+    """
+    Adds ``{menu_item_id: quantity}`` to the user's cart in three queries,
+    whatever the number of lines. Unknown menu items are ignored. Rows are
+    created with quantity 0 (a concurrent merge's rows are left alone by the
+    unique constraint) and every line is then incremented with F(), so two
+    merges running at once both land.
+    """
+    if not quantities:
+        return []
+
+    with transaction.atomic():
+        menu_item_ids = sorted(MenuItem.objects.filter(id__in=quantities).values_list('id', flat=True))
+        if not menu_item_ids:
+            return []
+
+        CartItem.objects.bulk_create(
+            [CartItem(user=user, menu_item_id=menu_item_id, quantity=0) for menu_item_id in menu_item_ids],
+            ignore_conflicts=True,
+        )
+        CartItem.objects.filter(user=user, menu_item_id__in=menu_item_ids).update(
+            quantity=F('quantity') + Case(
+                *[When(menu_item_id=menu_item_id, then=Value(quantities[menu_item_id])) for menu_item_id in menu_item_ids],
+                default=Value(0),
+                output_field=PositiveIntegerField(),
+            )
+        )
+    # Bulk writes skip the signals that pin the user to the primary
+    pin_to_primary(user_pin(user.pk))
+    return menu_item_ids
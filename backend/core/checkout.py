@@ -0,0 +1,45 @@
+"""
+Server-side cart snapshots for Stripe Checkout.
+
+When a Checkout Session is created, its lines are recorded in integer cents
+under the Stripe session ID, so the webhook can build the Order from the
+database rather than from metadata (500 characters per value, floats).
+"""
+from decimal import Decimal
+
+from django.db import transaction
+
+from .models import CheckoutSession, CheckoutSessionItem
+from .stripe_catalog import to_cents
+
+
+def record_checkout_session(session_id, user, lines):
+    """Stores ``lines`` ([(menu_item, quantity)]) as the snapshot of ``session_id``."""
+    items = [(menu_item, quantity, to_cents(menu_item.price)) for menu_item, quantity in lines]
+    with transaction.atomic():
+        checkout = CheckoutSession.objects.create(
+            stripe_session_id=session_id,
+            user=user,
+            total_amount=sum(unit_amount * quantity for _, quantity, unit_amount in items),
+        )
+        CheckoutSessionItem.objects.bulk_create(
+            CheckoutSessionItem(checkout=checkout, menu_item=menu_item, quantity=quantity, unit_amount=unit_amount)
+            for menu_item, quantity, unit_amount in items
+        )
+    return checkout
+
+
+def snapshot_lines(session_id):
+    """
+    (user id, [(menu item id, quantity, unit price)]) for a recorded session,
+    from one query on the session ID index, or None if there is no snapshot.
+    Menu item ids are None for items deleted since checkout.
+    """
+    rows = list(
+        CheckoutSessionItem.objects.filter(checkout__stripe_session_id=session_id)
+        .order_by("id")
+        .values_list("checkout__user_id", "menu_item_id", "quantity", "unit_amount")
+    )
+    if not rows:
+        return None
+    return rows[0][0], [(menu_item_id, quantity, Decimal(unit_amount).scaleb(-2)) for _, menu_item_id, quantity, unit_amount in rows]
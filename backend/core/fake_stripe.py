@@ -0,0 +1,133 @@
+import hashlib
+import hmac
+import itertools
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl
+
+
+def sign_payload(payload, secret, timestamp=None):
+    """Builds a Stripe-Signature header value for a webhook payload (bytes)."""
+    timestamp = int(timestamp or time.time())
+    signed = f"{timestamp}.".encode() + payload
+    signature = hmac.new(secret.encode(), signed, hashlib.sha256).hexdigest()
+    return f"t={timestamp},v1={signature}"
+
+
+class _Server(ThreadingHTTPServer):
+    # The default backlog of 5 drops connections when hundreds of checkouts arrive at once
+    request_queue_size = 1024
+
+
+class FakeStripeServer:
+    """
+    Minimal local stand-in for the Stripe API, enough for products, prices and
+    checkout sessions. Point the SDK at it with ``stripe.api_base = server.url``.
+    Every request is recorded in ``requests`` as (method, path, params), and
+    ``latency`` (seconds) is slept before each response to mimic the network.
+    """
+
+    def __init__(self, latency=0.0, host="127.0.0.1", port=0):
+        self.latency = latency
+        self.requests = []
+        self.objects = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._server = _Server((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def requests_to(self, path):
+        return [params for method, request_path, params in self.requests if request_path == path]
+
+    def _new_id(self, prefix):
+        return f"{prefix}_{next(self._ids)}"
+
+    def handle(self, method, path, params):
+        with self._lock:
+            self.requests.append((method, path, params))
+            if method == "POST" and path == "/v1/products":
+                obj = {"id": self._new_id("prod"), "object": "product", "active": True, **params}
+            elif method == "POST" and path == "/v1/prices":
+                obj = {
+                    "id": self._new_id("price"),
+                    "object": "price",
+                    "active": True,
+                    "product": params.get("product"),
+                    "currency": params.get("currency"),
+                    "unit_amount": int(params.get("unit_amount", 0)),
+                }
+            elif method == "POST" and path == "/v1/checkout/sessions":
+                session_id = self._new_id("cs_test")
+                obj = {
+                    "id": session_id,
+                    "object": "checkout.session",
+                    "url": f"https://checkout.stripe.test/{session_id}",
+                    "metadata": {key[9:-1]: value for key, value in params.items() if key.startswith("metadata[")},
+                }
+            elif method == "POST" and path.count("/") == 3 and path.rsplit("/", 1)[0] in ("/v1/products", "/v1/prices"):
+                obj = self.objects.get(path.rsplit("/", 1)[1])
+                if obj is None:
+                    return 404, {"error": {"type": "invalid_request_error", "message": f"No such object: {path}"}}
+                obj.update(params)
+            elif method == "GET" and path.rsplit("/", 1)[1] in self.objects:
+                obj = self.objects[path.rsplit("/", 1)[1]]
+            else:
+                return 404, {"error": {"type": "invalid_request_error", "message": f"Unrecognized request URL: {path}"}}
+            self.objects[obj["id"]] = obj
+            return 200, obj
+
+    def _handler_class(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _respond(self, method):
+                path, _, query = self.path.partition("?")
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length).decode() if length else query
+                params = dict(parse_qsl(body, keep_blank_values=True))
+                if fake.latency:
+                    time.sleep(fake.latency)
+                status, payload = fake.handle(method, path, params)
+                content = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(content)))
+                self.send_header("Request-Id", f"req_{time.monotonic_ns()}")
+                self.end_headers()
+                self.wfile.write(content)
+
+            def do_GET(self):
+                self._respond("GET")
+
+            def do_POST(self):
+                self._respond("POST")
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
@@ -0,0 +1,149 @@
+"""
+Read-only twins of the hot ModelSerializers that work on ``.values()`` rows.
+
+The field map is compiled once from the real serializer class, so the output
+keeps the same keys, order and formatting (DRF's own Decimal/datetime
+conversions are reused) without building a serializer or model instance per
+row. Writes still go through the regular serializers.
+"""
+from operator import itemgetter
+
+from rest_framework import serializers
+from rest_framework.generics import get_object_or_404
+from rest_framework.response import Response
+
+from .images import srcset
+from .metrics import span
+from .serializers import MenuItemSerializer, OrderSerializer
+
+# DRF fields whose to_representation returns a database value unchanged
+PASSTHROUGH_FIELDS = (
+    serializers.IntegerField,
+    serializers.CharField,
+    serializers.BooleanField,
+    serializers.FloatField,
+    serializers.ReadOnlyField,
+)
+
+
+def _column(key, convert):
+    if convert is None:
+        return itemgetter(key)
+
+    def get(row):
+        value = row[key]
+        return None if value is None else convert(value)
+
+    return get
+
+
+def _nested(plan):
+    def get(row):
+        return {name: get_value(row) for name, get_value in plan}
+
+    return get
+
+
+class RowSerializer:
+    """
+    Serializes ``.values(*columns)`` rows like ``serializer_class`` does model
+    instances. Nested single objects are read from joined ``a__b`` columns;
+    nested lists (many=True) are fetched with one extra query in serialize().
+    ``method_fields`` maps each SerializerMethodField to the (column,
+    converter) pair that reproduces it from a row.
+    """
+
+    def __init__(self, serializer_class, method_fields=None):
+        self.model = serializer_class.Meta.model
+        self.method_fields = method_fields or {}
+        self.columns = []
+        self.related = []
+        self.plan = self.compile(serializer_class(), "")
+        if "id" not in self.columns:
+            self.columns.append("id")
+
+    def compile(self, serializer, prefix):
+        plan = []
+        for name, field in serializer.fields.items():
+            if field.write_only:
+                continue
+            key = prefix + field.source
+            if isinstance(field, serializers.ListSerializer):
+                if prefix:
+                    raise ValueError(f"Nested lists are only supported at the top level, not {prefix}{name}")
+                # Filled in by serialize() from a second query
+                self.related.append((name, field.source, RowSerializer(type(field.child), self.method_fields)))
+                plan.append((name, itemgetter(name)))
+            elif isinstance(field, serializers.Serializer):
+                plan.append((name, _nested(self.compile(field, key + "__"))))
+            elif isinstance(field, serializers.SerializerMethodField):
+                column, convert = self.method_fields[name]
+                self.add_column(prefix + column)
+                plan.append((name, _column(prefix + column, convert)))
+            else:
+                self.add_column(key)
+                plan.append((name, _column(key, None if isinstance(field, PASSTHROUGH_FIELDS) else field.to_representation)))
+        return plan
+
+    def add_column(self, column):
+        if column not in self.columns:
+            self.columns.append(column)
+
+    def to_representation(self, row):
+        return {name: get(row) for name, get in self.plan}
+
+    def serialize(self, rows):
+        rows = list(rows)
+        children = []
+        for name, source, child in self.related:
+            relation = self.model._meta.get_field(source)
+            fk = relation.field.name + "_id"
+            ids = [row["id"] for row in rows]
+            children.append((name, fk, child, list(relation.related_model.objects.filter(**{f"{fk}__in": ids}).values(fk, *child.columns))))
+
+        with span("serialize"):
+            for name, fk, child, child_rows in children:
+                grouped = {row["id"]: [] for row in rows}
+                for child_row in child_rows:
+                    grouped[child_row[fk]].append(child.to_representation(child_row))
+                for row in rows:
+                    row[name] = grouped[row["id"]]
+            return [self.to_representation(row) for row in rows]
+
+
+class FastReadMixin:
+    """
+    Serves list and retrieve from ``row_serializer`` instead of the
+    ModelSerializer. Cursor pagination works on the rows as long as the
+    ordering column is selected, so it is added to the columns.
+    """
+
+    row_serializer = None
+
+    def get_row_queryset(self):
+        columns = list(self.row_serializer.columns)
+        ordering = getattr(self.paginator, "ordering", None) or ()
+        for field in [ordering] if isinstance(ordering, str) else ordering:
+            if field.lstrip("-") not in columns:
+                columns.append(field.lstrip("-"))
+        # select_related/prefetch_related are for the model path; the row serializer joins itself
+        return self.filter_queryset(self.get_queryset()).prefetch_related(None).values(*columns)
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.get_row_queryset()
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(self.row_serializer.serialize(page))
+        return Response(self.row_serializer.serialize(queryset))
+
+    def retrieve(self, request, *args, **kwargs):
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        row = get_object_or_404(self.get_row_queryset(), **{self.lookup_field: self.kwargs[lookup_url_kwarg]})
+        self.check_object_permissions(request, row)
+        return Response(self.row_serializer.serialize([row])[0])
+
+
+MENU_ITEM_METHOD_FIELDS = {"image_srcset": ("image_variants", lambda variants: srcset(variants) or None)}
+
+menu_item_rows = RowSerializer(MenuItemSerializer, MENU_ITEM_METHOD_FIELDS)
+order_rows = RowSerializer(OrderSerializer, MENU_ITEM_METHOD_FIELDS)
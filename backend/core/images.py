@@ -0,0 +1,31 @@
+from django.conf import settings
+
+from .integrations import get_cloudinary
+
+# Widths (px) of the resized copies served next to the original
+VARIANT_WIDTHS = getattr(settings, "MENU_IMAGE_VARIANTS", {"thumbnail": 160, "card": 480, "hero": 1200})
+
+
+def variant_urls(resource):
+    """
+    Returns (secure URL, variants) for a CloudinaryResource, where variants maps
+    each VARIANT_WIDTHS name to {"url", "width"}. The URLs are built locally
+    from the Cloudinary config; nothing is fetched.
+    """
+    if not resource:
+        return None, {}
+    get_cloudinary()
+    variants = {
+        name: {
+            "url": resource.build_url(
+                secure=True, width=width, crop="limit", quality="auto", fetch_format="auto"
+            ),
+            "width": width,
+        }
+        for name, width in VARIANT_WIDTHS.items()
+    }
+    return resource.build_url(secure=True), variants
+
+
+def srcset(variants):
+    return ", ".join(f"{variant['url']} {variant['width']}w" for variant in variants.values())
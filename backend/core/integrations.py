@@ -0,0 +1,63 @@
+"""
+Stripe and Cloudinary, set up on first use instead of at import.
+
+Importing the Stripe SDK (and httpx under it) takes most of a second, which
+every worker, management command and test run used to pay whether it
+talked to Stripe or not. get_stripe() imports and configures it the first
+time something needs it; get_cloudinary() does the same for the Cloudinary
+settings. Changing their settings (override_settings in tests) sets them
+up again on the next call.
+
+Code that swaps the SDK configuration temporarily (the load-test fakes)
+should call these first, so the first real use doesn't overwrite the swap.
+"""
+import functools
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+STRIPE_SETTINGS = {
+    "STRIPE_SECRET_KEY", "STRIPE_API_BASE", "STRIPE_TIMEOUT", "STRIPE_CONNECT_TIMEOUT",
+    "STRIPE_MAX_CONNECTIONS", "STRIPE_MAX_KEEPALIVE_CONNECTIONS",
+}
+CLOUDINARY_SETTINGS = {"CLOUDINARY_CLOUD_NAME", "CLOUDINARY_API_KEY", "CLOUDINARY_API_SECRET"}
+
+
+@functools.cache
+def get_stripe():
+    import stripe
+
+    from .stripe_http import build_http_client
+
+    stripe.api_key = settings.STRIPE_SECRET_KEY
+    stripe.api_base = settings.STRIPE_API_BASE
+    stripe.default_http_client = build_http_client()
+    return stripe
+
+
+@functools.cache
+def get_cloudinary():
+    import cloudinary
+
+    cloudinary.config(
+        cloud_name=settings.CLOUDINARY_CLOUD_NAME,
+        api_key=settings.CLOUDINARY_API_KEY,
+        api_secret=settings.CLOUDINARY_API_SECRET,
+    )
+    return cloudinary
+
+
+async def create_checkout_session(serving_asgi=False, **params):
+    get_stripe()
+    from . import stripe_http
+
+    return await stripe_http.create_checkout_session(serving_asgi, **params)
+
+
+@receiver(setting_changed)
+def reset_integrations(setting, **kwargs):
+    if setting in STRIPE_SETTINGS:
+        get_stripe.cache_clear()
+    elif setting in CLOUDINARY_SETTINGS:
+        get_cloudinary.cache_clear()
@@ -0,0 +1,385 @@
+"""
+In-process load-test harness for `manage.py loadtest`.
+
+Virtual users run shopper journeys against the project's WSGI or ASGI
+application inside one process, on a throwaway database, with Stripe replaced
+by FakeStripeServer, Cloudinary stubbed and a cache of its own, so runs are
+repeatable and can be compared between commits.
+"""
+import asyncio
+import io
+import json
+import math
+import random
+import tempfile
+import threading
+import time
+from collections import defaultdict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from decimal import Decimal
+from pathlib import Path
+from urllib.parse import urlsplit
+
+import cloudinary
+import cloudinary.uploader
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connections
+from django.test.utils import override_settings
+
+from . import integrations
+from .authentication import ClaimsRefreshToken
+from .fake_stripe import FakeStripeServer, sign_payload
+from .models import MenuItem, Review, StripePrice
+from .webhooks import process_batch
+
+HOST = "localhost"
+WEBHOOK_SECRET = "whsec_loadtest"
+SEARCH_TERMS = ["pizza", "pas", "curry", "salad", "burg", "spicy", "veg", "house"]
+DISHES = ["pizza", "pasta", "curry", "salad", "burger", "noodles", "tacos", "soup"]
+
+Request = namedtuple("Request", "name method path body headers")
+
+
+class Response(namedtuple("Response", "status content")):
+    def json(self):
+        return json.loads(self.content) if self.content else None
+
+
+@contextmanager
+def temporary_database(using="default"):
+    """Creates, migrates and finally drops a scratch copy of the ``using`` database."""
+    db = connections[using]
+    scratch = None
+    if db.vendor == "sqlite":
+        # A file rather than :memory: so every thread sees the same data
+        scratch = tempfile.TemporaryDirectory()
+        db.settings_dict.setdefault("TEST", {})["NAME"] = str(Path(scratch.name) / "loadtest.sqlite3")
+    old_name = db.settings_dict["NAME"]
+    db.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    try:
+        yield db
+    finally:
+        connections.close_all()
+        db.creation.destroy_test_db(old_name, verbosity=0)
+        if scratch:
+            scratch.cleanup()
+
+
+@contextmanager
+def scratch_cache():
+    """
+    Swaps the menu cache (catalog entries, versions and replica pins) for a
+    locmem one of its own, so a run never touches the file or redis cache a
+    live site on the same host is using.
+    """
+    scratch = {**settings.MENU_CACHES["locmem"], "LOCATION": "cloudbite-loadtest", "TIMEOUT": settings.MENU_CACHE_TIMEOUT}
+    aliases = {"menu", settings.DATABASE_PIN_CACHE}
+    with override_settings(CACHES={**settings.CACHES, **{alias: scratch for alias in aliases}}):
+        yield
+
+
+def _fake_upload(file, **options):
+    public_id = options.get("public_id") or f"loadtest/{abs(hash(str(file)))}"
+    return {
+        "public_id": public_id,
+        "version": 1,
+        "type": "upload",
+        "resource_type": "image",
+        "format": "jpg",
+        "secure_url": f"https://res.cloudinary.com/cloudbite-loadtest/image/upload/v1/{public_id}.jpg",
+    }
+
+
+@contextmanager
+def stub_cloudinary():
+    """Builds image URLs for a fake cloud and answers uploads locally."""
+    # Set up for real first, so a first use inside the block doesn't undo the stub
+    integrations.get_cloudinary()
+    config = cloudinary.config()
+    previous = (config.cloud_name, config.api_key, config.api_secret, cloudinary.uploader.upload)
+    cloudinary.config(cloud_name="cloudbite-loadtest", api_key="loadtest", api_secret="loadtest")
+    cloudinary.uploader.upload = _fake_upload
+    try:
+        yield
+    finally:
+        config.cloud_name, config.api_key, config.api_secret, cloudinary.uploader.upload = previous
+
+
+@contextmanager
+def fake_stripe(latency=0.0):
+    """Points the Stripe SDK at a FakeStripeServer for the duration."""
+    stripe = integrations.get_stripe()
+    previous = stripe.api_key, stripe.api_base
+    with FakeStripeServer(latency=latency) as server:
+        stripe.api_key, stripe.api_base = "sk_test_loadtest", server.url
+        try:
+            yield server
+        finally:
+            stripe.api_key, stripe.api_base = previous
+
+
+def seed(menu_items, users, reviews_per_item=5, rng=None):
+    """Fills the scratch database. Returns (menu item ids, [(user, access token)])."""
+    rng = rng or random.Random(0)
+    items = [
+        MenuItem(
+            title=f"{rng.choice(['House', 'Spicy', 'Veg', 'Classic'])} {DISHES[i % len(DISHES)]} {i}",
+            description=f"Seasonal {DISHES[i % len(DISHES)]} made to order, number {i}",
+            price=Decimal(rng.randrange(400, 2500)) / 100,
+            image=f"menu/dish_{i}",
+        )
+        for i in range(menu_items)
+    ]
+    for item in items:
+        # bulk_create skips save(), which normally builds the image URLs
+        item.refresh_image_urls()
+    items = MenuItem.objects.bulk_create(items)
+    StripePrice.objects.bulk_create(
+        StripePrice(
+            menu_item=item, product_id=f"prod_seed_{item.id}", price_id=f"price_seed_{item.id}",
+            product_name=item.title, unit_amount=int(item.price * 100),
+        )
+        for item in items
+    )
+
+    accounts = User.objects.bulk_create(User(username=f"loadtest{i}", password="!") for i in range(users))
+    Review.objects.bulk_create(
+        Review(user=rng.choice(accounts), menu_item=item, rating=rng.randint(1, 5), comment="Seeded review")
+        for item in items
+        for _ in range(reviews_per_item)
+    )
+    return [item.id for item in items], [(user, str(ClaimsRefreshToken.for_user(user).access_token)) for user in accounts]
+
+
+def _path(url):
+    parts = urlsplit(url)
+    return f"{parts.path}?{parts.query}" if parts.query else parts.path
+
+
+def journey(token, menu_ids, rng, fake_stripe):
+    """
+    One shopper session as a generator: yields Requests and is sent back the
+    Response of each, so the same journey drives both WSGI and ASGI.
+    """
+    auth = {"Authorization": f"Bearer {token}"}
+
+    def get(name, path):
+        return Request(name, "GET", path, None, auth)
+
+    def post(name, path, data=None, headers=None):
+        body = data if isinstance(data, bytes) else json.dumps(data or {}).encode()
+        return Request(name, "POST", path, body, {**auth, "Content-Type": "application/json", **(headers or {})})
+
+    # Browse
+    page = yield get("GET /api/menu-items/", "/api/menu-items/")
+    if page.status == 200 and page.json()["next"]:
+        yield get("GET /api/menu-items/ (next page)", _path(page.json()["next"]))
+    yield get("GET /api/menu-items/top-rated/", "/api/menu-items/top-rated/")
+    item_id = rng.choice(menu_ids)
+    yield get("GET /api/menu-items/{id}/", f"/api/menu-items/{item_id}/")
+    yield get("GET /api/menu-items/{id}/reviews/", f"/api/menu-items/{item_id}/reviews/")
+
+    # Search
+    yield get("GET /api/menu-items/?search=", f"/api/menu-items/?search={rng.choice(SEARCH_TERMS)}")
+
+    # Add to cart
+    for menu_item_id in rng.sample(menu_ids, 3):
+        yield post("POST /api/cart-items/", "/api/cart-items/", {"menu_item_id": menu_item_id, "quantity": rng.randint(1, 3)})
+    yield get("GET /api/cart-items/", "/api/cart-items/")
+
+    # Merge the cart kept while logged out
+    guest_cart = [{"menu_item_id": menu_item_id, "quantity": 1} for menu_item_id in rng.sample(menu_ids, 5)]
+    yield post("POST /api/merge-cart/", "/api/merge-cart/", {"items": guest_cart})
+
+    # Checkout
+    checkout = yield post("POST /api/create-multi-checkout-session/", "/api/create-multi-checkout-session/")
+    if checkout.status != 200:
+        return
+
+    # Stripe delivers the completed session, then delivers it again
+    session = fake_stripe.objects[checkout.json()["sessionId"]]
+    payload = json.dumps({
+        "id": f"evt_{session['id']}",
+        "object": "event",
+        "type": "checkout.session.completed",
+        "data": {"object": session},
+    }).encode()
+    for name in ("POST /api/stripe-webhook/", "POST /api/stripe-webhook/ (replay)"):
+        yield post(name, "/api/stripe-webhook/", payload, {"Stripe-Signature": sign_payload(payload, WEBHOOK_SECRET)})
+
+
+class Recorder:
+    def __init__(self):
+        self.samples = defaultdict(list)
+        self.errors = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def record(self, name, status, seconds):
+        with self._lock:
+            self.samples[name].append(seconds)
+            if status >= 400:
+                self.errors[name] += 1
+
+    def report(self, duration):
+        endpoints = {name: summarize(samples, self.errors[name], duration) for name, samples in sorted(self.samples.items())}
+        every = [seconds for samples in self.samples.values() for seconds in samples]
+        return {
+            "duration_s": round(duration, 3),
+            "total": summarize(every, sum(self.errors.values()), duration),
+            "endpoints": endpoints,
+        }
+
+
+def percentile(ordered, p):
+    # Nearest-rank
+    index = max(0, min(len(ordered) - 1, math.ceil(p / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize(samples, errors, duration):
+    ordered = sorted(samples)
+    ms = lambda seconds: round(seconds * 1000, 2)
+    return {
+        "requests": len(ordered),
+        "errors": errors,
+        "rps": round(len(ordered) / duration, 2) if duration else 0.0,
+        "mean_ms": ms(sum(ordered) / len(ordered)) if ordered else 0.0,
+        "p50_ms": ms(percentile(ordered, 50)) if ordered else 0.0,
+        "p95_ms": ms(percentile(ordered, 95)) if ordered else 0.0,
+        "p99_ms": ms(percentile(ordered, 99)) if ordered else 0.0,
+        "max_ms": ms(ordered[-1]) if ordered else 0.0,
+    }
+
+
+def call_wsgi(application, request):
+    path, _, query = request.path.partition("?")
+    body = request.body or b""
+    environ = {
+        "REQUEST_METHOD": request.method,
+        "SCRIPT_NAME": "",
+        "PATH_INFO": path,
+        "QUERY_STRING": query,
+        "SERVER_NAME": HOST,
+        "SERVER_PORT": "80",
+        "SERVER_PROTOCOL": "HTTP/1.1",
+        "REMOTE_ADDR": "127.0.0.1",
+        "HTTP_HOST": HOST,
+        "CONTENT_LENGTH": str(len(body)),
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": "http",
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": io.StringIO(),
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": False,
+        "wsgi.run_once": False,
+    }
+    for header, value in request.headers.items():
+        key = header.upper().replace("-", "_")
+        environ[key if key == "CONTENT_TYPE" else f"HTTP_{key}"] = value
+
+    started = []
+    result = application(environ, lambda status, headers, exc_info=None: started.append(status))
+    try:
+        content = b"".join(result)
+    finally:
+        if hasattr(result, "close"):
+            result.close()
+    return Response(int(started[0][:3]), content)
+
+
+async def call_asgi(application, request):
+    path, _, query = request.path.partition("?")
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": request.method,
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": query.encode(),
+        "root_path": "",
+        "headers": [(b"host", HOST.encode()), (b"content-length", str(len(request.body or b"")).encode())] + [
+            (header.lower().encode(), value.encode()) for header, value in request.headers.items()
+        ],
+        "client": ("127.0.0.1", 0),
+        "server": (HOST, 80),
+    }
+    messages = [{"type": "http.request", "body": request.body or b"", "more_body": False}]
+    disconnected = asyncio.Event()
+
+    async def receive():
+        if messages:
+            return messages.pop()
+        await disconnected.wait()
+        return {"type": "http.disconnect"}
+
+    status, chunks = [], []
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            status.append(message["status"])
+        elif message["type"] == "http.response.body":
+            chunks.append(message.get("body", b""))
+
+    try:
+        await application(scope, receive, send)
+    finally:
+        disconnected.set()
+    return Response(status[0], b"".join(chunks))
+
+
+def _step(steps, response):
+    try:
+        return steps.send(response)
+    except StopIteration:
+        return None
+
+
+def run_wsgi(application, sessions, iterations, recorder):
+    """Each virtual user gets a thread and runs its journeys back to back."""
+
+    def user_loop(session):
+        try:
+            for _ in range(iterations):
+                steps = session()
+                request = _step(steps, None)
+                while request is not None:
+                    start = time.perf_counter()
+                    response = call_wsgi(application, request)
+                    recorder.record(request.name, response.status, time.perf_counter() - start)
+                    request = _step(steps, response)
+        finally:
+            connections.close_all()
+
+    with ThreadPoolExecutor(max_workers=len(sessions)) as pool:
+        list(pool.map(user_loop, sessions))
+
+
+def run_asgi(application, sessions, iterations, recorder):
+    """Each virtual user is a task on one event loop, as under an ASGI server."""
+
+    async def user_loop(session):
+        for _ in range(iterations):
+            steps = session()
+            request = _step(steps, None)
+            while request is not None:
+                start = time.perf_counter()
+                response = await call_asgi(application, request)
+                recorder.record(request.name, response.status, time.perf_counter() - start)
+                request = _step(steps, response)
+
+    async def main():
+        await asyncio.gather(*(user_loop(session) for session in sessions))
+
+    asyncio.run(main())
+
+
+def drain_webhook_queue(batch_size=50):
+    processed = 0
+    while claimed := process_batch("loadtest", batch_size):
+        processed += claimed
+    return processed
+
@@ -0,0 +1,52 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core.cache import bump_catalog_version
+from core.menu_changes import record_menu_changes
+from core.models import MenuItem
+
+
+class Command(BaseCommand):
+    help = (
+        "Build the stored HTTPS URL and resized variants for every menu item image. Migrating builds them once; "
+        "run this after changing MENU_IMAGE_VARIANTS or the Cloudinary account, or if Cloudinary wasn't set up then."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument("--dry-run", action="store_true", help="Report what would change without saving")
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        checked = updated = 0
+        batch = []
+        items = (
+            MenuItem.objects.exclude(image__isnull=True).exclude(image="")
+            .only("id", "image", "image_url", "image_variants")
+            .order_by("id")
+        )
+
+        for item in items.iterator(chunk_size=batch_size):
+            checked += 1
+            stored = item.image_url, item.image_variants
+            item.refresh_image_urls()
+            if (item.image_url, item.image_variants) == stored:
+                continue
+            batch.append(item)
+            if len(batch) >= batch_size:
+                updated += self.save(batch, options["dry_run"])
+                batch = []
+        updated += self.save(batch, options["dry_run"])
+
+        if updated and not options["dry_run"]:
+            # bulk_update skips the post_save signal that normally invalidates the menu cache
+            bump_catalog_version()
+        verb = "Would update" if options["dry_run"] else "Updated"
+        self.stdout.write(self.style.SUCCESS(f"{verb} {updated} of {checked} menu items with images"))
+
+    def save(self, batch, dry_run):
+        if batch and not dry_run:
+            with transaction.atomic():
+                MenuItem.objects.bulk_update(batch, ["image_url", "image_variants"])
+                record_menu_changes(item.id for item in batch)
+        return len(batch)
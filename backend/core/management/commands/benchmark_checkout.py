@@ -0,0 +1,89 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.test.utils import override_settings
+
+from core import loadtest
+from core.models import CartItem
+
+PATH = "/api/create-multi-checkout-session/"
+
+
+class Command(BaseCommand):
+    help = (
+        "Fire concurrent checkouts at a Stripe fake with injected latency, first through a fixed pool of "
+        "WSGI worker threads, then through a single ASGI event loop, and compare throughput and latency."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--checkouts", type=int, default=200, help="Checkouts per run, one user each")
+        parser.add_argument("--wsgi-workers", type=int, default=8, help="Threads standing in for sync workers")
+        parser.add_argument("--stripe-latency", type=float, default=0.25, help="Seconds the Stripe fake waits per call")
+
+    def handle(self, *args, **options):
+        overrides = override_settings(ALLOWED_HOSTS=[loadtest.HOST], DEBUG=False, STRIPE_PRICE_SYNC_ON_SAVE=False)
+        with loadtest.scratch_cache(), loadtest.temporary_database(), loadtest.stub_cloudinary(), \
+                loadtest.fake_stripe(options["stripe_latency"]) as fake, overrides:
+            menu_ids, accounts = loadtest.seed(20, options["checkouts"], reviews_per_item=0)
+            CartItem.objects.bulk_create(
+                CartItem(user=user, menu_item_id=menu_ids[n % len(menu_ids)], quantity=1)
+                for n, (user, token) in enumerate(accounts)
+            )
+            requests = [
+                loadtest.Request("checkout", "POST", PATH, b"", {"Authorization": f"Bearer {token}"})
+                for user, token in accounts
+            ]
+
+            from cloudbite.asgi import application as asgi_application
+            from cloudbite.wsgi import application as wsgi_application
+
+            runs = {}
+            for label, run in (
+                (f"WSGI, {options['wsgi_workers']} workers", lambda recorder: self.run_wsgi(wsgi_application, requests, options["wsgi_workers"], recorder)),
+                ("ASGI, 1 event loop", lambda recorder: self.run_asgi(asgi_application, requests, recorder)),
+            ):
+                recorder = loadtest.Recorder()
+                start = time.perf_counter()
+                run(recorder)
+                runs[label] = recorder.report(time.perf_counter() - start)["total"]
+
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f"\n{options['checkouts']} checkouts, {options['stripe_latency'] * 1000:.0f}ms Stripe latency, "
+            f"{len(fake.requests)} Stripe calls"
+        ))
+        self.stdout.write(f"{'':<24}{'err':>5}{'rps':>9}{'p50':>9}{'p95':>9}{'p99':>9}")
+        for label, stats in runs.items():
+            self.stdout.write(
+                f"{label:<24}{stats['errors']:>5}{stats['rps']:>9}{stats['p50_ms']:>9}{stats['p95_ms']:>9}{stats['p99_ms']:>9}"
+            )
+        wsgi, asgi = runs.values()
+        self.stdout.write(self.style.SUCCESS(f"ASGI throughput is {asgi['rps'] / wsgi['rps']:.1f}x WSGI"))
+
+    # Every checkout arrives at once, so latency includes the wait for a free worker
+    def run_wsgi(self, application, requests, workers, recorder):
+        arrived = time.perf_counter()
+
+        def call(request):
+            try:
+                response = loadtest.call_wsgi(application, request)
+                recorder.record(request.name, response.status, time.perf_counter() - arrived)
+            finally:
+                connections.close_all()
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(call, requests))
+
+    def run_asgi(self, application, requests, recorder):
+        arrived = time.perf_counter()
+
+        async def call(request):
+            response = await loadtest.call_asgi(application, request)
+            recorder.record(request.name, response.status, time.perf_counter() - arrived)
+
+        async def main():
+            await asyncio.gather(*(call(request) for request in requests))
+
+        asyncio.run(main())
@@ -0,0 +1,81 @@
+import time
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+from django.utils.text import compress_string
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from core import loadtest, renderers
+from core.cache import bump_catalog_version
+from core.models import Order, OrderItem
+from core.views import MenuItemViewSet, OrderViewSet
+
+
+class Command(BaseCommand):
+    help = (
+        "Render full /api/menu-items/ and /api/orders/ pages with DRF's JSONRenderer, the orjson renderer and "
+        "MessagePack, and report render time, size and gzipped size"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--menu-items", type=int, default=1000)
+        parser.add_argument("--items-per-order", type=int, default=5)
+        parser.add_argument("--iterations", type=int, default=200, help="Renders per case; the best of 3 runs is reported")
+
+    def handle(self, *args, **options):
+        page_size = settings.API_MAX_PAGE_SIZE
+        with loadtest.temporary_database(), loadtest.stub_cloudinary(), override_settings(ALLOWED_HOSTS=[loadtest.HOST]):
+            menu_ids, [(user, _)] = loadtest.seed(options["menu_items"], 1, reviews_per_item=0)
+            orders = Order.objects.bulk_create(
+                Order(user=user, total_price=Decimal("42.50"), is_paid=True) for _ in range(page_size)
+            )
+            OrderItem.objects.bulk_create(
+                OrderItem(order=order, menu_item_id=menu_ids[(order.id * 7 + n) % len(menu_ids)], quantity=n + 1,
+                          price_at_order=Decimal("8.50"))
+                for order in orders
+                for n in range(options["items_per_order"])
+            )
+            bump_catalog_version()
+            pages = {
+                "/api/menu-items/": self.page_data(MenuItemViewSet, user, page_size),
+                "/api/orders/": self.page_data(OrderViewSet, user, page_size),
+            }
+
+        cases = [("DRF JSONRenderer", JSONRenderer()), ("orjson", renderers.ORJSONRenderer())]
+        if renderers.msgpack is not None:
+            cases.append(("MessagePack", renderers.MessagePackRenderer()))
+        for path, data in pages.items():
+            self.stdout.write(self.style.MIGRATE_HEADING(f"\n{path}?page_size={page_size}"))
+            self.stdout.write(f"  {'':<18}{'render':>10}{'bytes':>10}{'gzipped':>10}{'gzip':>10}")
+            results = {label: self.measure(renderer, data, options["iterations"]) for label, renderer in cases}
+            for label, (seconds, content, gzipped, gzip_seconds) in results.items():
+                self.stdout.write(
+                    f"  {label:<18}{seconds * 1e6:>8.0f}us{len(content):>10}{len(gzipped):>10}{gzip_seconds * 1e6:>8.0f}us"
+                )
+            baseline, fast = results["DRF JSONRenderer"], results["orjson"]
+            self.stdout.write(f"  orjson renders {baseline[0] / fast[0]:.1f}x faster")
+            if baseline[1] == fast[1]:
+                self.stdout.write(self.style.SUCCESS("  JSON output is byte-identical"))
+            else:
+                self.stdout.write(self.style.ERROR("  JSON output differs"))
+
+    def page_data(self, viewset, user, page_size):
+        request = APIRequestFactory().get("/", {"page_size": page_size, "format": "json"}, HTTP_HOST=loadtest.HOST)
+        force_authenticate(request, user)
+        response = viewset.as_view({"get": "list"})(request)
+        assert response.status_code == 200, response.status_code
+        return response.data
+
+    def measure(self, renderer, data, iterations):
+        best = float("inf")
+        for _ in range(3):
+            start = time.perf_counter()
+            for _ in range(iterations):
+                content = renderer.render(data)
+            best = min(best, (time.perf_counter() - start) / iterations)
+        start = time.perf_counter()
+        gzipped = compress_string(content)
+        return best, content, gzipped, time.perf_counter() - start
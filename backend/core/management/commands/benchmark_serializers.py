@@ -0,0 +1,101 @@
+import random
+import time
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+
+from core import loadtest
+from core.fast_serializers import menu_item_rows, order_rows
+from core.models import MenuItem, Order, OrderItem
+from core.serializers import MenuItemSerializer, OrderSerializer
+
+
+class Command(BaseCommand):
+    help = "Compare the ModelSerializers with the .values() row serializers on a scratch database"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=10000, help="Menu items and orders to serialize")
+        parser.add_argument("--items-per-order", type=int, default=3)
+        parser.add_argument("--repeat", type=int, default=3, help="Runs per case; the best is reported")
+
+    def handle(self, *args, **options):
+        with loadtest.temporary_database(), loadtest.stub_cloudinary():
+            self.seed(options["rows"], options["items_per_order"])
+            # Orders are only ever served a page at a time, and SQLite caps the size of IN (...) lists
+            page_size = settings.API_MAX_PAGE_SIZE
+            ids = list(Order.objects.order_by("id").values_list("id", flat=True))
+            pages = [Order.objects.filter(id__in=ids[i:i + page_size]).order_by("id") for i in range(0, len(ids), page_size)]
+            cases = [
+                (
+                    "menu items",
+                    lambda: MenuItemSerializer(MenuItem.objects.order_by("id"), many=True).data,
+                    lambda: menu_item_rows.serialize(MenuItem.objects.order_by("id").values(*menu_item_rows.columns)),
+                ),
+                (
+                    f"orders, in pages of {page_size}",
+                    lambda: [
+                        row
+                        for page in pages
+                        for row in OrderSerializer(
+                            page.select_related("user").prefetch_related("order_items__menu_item"), many=True
+                        ).data
+                    ],
+                    lambda: [row for page in pages for row in order_rows.serialize(page.values(*order_rows.columns))],
+                ),
+            ]
+            for name, model_path, row_path in cases:
+                self.compare(name, model_path, row_path, options["repeat"])
+
+    def seed(self, rows, items_per_order):
+        rng = random.Random(0)
+        user = User.objects.create(username="bench", password="!")
+        items = [
+            MenuItem(
+                title=f"Dish {i}",
+                description="Seasonal vegetables, house sauce and rice",
+                price=Decimal(rng.randrange(400, 2500)) / 100,
+                image=f"image/upload/v1712/menu/dish_{i}.jpg",
+                review_count=i % 40,
+                rating_average=round(rng.uniform(1, 5), 2),
+            )
+            for i in range(rows)
+        ]
+        for item in items:
+            item.refresh_image_urls()
+        items = MenuItem.objects.bulk_create(items, batch_size=5000)
+        orders = Order.objects.bulk_create(Order(user=user, total_price=Decimal("30.00"), is_paid=True) for _ in range(rows))
+        OrderItem.objects.bulk_create(
+            (
+                OrderItem(order=order, menu_item=rng.choice(items), quantity=1, price_at_order=Decimal("10.00"))
+                for order in orders
+                for _ in range(items_per_order)
+            ),
+            batch_size=5000,
+        )
+
+    def compare(self, name, model_path, row_path, repeat):
+        renderer = JSONRenderer()
+        timings = {}
+        for label, build in (("ModelSerializer", model_path), ("row serializer", row_path)):
+            best_build = best_render = float("inf")
+            for _ in range(repeat):
+                start = time.perf_counter()
+                data = build()
+                built = time.perf_counter()
+                content = renderer.render(data)
+                best_build = min(best_build, built - start)
+                best_render = min(best_render, time.perf_counter() - built)
+            timings[label] = (best_build, best_render, content)
+
+        (model_build, model_render, model_content), (row_build, row_render, row_content) = timings.values()
+        self.stdout.write(self.style.MIGRATE_HEADING(f"\n{name} ({len(model_content) / 1e6:.1f} MB of JSON)"))
+        for label, (build, render, _) in timings.items():
+            self.stdout.write(f"  {label:<16} fetch+serialize {build * 1000:8.1f}ms   render {render * 1000:7.1f}ms")
+        self.stdout.write(f"  speedup {model_build / row_build:.1f}x on fetch+serialize")
+        if model_content == row_content:
+            self.stdout.write(self.style.SUCCESS("  output is byte-identical"))
+        else:
+            self.stdout.write(self.style.ERROR("  output differs"))
@@ -0,0 +1,43 @@
+from statistics import median
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core import startup
+
+
+class Command(BaseCommand):
+    help = (
+        "Time `import cloudbite.wsgi` and `manage.py check` in fresh interpreters under -X importtime, "
+        "list the slowest packages to import, and fail if startup is over budget or loads a lazy SDK"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--runs", type=int, default=5, help="Runs per target; the best is held to the budget")
+        parser.add_argument("--top", type=int, default=10, help="How many packages to list per target")
+        parser.add_argument(
+            "--budget-factor", type=float, default=1.0, help="Scale the budgets in core/startup.py for slow machines"
+        )
+
+    def handle(self, *args, **options):
+        failures = []
+        for target, budget_ms in startup.BUDGETS_MS.items():
+            runs = [startup.measure(target) for _ in range(options["runs"])]
+            best = min(run.seconds for run in runs) * 1000
+            budget_ms *= options["budget_factor"]
+
+            self.stdout.write(self.style.MIGRATE_HEADING(f"\n{target}"))
+            self.stdout.write(
+                f"  best {best:.0f}ms, median {median(run.seconds for run in runs) * 1000:.0f}ms, budget {budget_ms:.0f}ms"
+            )
+            for package, seconds in startup.by_package(runs[0].modules)[:options["top"]]:
+                self.stdout.write(f"  {package:<32}{seconds * 1000:>8.1f}ms")
+
+            if best > budget_ms:
+                failures.append(f"{target} took {best:.0f}ms, budget {budget_ms:.0f}ms")
+            loaded = [name for name in startup.LAZY_MODULES if name in runs[0].modules]
+            if loaded:
+                failures.append(f"{target} imports {', '.join(loaded)}; set it up on first use instead")
+
+        if failures:
+            raise CommandError("Startup regressed:\n" + "\n".join(failures))
+        self.stdout.write(self.style.SUCCESS("\nStartup is within budget"))
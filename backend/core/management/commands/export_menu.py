@@ -0,0 +1,44 @@
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.menu_io import detect_format, export_rows, write_rows
+
+PROGRESS_EVERY = 10000
+
+
+class Command(BaseCommand):
+    help = "Stream every menu item to a CSV or NDJSON file that import_menu can read back"
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Output file (.csv, .ndjson or .jsonl), or - for stdout")
+        parser.add_argument("--format", choices=["csv", "ndjson"], help="Override the format implied by the suffix")
+        parser.add_argument("--chunk-size", type=int, default=2000, help="Rows fetched per database round trip")
+
+    def handle(self, *args, **options):
+        to_stdout = options["path"] == "-"
+        if to_stdout and not options["format"]:
+            raise CommandError("Pass --format when writing to stdout")
+        try:
+            fmt = detect_format(options["path"], options["format"])
+        except ValueError as exc:
+            raise CommandError(exc)
+
+        start = time.perf_counter()
+        count = 0
+        stream = self.stdout if to_stdout else Path(options["path"]).open("w", newline="", encoding="utf-8")
+        try:
+            # Progress goes to stderr so it never mixes with rows written to stdout
+            for count in write_rows(stream, fmt, export_rows(options["chunk_size"])):
+                if count % PROGRESS_EVERY == 0:
+                    elapsed = time.perf_counter() - start
+                    self.stderr.write(f"{count} rows in {elapsed:.1f}s ({count / elapsed:.0f} rows/s)")
+        finally:
+            if not to_stdout:
+                stream.close()
+
+        elapsed = time.perf_counter() - start
+        self.stderr.write(self.style.SUCCESS(
+            f"Exported {count} menu items in {elapsed:.1f}s ({count / max(elapsed, 1e-9):.0f} rows/s)"
+        ))
@@ -0,0 +1,45 @@
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.order_export import FORMATS, export_chunks, order_filters
+
+
+class Command(BaseCommand):
+    help = (
+        "Stream every order and its items to CSV (one line per item) or NDJSON (one order per line), "
+        "the same export staff get from /api/orders/export/"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Output file, or - for stdout")
+        parser.add_argument("--format", choices=list(FORMATS), default="csv")
+        parser.add_argument("--since", help="First day or moment to include (ISO date or datetime)")
+        parser.add_argument("--until", help="Last day to include, or the moment to stop before")
+        parser.add_argument("--status", help="Only orders with this status")
+        parser.add_argument("--chunk-size", type=int, default=2000, help="Rows fetched per database round trip")
+
+    def handle(self, *args, **options):
+        try:
+            filters = order_filters(options["since"], options["until"], options["status"])
+        except ValueError as exc:
+            raise CommandError(exc)
+
+        to_stdout = options["path"] == "-"
+        start = time.perf_counter()
+        written = 0
+        stream = self.stdout if to_stdout else Path(options["path"]).open("w", newline="", encoding="utf-8")
+        try:
+            # OutputWrapper.write would add a newline after every chunk
+            write = (lambda chunk: stream.write(chunk, ending="")) if to_stdout else stream.write
+            for chunk in export_chunks(options["format"], filters, options["chunk_size"]):
+                write(chunk)
+                written += len(chunk)
+        finally:
+            if not to_stdout:
+                stream.close()
+
+        elapsed = time.perf_counter() - start
+        # stderr, so the summary never ends up in an export written to stdout
+        self.stderr.write(self.style.SUCCESS(f"Exported {written / 1024:.0f} KiB of orders in {elapsed:.1f}s"))
@@ -0,0 +1,67 @@
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.menu_io import detect_format, import_menu, read_rows
+
+# Invalid rows printed in full; the rest are only counted
+MAX_REPORTED_ERRORS = 50
+
+
+class Command(BaseCommand):
+    help = (
+        "Create and update menu items from a CSV or NDJSON file, streamed in batches. "
+        "Rows with an id update that item, rows without one create a new item."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="File to import (.csv, .ndjson or .jsonl)")
+        parser.add_argument("--format", choices=["csv", "ndjson"], help="Override the format implied by the suffix")
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument("--upload-workers", type=int, default=8, help="Threads uploading images to Cloudinary")
+        parser.add_argument(
+            "--image-root", help="Directory local image paths are relative to (default: the file's directory)"
+        )
+        parser.add_argument("--dry-run", action="store_true", help="Validate every row without uploading or saving")
+
+    def handle(self, *args, **options):
+        path = Path(options["path"])
+        try:
+            fmt = detect_format(path, options["format"])
+        except ValueError as exc:
+            raise CommandError(exc)
+        image_root = options["image_root"] or path.parent
+
+        rows = created = updated = uploaded = failed = 0
+        start = time.perf_counter()
+        with path.open(newline="", encoding="utf-8") as stream:
+            batches = import_menu(
+                read_rows(stream, fmt),
+                batch_size=options["batch_size"],
+                upload_workers=options["upload_workers"],
+                dry_run=options["dry_run"],
+                image_root=image_root,
+            )
+            for batch in batches:
+                rows += batch.rows
+                created += batch.created
+                updated += batch.updated
+                uploaded += batch.uploaded
+                for line, message in batch.errors:
+                    failed += 1
+                    if failed <= MAX_REPORTED_ERRORS:
+                        self.stderr.write(f"Line {line}: {message}")
+                elapsed = max(time.perf_counter() - start, 1e-9)
+                self.stdout.write(f"{rows} rows in {elapsed:.1f}s ({rows / elapsed:.0f} rows/s)")
+
+        if failed > MAX_REPORTED_ERRORS:
+            self.stderr.write(f"... and {failed - MAX_REPORTED_ERRORS} more invalid rows")
+        if options["dry_run"]:
+            summary = f"Would create {created} and update {updated} menu items, uploading {uploaded} images"
+        else:
+            summary = f"Created {created} and updated {updated} menu items, uploaded {uploaded} images"
+        self.stdout.write(self.style.SUCCESS(f"{summary} ({failed} rows skipped)"))
+        if (created or updated) and not options["dry_run"]:
+            # Bulk writes don't fire the save hook that keeps Stripe prices in step
+            self.stdout.write("Run `python manage.py sync_stripe_prices` to create or update their Stripe prices")
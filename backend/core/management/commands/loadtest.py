@@ -0,0 +1,118 @@
+import json
+import platform
+import random
+import subprocess
+import time
+from functools import partial
+
+import django
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from core import loadtest
+from core.cache import get_cache
+from core.models import Order
+
+SERVERS = ("wsgi", "asgi")
+
+
+class Command(BaseCommand):
+    help = (
+        "Load-test the WSGI and/or ASGI app in-process on a scratch database and cache, with a local "
+        "Stripe fake and stubbed Cloudinary. Reports p50/p95/p99 latency and RPS per endpoint."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--server", choices=SERVERS + ("both",), default="both")
+        parser.add_argument("--users", type=int, default=8, help="Concurrent virtual users")
+        parser.add_argument("--iterations", type=int, default=5, help="Journeys per virtual user")
+        parser.add_argument("--menu-items", type=int, default=500, help="Menu items to seed")
+        parser.add_argument("--stripe-latency", type=float, default=0.05, help="Seconds the Stripe fake waits per call")
+        parser.add_argument("--seed", type=int, default=1, help="Random seed for data and journeys")
+        parser.add_argument("--output", help="Write the results as JSON to this file")
+
+    def handle(self, *args, **options):
+        servers = SERVERS if options["server"] == "both" else (options["server"],)
+        results = {
+            "started_at": timezone.now().isoformat(),
+            "commit": self.git_commit(),
+            "python": platform.python_version(),
+            "django": django.get_version(),
+            "config": {key: options[key] for key in ("users", "iterations", "menu_items", "stripe_latency", "seed")},
+            "runs": {},
+        }
+
+        for server in servers:
+            # Every server starts from identical data so the runs are comparable
+            with loadtest.scratch_cache(), loadtest.temporary_database() as db, loadtest.stub_cloudinary(), \
+                    loadtest.fake_stripe(options["stripe_latency"]) as fake:
+                results["database"] = db.vendor
+                results["runs"][server] = self.run(server, fake, options)
+            self.print_run(server, results["runs"][server])
+
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                json.dump(results, f, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Results written to {options['output']}"))
+
+    def run(self, server, fake, options):
+        rng = random.Random(options["seed"])
+        menu_ids, accounts = loadtest.seed(options["menu_items"], options["users"], rng=rng)
+        sessions = [
+            partial(loadtest.journey, token, menu_ids, random.Random(options["seed"] + n), fake)
+            for n, (user, token) in enumerate(accounts)
+        ]
+        get_cache().clear()
+
+        overrides = override_settings(
+            ALLOWED_HOSTS=[loadtest.HOST],
+            DEBUG=False,
+            STRIPE_WEBHOOK_SECRET=loadtest.WEBHOOK_SECRET,
+            STRIPE_PRICE_SYNC_ON_SAVE=False,
+        )
+        with overrides:
+            if server == "wsgi":
+                from cloudbite.wsgi import application
+                runner = loadtest.run_wsgi
+            else:
+                from cloudbite.asgi import application
+                runner = loadtest.run_asgi
+
+            recorder = loadtest.Recorder()
+            start = time.perf_counter()
+            runner(application, sessions, options["iterations"], recorder)
+            report = recorder.report(time.perf_counter() - start)
+
+            # The webhook only queues events; build the orders the way the worker would
+            start = time.perf_counter()
+            report["webhook_worker"] = {
+                "events": loadtest.drain_webhook_queue(),
+                "orders": Order.objects.count(),
+                "duration_s": round(time.perf_counter() - start, 3),
+            }
+        report["stripe_calls"] = len(fake.requests)
+        return report
+
+    def print_run(self, server, report):
+        total = report["total"]
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f"\n{server.upper()}: {total['requests']} requests in {report['duration_s']}s, "
+            f"{total['rps']} req/s, {total['errors']} errors"
+        ))
+        self.stdout.write(f"{'endpoint':<46}{'n':>6}{'err':>5}{'rps':>9}{'p50':>9}{'p95':>9}{'p99':>9}")
+        for name, stats in report["endpoints"].items():
+            self.stdout.write(
+                f"{name:<46}{stats['requests']:>6}{stats['errors']:>5}{stats['rps']:>9}"
+                f"{stats['p50_ms']:>9}{stats['p95_ms']:>9}{stats['p99_ms']:>9}"
+            )
+        worker = report["webhook_worker"]
+        self.stdout.write(f"Worker processed {worker['events']} events into {worker['orders']} orders in {worker['duration_s']}s")
+
+    def git_commit(self):
+        try:
+            return subprocess.run(
+                ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
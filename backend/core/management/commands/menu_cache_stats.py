@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from core.cache import bump_catalog_version, get_stats, reset_stats
+
+
+class Command(BaseCommand):
+    help = "Show hit/miss counters for the menu catalog cache"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--reset", action="store_true", help="Reset the hit/miss counters")
+        parser.add_argument("--clear", action="store_true", help="Invalidate every cached catalog response")
+
+    def handle(self, *args, **options):
+        stats = get_stats()
+        self.stdout.write(
+            f"version={stats['version']} hits={stats['hits']} "
+            f"misses={stats['misses']} hit_ratio={stats['hit_ratio']:.2%}"
+        )
+        if options["reset"]:
+            reset_stats()
+            self.stdout.write("Counters reset")
+        if options["clear"]:
+            bump_catalog_version()
+            self.stdout.write("Catalog cache invalidated")
@@ -0,0 +1,44 @@
+import os
+import signal
+import socket
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from core.webhooks import process_batch
+
+
+class Command(BaseCommand):
+    help = "Process queued Stripe webhook events. Several workers can run in parallel."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=20, help="Events claimed per round trip")
+        parser.add_argument("--idle-sleep", type=float, default=1.0, help="Seconds to wait when the queue is empty")
+        parser.add_argument("--once", action="store_true", help="Drain the queue once and exit")
+        parser.add_argument("--worker-id", default=f"{socket.gethostname()}:{os.getpid()}")
+
+    def handle(self, *args, **options):
+        self.running = True
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+        worker_id = options["worker_id"]
+        self.stdout.write(f"Worker {worker_id} started")
+        processed = 0
+
+        while self.running:
+            close_old_connections()
+            claimed = process_batch(worker_id, options["batch_size"])
+            processed += claimed
+            if claimed:
+                continue
+            if options["once"]:
+                break
+            time.sleep(options["idle_sleep"])
+
+        self.stdout.write(f"Worker {worker_id} stopped after {processed} events")
+
+    def stop(self, signum, frame):
+        # Finish the current batch, then exit
+        self.running = False
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from rest_framework_simplejwt.token_blacklist.models import OutstandingToken
+
+from core.models import RevokedToken
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete expired outstanding/blacklisted refresh tokens and revoked access tokens, "
+        "a batch at a time so the tables are never locked for long. Run it daily from cron."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument("--dry-run", action="store_true", help="Count the expired rows without deleting them")
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        # Blacklist entries cascade with their outstanding token
+        for label, expired in (
+            ("outstanding refresh tokens", OutstandingToken.objects.filter(expires_at__lte=now)),
+            ("revoked access tokens", RevokedToken.objects.filter(expires_at__lte=now)),
+        ):
+            if options["dry_run"]:
+                self.stdout.write(f"Would delete {expired.count()} expired {label}")
+                continue
+            deleted = 0
+            while True:
+                ids = list(expired.order_by("pk").values_list("pk", flat=True)[:options["batch_size"]])
+                if not ids:
+                    break
+                expired.model.objects.filter(pk__in=ids).delete()
+                deleted += len(ids)
+            self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} expired {label}"))
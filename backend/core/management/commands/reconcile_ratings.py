@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from core.cache import bump_catalog_version
+from core.ratings import find_drift, repair_drift
+
+
+class Command(BaseCommand):
+    help = "Recompute MenuItem review aggregates from the reviews table and repair drift"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument("--dry-run", action="store_true", help="Report drift without fixing it")
+
+    def handle(self, *args, **options):
+        repaired = 0
+        for batch in find_drift(options["batch_size"]):
+            if not options["dry_run"]:
+                # Reviews may have been written since the batch was read
+                batch = repair_drift([menu_item.id for menu_item in batch])
+            for menu_item in batch:
+                self.stdout.write(
+                    f"{menu_item.id}: count={menu_item.review_count} sum={menu_item.rating_sum} "
+                    f"average={menu_item.rating_average}"
+                )
+            repaired += len(batch)
+
+        # Menu list pages show ratings too, so drop every cached response
+        if repaired and not options["dry_run"]:
+            bump_catalog_version()
+        verb = "Found" if options["dry_run"] else "Repaired"
+        self.stdout.write(self.style.SUCCESS(f"{verb} {repaired} menu items with drifted ratings"))
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from core.models import MenuItem
+from core.stripe_catalog import is_current, get_mapping, sync_menu_item
+
+
+class Command(BaseCommand):
+    help = "Create or update the Stripe Product/Price for every menu item"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--force", action="store_true", help="Re-sync items whose mapping looks current")
+
+    def handle(self, *args, **options):
+        synced = skipped = 0
+        for menu_item in MenuItem.objects.select_related("stripe_price").order_by("id").iterator(chunk_size=500):
+            mapping = get_mapping(menu_item)
+            if not options["force"] and is_current(mapping, menu_item) and mapping.product_name == menu_item.title:
+                skipped += 1
+                continue
+            mapping = sync_menu_item(menu_item, force=options["force"])
+            synced += 1
+            self.stdout.write(f"{menu_item.title}: {mapping.price_id}")
+
+        self.stdout.write(self.style.SUCCESS(f"Synced {synced} menu items, {skipped} already current"))
@@ -0,0 +1,93 @@
+"""
+Incremental menu sync.
+
+Every write to a menu item (saves and deletes, review aggregates, bulk
+imports and repairs) calls record_menu_changes(), which replaces the items'
+MenuChange rows. Row ids only grow, so the highest one a client has seen is
+its menu version: changes_since(version) returns what changed after it,
+including the ids of deleted items, instead of the whole menu.
+
+Ids are handed out on insert but only become visible on commit, so two
+writers committing out of order could let a client skip past the first.
+SQLite writers are serialized, so there the id is the version. On
+PostgreSQL each row carries the id of the transaction that wrote it and
+the version is that txid instead: readers only return rows written by
+transactions older than the oldest one still running, so a change never
+turns up behind a version a client already has, and writers never wait on
+each other unless they touch the same items.
+"""
+from django.conf import settings
+from django.db import connection, connections, transaction
+
+from .models import MenuChange, MenuItem
+
+CHANGES_PAGE_SIZE = getattr(settings, "MENU_CHANGES_PAGE_SIZE", 500)
+
+
+def record_menu_changes(menu_item_ids, deleted=False):
+    menu_item_ids = sorted(set(menu_item_ids))
+    if not menu_item_ids:
+        return
+    # No savepoint of its own: if logging fails, the write it belongs to must fail too
+    with transaction.atomic(savepoint=False):
+        if connection.vendor == "postgresql":
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT pg_current_xact_id()::text::bigint")
+                (txid,) = cursor.fetchone()
+            # An upsert, so concurrent writers to the same item take turns on its row instead of colliding
+            MenuChange.objects.bulk_create(
+                [MenuChange(menu_item_id=pk, deleted=deleted, txid=txid) for pk in menu_item_ids],
+                update_conflicts=True, unique_fields=["menu_item_id"], update_fields=["deleted", "txid", "changed_at"],
+            )
+            return
+        MenuChange.objects.filter(menu_item_id__in=menu_item_ids).delete()
+        MenuChange.objects.bulk_create(MenuChange(menu_item_id=pk, deleted=deleted) for pk in menu_item_ids)
+
+
+def finished_before():
+    """The oldest transaction still running on the reading database; every older one has committed or rolled back."""
+    with connections[MenuChange.objects.db].cursor() as cursor:
+        cursor.execute("SELECT pg_snapshot_xmin(pg_current_snapshot())::text::bigint")
+        return cursor.fetchone()[0]
+
+
+def changes_since(version, limit=CHANGES_PAGE_SIZE):
+    """
+    Returns (new version, changed items queryset, deleted ids, has more) for
+    at most ``limit`` changes after ``version``, oldest first. A client that
+    applies them and asks again with the new version misses nothing.
+    """
+    if connections[MenuChange.objects.db].vendor == "postgresql":
+        # Read before the rows, so every transaction below it is visible to the query that follows
+        watermark = finished_before()
+        return page_changes(MenuChange.objects.filter(txid__lt=watermark), "txid", version, limit, watermark - 1)
+    return page_changes(MenuChange.objects.all(), "id", version, limit)
+
+
+def page_changes(changes, field, version, limit, caught_up=None):
+    """
+    The changes after ``version`` in ``field`` order. Rows sharing a value
+    (one transaction's writes) always land on the same page, so the page may
+    run over ``limit`` rather than split them. ``caught_up`` is the version
+    to hand out once there is nothing more to read.
+    """
+    rows = list(
+        changes.filter(**{f"{field}__gt": version}).order_by(field, "id")
+        .values_list(field, "menu_item_id", "deleted")[:limit + 1]
+    )
+    has_more = len(rows) > limit
+    if has_more:
+        following = rows[limit][0]
+        rows = [row for row in rows if row[0] != following] or list(
+            changes.filter(**{field: following}).order_by("id").values_list(field, "menu_item_id", "deleted")
+        )
+    if rows:
+        version = rows[-1][0]
+    if not has_more and caught_up is not None:
+        version = max(version, caught_up)
+    if not rows:
+        return version, MenuItem.objects.none(), [], has_more
+
+    changed = [menu_item_id for _, menu_item_id, deleted in rows if not deleted]
+    deleted = [menu_item_id for _, menu_item_id, deleted in rows if deleted]
+    return version, MenuItem.objects.filter(id__in=changed).order_by("id"), deleted, has_more
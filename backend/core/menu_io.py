@@ -0,0 +1,229 @@
+"""
+Bulk menu import and export in CSV or NDJSON (one JSON object per line).
+
+Both sides stream: export reads the table with .iterator() and import works
+through the file one batch at a time, so memory stays flat whatever the
+menu size. Each import batch is validated against the MenuItem fields, has
+its images uploaded by a bounded thread pool, and is written with
+bulk_create/bulk_update in a single transaction.
+
+Columns are id, title, description, price and image. Rows with an id update
+that menu item; rows without one create a new item. The image column takes
+a stored Cloudinary reference (what export writes), an http(s) URL or a
+local file path; URLs and files are uploaded to Cloudinary. A blank image
+on an update row leaves the item's image as it is.
+"""
+import csv
+import json
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from pathlib import Path
+
+from cloudinary import uploader
+from django.core.exceptions import ValidationError
+from django.db import connection, transaction
+from django.db.models import Max
+
+from .cache import bump_catalog_version
+from .integrations import get_cloudinary
+from .menu_changes import record_menu_changes
+from .models import MenuItem
+
+FIELDS = ("id", "title", "description", "price", "image")
+FORMATS = {".csv": "csv", ".ndjson": "ndjson", ".jsonl": "ndjson"}
+# bulk_create/bulk_update bypass save(), so the stored image URLs are refreshed by hand
+UPDATE_FIELDS = ["title", "description", "price", "image", "image_url", "image_variants"]
+TEXT_FIELDS = ["title", "description", "price"]
+
+BatchResult = namedtuple("BatchResult", "rows created updated uploaded errors")
+
+
+def detect_format(path, fmt=None):
+    if fmt:
+        return fmt
+    try:
+        return FORMATS[Path(path).suffix.lower()]
+    except KeyError:
+        raise ValueError(f"Can't tell the format of {path}; pass --format csv or --format ndjson")
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def read_rows(stream, fmt):
+    """Yields (line number, row) pairs; NDJSON rows are decoded by clean_row."""
+    if fmt == "csv":
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+    else:
+        for number, line in enumerate(stream, 1):
+            if line.strip():
+                yield number, line
+
+
+def clean_row(row):
+    if isinstance(row, str):
+        row = json.loads(row)
+        if not isinstance(row, dict):
+            raise ValueError("expected a JSON object")
+
+    values, errors = {}, []
+    menu_item_id = row.get("id")
+    try:
+        values["id"] = int(menu_item_id) if menu_item_id not in (None, "") else None
+    except (TypeError, ValueError):
+        errors.append(f"id: {menu_item_id!r} is not an integer")
+    for name in ("title", "description", "price"):
+        field = MenuItem._meta.get_field(name)
+        try:
+            values[name] = field.clean(row.get(name), None)
+        except ValidationError as exc:
+            errors.append(f"{name}: {' '.join(exc.messages)}")
+    values["image"] = str(row.get("image") or "").strip()
+
+    if errors:
+        raise ValueError("; ".join(errors))
+    return values
+
+
+def image_source(value, image_root):
+    # The upload source for a URL or local file, or None for a stored Cloudinary reference
+    if value.startswith(("http://", "https://")):
+        return value
+    path = Path(image_root or ".") / value
+    return str(path) if path.is_file() else None
+
+
+def upload_image(source):
+    get_cloudinary()
+    field = MenuItem._meta.get_field("image")
+    return uploader.upload_resource(source, type=field.type, resource_type=field.resource_type)
+
+
+def fill_created_ids(items, after_id):
+    """
+    Sets the ids of freshly bulk-created items on backends whose bulk INSERT
+    doesn't return them (MySQL), matching the rows inserted after
+    ``after_id`` by title, description and price, in insertion order.
+    """
+    rows = MenuItem.objects.filter(id__gt=after_id, title__in={item.title for item in items}).order_by("id")
+    ids = {}
+    for menu_item_id, *key in rows.values_list("id", *TEXT_FIELDS):
+        ids.setdefault(tuple(key), []).append(menu_item_id)
+    for item in items:
+        item.id = ids[(item.title, item.description, item.price)].pop(0)
+
+
+def import_menu(rows, batch_size=500, upload_workers=8, dry_run=False, image_root=None):
+    """
+    Imports (line number, row) pairs from read_rows() one batch at a time,
+    yielding a BatchResult after each. Invalid rows are reported in
+    ``errors`` as (line number, message) and skipped. With ``dry_run``,
+    rows are validated but nothing is uploaded or written.
+    """
+    image_field = MenuItem._meta.get_field("image")
+    written = False
+    with ThreadPoolExecutor(max_workers=upload_workers, thread_name_prefix="menu-image") as pool:
+        for batch in chunked(rows, batch_size):
+            errors, cleaned = [], []
+            for line, row in batch:
+                try:
+                    cleaned.append((line, clean_row(row)))
+                except ValueError as exc:
+                    errors.append((line, str(exc)))
+
+            ids = {values["id"] for _, values in cleaned if values["id"] is not None}
+            existing = set(MenuItem.objects.filter(id__in=ids).values_list("id", flat=True)) if ids else set()
+
+            sources = {}
+            valid = []
+            for line, values in cleaned:
+                if values["id"] is not None and values["id"] not in existing:
+                    errors.append((line, f"id: menu item {values['id']} does not exist; leave id empty to create it"))
+                    continue
+                source = image_source(values["image"], image_root) if values["image"] else None
+                if source is not None:
+                    sources[line] = source
+                valid.append((line, values))
+
+            # Uploads are network-bound, so they run side by side on the pool
+            images = {}
+            if sources and not dry_run:
+                futures = {line: pool.submit(upload_image, source) for line, source in sources.items()}
+                for line, future in futures.items():
+                    try:
+                        images[line] = future.result()
+                    except Exception as exc:
+                        errors.append((line, f"image: upload of {sources[line]} failed: {exc}"))
+
+            creates, updates, text_updates = [], [], []
+            for line, values in valid:
+                if line in sources and line not in images and not dry_run:
+                    continue  # the upload failed
+                menu_item_id, image = values.pop("id"), values.pop("image")
+                item = MenuItem(id=menu_item_id, **values)
+                if menu_item_id is not None and not image:
+                    text_updates.append(item)
+                    continue
+                if line in sources:
+                    item.image = images.get(line)
+                else:
+                    item.image = image_field.to_python(image) if image else None
+                item.refresh_image_urls()
+                (updates if menu_item_id is not None else creates).append(item)
+
+            if not dry_run and (creates or updates or text_updates):
+                with transaction.atomic():
+                    if creates and not connection.features.can_return_rows_from_bulk_insert:
+                        last_id = MenuItem.objects.aggregate(last_id=Max("id"))["last_id"] or 0
+                        MenuItem.objects.bulk_create(creates)
+                        fill_created_ids(creates, last_id)
+                    else:
+                        MenuItem.objects.bulk_create(creates)
+                    MenuItem.objects.bulk_update(updates, UPDATE_FIELDS)
+                    MenuItem.objects.bulk_update(text_updates, TEXT_FIELDS)
+                    record_menu_changes(item.id for item in creates + updates + text_updates)
+                written = True
+
+            errors.sort()
+            yield BatchResult(
+                len(batch), len(creates), len(updates) + len(text_updates),
+                len(sources) if dry_run else len(images), errors,
+            )
+
+    if written:
+        # Bulk writes skip the post_save signal that normally invalidates the menu cache
+        bump_catalog_version()
+
+
+def export_rows(chunk_size=2000):
+    image_field = MenuItem._meta.get_field("image")
+    rows = MenuItem.objects.order_by("id").values_list(*FIELDS)
+    for menu_item_id, title, description, price, image in rows.iterator(chunk_size=chunk_size):
+        yield {
+            "id": menu_item_id,
+            "title": title,
+            "description": description,
+            "price": str(price),
+            "image": image_field.get_prep_value(image) or "",
+        }
+
+
+def write_rows(stream, fmt, rows):
+    """Writes rows to ``stream`` as they come, yielding the running count."""
+    if fmt == "csv":
+        writer = csv.DictWriter(stream, fieldnames=FIELDS)
+        writer.writeheader()
+        write = writer.writerow
+    else:
+        def write(row):
+            stream.write(json.dumps(row, ensure_ascii=False) + "\n")
+
+    for count, row in enumerate(rows, 1):
+        write(row)
+        yield count
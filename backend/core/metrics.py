@@ -0,0 +1,163 @@
+import functools
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+import cloudinary.uploader
+from django.db import connections
+from django.db.backends.signals import connection_created
+from prometheus_client import CollectorRegistry, Histogram, generate_latest, multiprocess
+from rest_framework import serializers
+
+# Per-request timings, set by core.middleware.InstrumentationMiddleware
+current_timings = ContextVar("current_timings", default=None)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+class RequestTimings:
+    __slots__ = ("sql_count", "sql_seconds", "spans", "queries")
+
+    def __init__(self, capture_queries=False):
+        self.sql_count = 0
+        self.sql_seconds = 0.0
+        self.spans = {}
+        # Only filled for sampled requests, so it can be logged if the request is slow
+        self.queries = [] if capture_queries else None
+
+    def add_span(self, name, seconds):
+        self.spans[name] = self.spans.get(name, 0.0) + seconds
+
+    def sql_wrapper(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.sql_count += 1
+            self.sql_seconds += elapsed
+            if self.queries is not None:
+                self.queries.append((elapsed, sql))
+
+
+def sql_wrapper(execute, sql, params, many, context):
+    # Installed on every connection; the contextvar follows requests into sync_to_async threads
+    timings = current_timings.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    return timings.sql_wrapper(execute, sql, params, many, context)
+
+
+def install_sql_wrapper(sender, connection, **kwargs):
+    if sql_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(sql_wrapper)
+
+
+@contextmanager
+def span(name):
+    """Adds the time spent in the block to the current request's ``name`` span."""
+    timings = current_timings.get()
+    if timings is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add_span(name, time.perf_counter() - start)
+
+
+REGISTRY = CollectorRegistry()
+REQUEST_DURATION = Histogram(
+    "cloudbite_http_request_duration_seconds", "Time to produce a response.", ("view", "method", "status"),
+    buckets=LATENCY_BUCKETS, registry=REGISTRY,
+)
+DB_QUERIES = Histogram(
+    "cloudbite_db_queries_per_request", "SQL queries run per request.", ("view",),
+    buckets=QUERY_COUNT_BUCKETS, registry=REGISTRY,
+)
+DB_DURATION = Histogram(
+    "cloudbite_db_duration_seconds", "Time spent in SQL per request.", ("view",),
+    buckets=LATENCY_BUCKETS, registry=REGISTRY,
+)
+SPAN_DURATION = Histogram(
+    "cloudbite_span_duration_seconds", "Time per request spent serializing, rendering and calling Stripe or Cloudinary.",
+    ("view", "span"), buckets=LATENCY_BUCKETS, registry=REGISTRY,
+)
+HISTOGRAMS = (REQUEST_DURATION, DB_QUERIES, DB_DURATION, SPAN_DURATION)
+
+
+def expose():
+    """
+    The metrics in Prometheus text format. With PROMETHEUS_MULTIPROC_DIR set
+    (see settings), every worker writes its samples there and this sums all
+    of them, so any worker can answer the scrape.
+    """
+    if "PROMETHEUS_MULTIPROC_DIR" not in os.environ:
+        return generate_latest(REGISTRY)
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return generate_latest(registry)
+
+
+def clear():
+    for histogram in HISTOGRAMS:
+        histogram.clear()
+
+
+def timed(name):
+    """Decorator adding each call's time to the current request's ``name`` span."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+class TimedListSerializer(serializers.ListSerializer):
+    @property
+    def data(self):
+        with span("serialize"):
+            return super().data
+
+
+class TimedSerializerMixin:
+    """
+    Times the outermost ``.data`` as the request's serialize span. Nested
+    serializers go through to_representation, so they aren't counted twice.
+    Serializers listed with many=True also set
+    ``Meta.list_serializer_class = TimedListSerializer``.
+    """
+
+    @property
+    def data(self):
+        with span("serialize"):
+            return super().data
+
+
+_instrumented = False
+
+
+def instrument_libraries():
+    """
+    Hooks the SQL counters into every database connection, and a span into
+    Cloudinary's uploader. Called once from CoreConfig.ready(). Serializing
+    and rendering are timed by our serializers and renderers, and Stripe's
+    client gets its span when the SDK is set up (see core.integrations).
+    """
+    global _instrumented
+    if _instrumented:
+        return
+    _instrumented = True
+
+    for connection in connections.all(initialized_only=True):
+        install_sql_wrapper(None, connection)
+    connection_created.connect(install_sql_wrapper)
+
+    cloudinary.uploader.call_api = timed("cloudinary")(cloudinary.uploader.call_api)
@@ -0,0 +1,130 @@
+import logging
+import random
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.middleware.gzip import GZipMiddleware
+from whitenoise.middleware import WhiteNoiseMiddleware
+
+from .metrics import DB_DURATION, DB_QUERIES, REQUEST_DURATION, SPAN_DURATION, RequestTimings, current_timings
+
+logger = logging.getLogger("core.performance")
+
+
+class InstrumentationMiddleware:
+    """
+    Times each request: SQL query count and duration, plus the serialize,
+    render, stripe and cloudinary spans (see core.metrics). Results go into
+    the Prometheus histograms and, for non-streaming responses, a
+    Server-Timing header. A sampled share of requests also keeps its query
+    list, which is logged if the request turns out slower than
+    SLOW_REQUEST_MS. Runs natively under both WSGI and ASGI.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.slow_seconds = settings.SLOW_REQUEST_MS / 1000
+        self.sample_rate = settings.SLOW_REQUEST_QUERY_SAMPLE_RATE
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        timings, token, start = self.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            current_timings.reset(token)
+        return self.finish(request, response, timings, start)
+
+    async def __acall__(self, request):
+        timings, token, start = self.start()
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_timings.reset(token)
+        return self.finish(request, response, timings, start)
+
+    def start(self):
+        timings = RequestTimings(capture_queries=self.sample_rate > 0 and random.random() < self.sample_rate)
+        return timings, current_timings.set(timings), time.perf_counter()
+
+    def finish(self, request, response, timings, start):
+        elapsed = time.perf_counter() - start
+
+        match = request.resolver_match
+        view = match.view_name if match else "unmatched"
+        REQUEST_DURATION.labels(view, request.method, str(response.status_code)).observe(elapsed)
+        DB_QUERIES.labels(view).observe(timings.sql_count)
+        DB_DURATION.labels(view).observe(timings.sql_seconds)
+        for name, seconds in timings.spans.items():
+            SPAN_DURATION.labels(view, name).observe(seconds)
+
+        # A streaming body is produced after this returns, so its timings would be partial
+        if not response.streaming:
+            response["Server-Timing"] = self.server_timing(elapsed, timings)
+
+        if timings.queries is not None and elapsed >= self.slow_seconds:
+            self.log_slow_request(request, view, elapsed, timings)
+        return response
+
+    def server_timing(self, elapsed, timings):
+        metrics = [f"app;dur={elapsed * 1000:.1f}", f'db;dur={timings.sql_seconds * 1000:.1f};desc="{timings.sql_count} queries"']
+        metrics += [f"{name};dur={seconds * 1000:.1f}" for name, seconds in timings.spans.items()]
+        return ", ".join(metrics)
+
+    def log_slow_request(self, request, view, elapsed, timings):
+        slowest = sorted(timings.queries, key=lambda query: query[0], reverse=True)[:20]
+        logger.warning(
+            "Slow request %s %s (%s) took %.0fms with %d queries in %.0fms. Slowest queries:\n%s",
+            request.method, request.path, view, elapsed * 1000, timings.sql_count, timings.sql_seconds * 1000,
+            "\n".join(f"{seconds * 1000:.1f}ms {sql}" for seconds, sql in slowest),
+        )
+
+
+class StaticFilesMiddleware(WhiteNoiseMiddleware):
+    """
+    WhiteNoise, made async-capable so ASGI requests stay on the event loop:
+    WhiteNoise itself is sync-only, which makes Django run the whole stack
+    in a thread. Static files are still served from a thread.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response=None, *args, **kwargs):
+        super().__init__(get_response, *args, **kwargs)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        if self.autorefresh:
+            static_file = await sync_to_async(self.find_file)(request.path_info)
+        else:
+            static_file = self.files.get(request.path_info)
+        if static_file is not None:
+            return await sync_to_async(self.serve)(static_file, request)
+        return await self.get_response(request)
+
+
+class CompressionMiddleware(GZipMiddleware):
+    """
+    GZipMiddleware for bodies of at least GZIP_MIN_LENGTH bytes (menu and
+    order pages, exports); small JSON replies aren't worth the CPU.
+    Streaming responses are always compressed, as they go out.
+    """
+
+    def process_response(self, request, response):
+        if not response.streaming and len(response.content) < settings.GZIP_MIN_LENGTH:
+            return response
+        return super().process_response(request, response)
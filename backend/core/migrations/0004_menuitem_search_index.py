@@ -0,0 +1,60 @@
+from django.db import OperationalError, migrations
+
+POSTGRES_INDEX = (
+    "CREATE INDEX IF NOT EXISTS core_menuitem_search_idx ON core_menuitem USING GIN ("
+    "(setweight(to_tsvector('simple', coalesce(title, '')), 'A') || "
+    "setweight(to_tsvector('simple', coalesce(description, '')), 'B')))"
+)
+
+# Kept here rather than imported from core.search, so migrating from scratch
+# doesn't depend on today's app code; core.search reinstalls the triggers after
+# later migrations that rebuild the table
+SQLITE_FTS = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS core_menuitem_fts USING fts5("
+    "title, description, content='core_menuitem', content_rowid='id', "
+    "tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+    "CREATE TRIGGER IF NOT EXISTS core_menuitem_fts_ai AFTER INSERT ON core_menuitem BEGIN "
+    "INSERT INTO core_menuitem_fts(rowid, title, description) VALUES (new.id, new.title, new.description); END",
+    "CREATE TRIGGER IF NOT EXISTS core_menuitem_fts_ad AFTER DELETE ON core_menuitem BEGIN "
+    "INSERT INTO core_menuitem_fts(core_menuitem_fts, rowid, title, description) "
+    "VALUES ('delete', old.id, old.title, old.description); END",
+    "CREATE TRIGGER IF NOT EXISTS core_menuitem_fts_au AFTER UPDATE OF title, description ON core_menuitem BEGIN "
+    "INSERT INTO core_menuitem_fts(core_menuitem_fts, rowid, title, description) "
+    "VALUES ('delete', old.id, old.title, old.description); "
+    "INSERT INTO core_menuitem_fts(rowid, title, description) VALUES (new.id, new.title, new.description); END",
+    "INSERT INTO core_menuitem_fts(core_menuitem_fts) VALUES ('rebuild')",
+]
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == "postgresql":
+        schema_editor.execute(POSTGRES_INDEX)
+    elif vendor == "sqlite":
+        try:
+            for statement in SQLITE_FTS:
+                schema_editor.execute(statement)
+        except OperationalError:
+            # SQLite built without FTS5: searches use the inverted index
+            pass
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == "postgresql":
+        schema_editor.execute("DROP INDEX IF EXISTS core_menuitem_search_idx")
+    elif vendor == "sqlite":
+        for trigger in ("ai", "ad", "au"):
+            schema_editor.execute(f"DROP TRIGGER IF EXISTS core_menuitem_fts_{trigger}")
+        schema_editor.execute("DROP TABLE IF EXISTS core_menuitem_fts")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_order_status_alter_menuitem_image'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.1 on 2026-10-18 10:15
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def merge_duplicate_cart_items(apps, schema_editor):
+    # Fold duplicate (user, menu_item) rows into the oldest one before adding the constraint
+    CartItem = apps.get_model('core', 'CartItem')
+    duplicates = (
+        CartItem.objects.values('user', 'menu_item')
+        .annotate(rows=models.Count('id'), total=models.Sum('quantity'), keep=models.Min('id'))
+        .filter(rows__gt=1)
+    )
+    for duplicate in duplicates:
+        CartItem.objects.filter(pk=duplicate['keep']).update(quantity=duplicate['total'])
+        CartItem.objects.filter(user=duplicate['user'], menu_item=duplicate['menu_item']).exclude(
+            pk=duplicate['keep']
+        ).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_stripeevent_queue'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_cart_items, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='cartitem',
+            constraint=models.UniqueConstraint(fields=('user', 'menu_item'), name='unique_cart_item'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.1 on 2026-10-18 10:17
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_cartitem_unique'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StripePrice',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('product_id', models.CharField(max_length=255)),
+                ('price_id', models.CharField(max_length=255)),
+                ('product_name', models.CharField(max_length=100)),
+                ('unit_amount', models.PositiveIntegerField()),
+                ('currency', models.CharField(default='usd', max_length=3)),
+                ('synced_at', models.DateTimeField(auto_now=True)),
+                ('menu_item', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='stripe_price', to='core.menuitem')),
+            ],
+        ),
+    ]
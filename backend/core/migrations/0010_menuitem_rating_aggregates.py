@@ -0,0 +1,45 @@
+# Generated by Django 5.2.1 on 2026-10-18 10:18
+
+from django.db import migrations, models
+
+
+def backfill_rating_aggregates(apps, schema_editor):
+    MenuItem = apps.get_model('core', 'MenuItem')
+    Review = apps.get_model('core', 'Review')
+    aggregates = Review.objects.values('menu_item').annotate(count=models.Count('id'), total=models.Sum('rating'))
+    for row in aggregates:
+        MenuItem.objects.filter(pk=row['menu_item']).update(
+            review_count=row['count'],
+            rating_sum=row['total'],
+            rating_average=round(row['total'] / row['count'], 2),
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_stripeprice'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='menuitem',
+            name='rating_average',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='menuitem',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='menuitem',
+            name='review_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='menuitem',
+            index=models.Index(fields=['-rating_average', '-review_count'], name='menuitem_top_rated_idx'),
+        ),
+        migrations.RunPython(backfill_rating_aggregates, migrations.RunPython.noop),
+    ]
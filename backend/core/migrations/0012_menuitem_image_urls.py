@@ -0,0 +1,62 @@
+# Generated by Django 5.2.1 on 2026-10-18 10:35
+
+from django.conf import settings
+from django.db import migrations, models
+
+BATCH_SIZE = 500
+
+
+def backfill_image_urls(apps, schema_editor):
+    # What MenuItem.refresh_image_urls() stores, inlined so later changes to core can't break migrating
+    import cloudinary
+
+    MenuItem = apps.get_model('core', 'MenuItem')
+    items = MenuItem.objects.using(schema_editor.connection.alias).exclude(image__isnull=True).exclude(image='')
+    if settings.CLOUDINARY_CLOUD_NAME:
+        cloudinary.config(
+            cloud_name=settings.CLOUDINARY_CLOUD_NAME,
+            api_key=settings.CLOUDINARY_API_KEY,
+            api_secret=settings.CLOUDINARY_API_SECRET,
+        )
+    if not cloudinary.config().cloud_name:
+        # URLs can't be built without an account; backfill_image_urls fills them in once it is set
+        return
+
+    widths = getattr(settings, 'MENU_IMAGE_VARIANTS', {'thumbnail': 160, 'card': 480, 'hero': 1200})
+    field, batch = MenuItem._meta.get_field('image'), []
+    for item in items.only('id', 'image').order_by('id').iterator(chunk_size=BATCH_SIZE):
+        resource = field.to_python(item.image)
+        item.image_url = resource.build_url(secure=True)
+        item.image_variants = {
+            name: {
+                'url': resource.build_url(secure=True, width=width, crop='limit', quality='auto', fetch_format='auto'),
+                'width': width,
+            }
+            for name, width in widths.items()
+        }
+        batch.append(item)
+        if len(batch) >= BATCH_SIZE:
+            MenuItem.objects.using(schema_editor.connection.alias).bulk_update(batch, ['image_url', 'image_variants'])
+            batch = []
+    MenuItem.objects.using(schema_editor.connection.alias).bulk_update(batch, ['image_url', 'image_variants'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_review_item_created_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='menuitem',
+            name='image_url',
+            field=models.URLField(blank=True, editable=False, max_length=500, null=True),
+        ),
+        migrations.AddField(
+            model_name='menuitem',
+            name='image_variants',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.RunPython(backfill_image_urls, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.1 on 2026-10-18 11:05
+
+from django.db import migrations, models
+
+
+def log_existing_items(apps, schema_editor):
+    # Every current item gets a version, so syncing from version 0 returns the whole menu
+    MenuItem = apps.get_model('core', 'MenuItem')
+    MenuChange = apps.get_model('core', 'MenuChange')
+    ids = MenuItem.objects.order_by('id').values_list('id', flat=True)
+    MenuChange.objects.bulk_create((MenuChange(menu_item_id=pk) for pk in ids.iterator(chunk_size=2000)), batch_size=2000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0016_order_export_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MenuChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('menu_item_id', models.PositiveBigIntegerField(unique=True)),
+                ('deleted', models.BooleanField(default=False)),
+                ('changed_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunPython(log_existing_items, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.1 on 2026-10-18 11:35
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0017_menuchange'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='menuitem',
+            name='menuitem_created_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='order',
+            name='order_user_ordered_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='review',
+            name='review_created_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='review',
+            name='review_item_created_idx',
+        ),
+        migrations.AddIndex(
+            model_name='menuitem',
+            index=models.Index(fields=['-created_at', '-id'], name='menuitem_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['user', '-ordered_at', '-id'], name='order_user_ordered_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['-created_at', '-id'], name='review_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['menu_item', '-created_at', '-id'], name='review_item_created_idx'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.1 on 2026-10-18 12:11
+
+from django.db import migrations, models
+
+
+def date_existing_changes(apps, schema_editor):
+    # PostgreSQL's own transaction ids start at 3, so these sort after version 0 and before every new change
+    apps.get_model('core', 'MenuChange').objects.update(txid=1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0018_pagination_tiebreak'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='menuchange',
+            name='txid',
+            field=models.BigIntegerField(db_index=True, default=0),
+        ),
+        migrations.RunPython(date_existing_changes, migrations.RunPython.noop),
+    ]
@@ -1,23 +1,97 @@
 from django.db import models
+from django.utils import timezone
 from django.contrib.auth.models import User
+from django.core.files.uploadedfile import UploadedFile
 from cloudinary.models import CloudinaryField
 
+from .images import variant_urls
+from .integrations import get_cloudinary
+
 class MenuItem(models.Model):
     title = models.CharField(max_length=100)
     description = models.TextField()
     price = models.DecimalField(max_digits=6, decimal_places=2)
     image = CloudinaryField('image', blank=True, null=True)
+    # HTTPS URL and resized variants of `image`, built on save (see core/images.py)
+    image_url = models.URLField(max_length=500, blank=True, null=True, editable=False)
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Review aggregates, maintained by ReviewViewSet (see core/ratings.py)
+    review_count = models.PositiveIntegerField(default=0)
+    rating_sum = models.PositiveIntegerField(default=0)
+    rating_average = models.FloatField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-created_at', '-id'], name='menuitem_created_idx'),
+            models.Index(fields=['-rating_average', '-review_count'], name='menuitem_top_rated_idx'),
+        ]
 
     def __str__(self):
         return self.title
 
+    def refresh_image_urls(self):
+        self.image_url, self.image_variants = variant_urls(self._meta.get_field('image').to_python(self.image or None))
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'image' not in update_fields:
+            return super().save(*args, **kwargs)
+        if update_fields is not None:
+            kwargs['update_fields'] = {*update_fields, 'image_url', 'image_variants'}
+
+        uploading = isinstance(self.image, UploadedFile)
+        if uploading:
+            get_cloudinary()
+        else:
+            self.refresh_image_urls()
+        super().save(*args, **kwargs)
+        if uploading:
+            # The file only becomes a Cloudinary resource while saving
+            self.refresh_image_urls()
+            MenuItem.objects.filter(pk=self.pk).update(image_url=self.image_url, image_variants=self.image_variants)
+
+
+class StripePrice(models.Model):
+    menu_item = models.OneToOneField(MenuItem, on_delete=models.CASCADE, related_name='stripe_price')
+    product_id = models.CharField(max_length=255)
+    price_id = models.CharField(max_length=255)
+    product_name = models.CharField(max_length=100)
+    unit_amount = models.PositiveIntegerField()  # cents
+    currency = models.CharField(max_length=3, default='usd')
+    synced_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.menu_item.title} -> {self.price_id}"
+
+
+class MenuChange(models.Model):
+    """
+    The latest change to each menu item, for incremental menu sync. Every
+    change replaces the item's row, so ``id`` keeps increasing and serves as
+    the menu version; deleted items keep theirs as a tombstone. Not a foreign
+    key, since tombstones outlive the item. See core/menu_changes.py.
+    """
+    menu_item_id = models.PositiveBigIntegerField(unique=True)
+    deleted = models.BooleanField(default=False)
+    changed_at = models.DateTimeField(auto_now=True)
+    # The writing transaction's id, which is the menu version on PostgreSQL
+    txid = models.BigIntegerField(default=0, db_index=True)
+
+    def __str__(self):
+        return f"{self.menu_item_id} {'deleted' if self.deleted else 'changed'} at version {self.id}"
+
 
 class CartItem(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     menu_item = models.ForeignKey(MenuItem, on_delete=models.CASCADE)
     quantity = models.PositiveIntegerField(default=1)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'menu_item'], name='unique_cart_item'),
+        ]
+
     def __str__(self):
         return f"{self.menu_item.title} x {self.quantity}"
 
@@ -33,6 +107,15 @@ class Order(models.Model):
     is_paid = models.BooleanField(default=False)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='success')  # NEW
     ordered_at = models.DateTimeField(auto_now_add=True)
+    stripe_session_id = models.CharField(max_length=255, unique=True, null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', '-ordered_at', '-id'], name='order_user_ordered_idx'),
+            # Accounting exports filter on a date range, optionally within one status
+            models.Index(fields=['ordered_at'], name='order_ordered_idx'),
+            models.Index(fields=['status', 'ordered_at'], name='order_status_ordered_idx'),
+        ]
 
     def __str__(self):
         return f"Order #{self.id} by {self.user.username} - {self.status}"
@@ -48,6 +131,27 @@ class OrderItem(models.Model):
         return f"{self.menu_item.title} x {self.quantity} (Order #{self.order.id})"
 
 
+class CheckoutSession(models.Model):
+    # Cart snapshot recorded when the Stripe Checkout Session is created; fulfilment turns it into an Order
+    stripe_session_id = models.CharField(max_length=255, unique=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    total_amount = models.PositiveIntegerField()  # cents
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Checkout {self.stripe_session_id} by {self.user_id}"
+
+
+class CheckoutSessionItem(models.Model):
+    checkout = models.ForeignKey(CheckoutSession, on_delete=models.CASCADE, related_name='items')
+    menu_item = models.ForeignKey(MenuItem, on_delete=models.SET_NULL, null=True)
+    quantity = models.PositiveIntegerField()
+    unit_amount = models.PositiveIntegerField()  # cents
+
+    def __str__(self):
+        return f"{self.menu_item_id} x {self.quantity} at {self.unit_amount}"
+
+
 class Review(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     menu_item = models.ForeignKey(MenuItem, on_delete=models.CASCADE, related_name='reviews')
@@ -55,5 +159,82 @@ class Review(models.Model):
     comment = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['-created_at', '-id'], name='review_created_idx'),
+            models.Index(fields=['menu_item', '-created_at', '-id'], name='review_item_created_idx'),
+        ]
+
     def __str__(self):
         return f"Review by {self.user.username} on {self.menu_item.title}"
+
+
+class StripeEvent(models.Model):
+    PENDING = 'pending'
+    PROCESSING = 'processing'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (PROCESSING, 'Processing'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    event_id = models.CharField(max_length=255, unique=True)
+    type = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    available_at = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=255, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'available_at'], name='stripeevent_queue_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.type} ({self.event_id}) - {self.status}"
+
+
+class RevokedToken(models.Model):
+    # Access tokens revoked before they expire, by jti or per deactivated user; checked in memory (see core/authentication.py)
+    jti = models.CharField(max_length=255, unique=True)
+    expires_at = models.DateTimeField()
+    revoked_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['expires_at'], name='revokedtoken_expires_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.jti} (until {self.expires_at})"
+
+
+class ClaimsUser(User):
+    """
+    The request.user of ClaimsJWTAuthentication: only the fields carried in
+    the token are set. Touching any other field loads all of them at once,
+    through the per-process user cache (see core/authentication.py).
+    """
+
+    class Meta:
+        proxy = True
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        deferred = self.get_deferred_fields()
+        if fields and deferred and set(fields) <= deferred:
+            from .authentication import load_user_fields
+
+            values = load_user_fields(self.pk)
+            if values is not None:
+                for attname in deferred:
+                    setattr(self, attname, values[attname])
+                return
+        super().refresh_from_db(using=using, fields=fields, from_queryset=from_queryset)
@@ -0,0 +1,158 @@
+"""
+Order history export for accounting, as CSV (one line per order item) or
+NDJSON (one order per line, items nested).
+
+Orders and their items are read in a single LEFT JOIN ordered by
+(ordered_at, id) and walked with .iterator(), which uses a server-side
+cursor where the database supports one, so memory stays flat however many
+orders match. Output is produced chunk by chunk as rows arrive, for
+StreamingHttpResponse or a file. Under ASGI the response needs an async
+iterator (a sync one is read to the end and buffered first), which
+aexport_chunks() provides.
+"""
+import csv
+import json
+from datetime import datetime, time, timedelta
+from itertools import groupby
+
+from asgiref.sync import sync_to_async
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .models import Order
+
+ORDER_COLUMNS = ("id", "ordered_at", "user_id", "user__username", "status", "is_paid", "total_price", "stripe_session_id")
+ITEM_COLUMNS = (
+    "order_items__id",
+    "order_items__menu_item_id",
+    "order_items__menu_item__title",
+    "order_items__quantity",
+    "order_items__price_at_order",
+)
+CSV_HEADER = (
+    "order_id", "ordered_at", "user_id", "username", "status", "is_paid", "total_price", "stripe_session_id",
+    "item_id", "menu_item_id", "menu_item_title", "quantity", "price_at_order",
+)
+CONTENT_TYPES = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
+# Rows are handed out in chunks of about this many characters rather than one by one
+CHUNK_CHARS = 64 * 1024
+
+
+def parse_bound(value, name, end=False):
+    """An aware datetime from an ISO date or datetime; a bare ``end`` date covers that whole day."""
+    if value in (None, ""):
+        return None
+    try:
+        # parse_datetime() would also take a bare date, as midnight
+        day = parse_date(value)
+        parsed = parse_datetime(value) if day is None else None
+    except ValueError:
+        day = parsed = None
+    if day is not None:
+        parsed = datetime.combine(day + timedelta(days=1) if end else day, time.min)
+    elif parsed is None:
+        raise ValueError(f"{name}: expected an ISO date or datetime, got {value!r}")
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def order_filters(since=None, until=None, status=None):
+    """
+    Validated filter kwargs: ``since`` is inclusive, ``until`` exclusive
+    (or the end of the day, for a date). Raises ValueError.
+    """
+    filters = {}
+    if (since := parse_bound(since, "since")) is not None:
+        filters["ordered_at__gte"] = since
+    if (until := parse_bound(until, "until", end=True)) is not None:
+        filters["ordered_at__lt"] = until
+    if status:
+        if status not in dict(Order.STATUS_CHOICES):
+            raise ValueError(f"status: must be one of {', '.join(dict(Order.STATUS_CHOICES))}")
+        filters["status"] = status
+    return filters
+
+
+def order_rows(filters, chunk_size=2000):
+    """Yields (order values, [item values]) per order, oldest first."""
+    rows = (
+        Order.objects.filter(**filters)
+        .order_by("ordered_at", "id", "order_items__id")
+        .values_list(*ORDER_COLUMNS, *ITEM_COLUMNS)
+    )
+    width = len(ORDER_COLUMNS)
+    for order, lines in groupby(rows.iterator(chunk_size=chunk_size), key=lambda row: row[:width]):
+        # Orders without items come back from the LEFT JOIN as a single all-NULL item
+        yield order, [line[width:] for line in lines if line[width] is not None]
+
+
+def _text(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value if value is None or isinstance(value, (bool, int, str)) else str(value)
+
+
+class _Echo:
+    # csv.writer only needs write(); handing the line back lets us batch it
+    def write(self, value):
+        return value
+
+
+def csv_lines(orders):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(CSV_HEADER)
+    for order, items in orders:
+        order = [_text(value) for value in order]
+        for item in items or [(None,) * len(ITEM_COLUMNS)]:
+            yield writer.writerow(order + [_text(value) for value in item])
+
+
+def ndjson_lines(orders):
+    for order, items in orders:
+        (order_id, ordered_at, user_id, username, status, is_paid, total_price, session_id) = map(_text, order)
+        yield json.dumps({
+            "id": order_id,
+            "ordered_at": ordered_at,
+            "user": {"id": user_id, "username": username},
+            "status": status,
+            "is_paid": is_paid,
+            "total_price": total_price,
+            "stripe_session_id": session_id,
+            "items": [
+                {"id": item_id, "menu_item_id": menu_item_id, "menu_item_title": title, "quantity": quantity,
+                 "price_at_order": price}
+                for item_id, menu_item_id, title, quantity, price in (map(_text, item) for item in items)
+            ],
+        }, ensure_ascii=False) + "\n"
+
+
+FORMATS = {"csv": csv_lines, "ndjson": ndjson_lines}
+
+
+def export_chunks(fmt, filters, chunk_size=2000):
+    """
+    Yields the export as text chunks. The first (the CSV header, or the first
+    order) is sent on its own so a client sees bytes before the bulk arrives.
+    """
+    buffer, size = [], 0
+    for number, line in enumerate(FORMATS[fmt](order_rows(filters, chunk_size))):
+        if number == 0:
+            yield line
+            continue
+        buffer.append(line)
+        size += len(line)
+        if size >= CHUNK_CHARS:
+            yield "".join(buffer)
+            buffer, size = [], 0
+    if buffer:
+        yield "".join(buffer)
+
+
+async def aexport_chunks(fmt, filters, chunk_size=2000):
+    """export_chunks() for ASGI, each chunk read off the event loop."""
+    chunks = export_chunks(fmt, filters, chunk_size)
+    # Thread-sensitive, so every chunk comes from the thread whose connection holds the cursor
+    next_chunk = sync_to_async(next)
+    while (chunk := await next_chunk(chunks, None)) is not None:
+        yield chunk
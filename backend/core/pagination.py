@@ -0,0 +1,93 @@
+import contextlib
+
+from django.conf import settings
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination, _positive_int, _reverse_ordering
+
+
+class CatalogCursorPagination(CursorPagination):
+    """
+    Keyset pagination: every page is an indexed range scan, however deep the
+    cursor. Timestamps can tie, so each ordering is (timestamp, -id) and the
+    cursor holds both, which makes every position unique. DRF's cursors only
+    hold the timestamp and step over ties with offsets, which skips or
+    repeats rows once the direction changes.
+    """
+
+    page_size_query_param = "page_size"
+    # None for the API_PAGE_SIZE and API_MAX_PAGE_SIZE settings, read per request so changes to them apply
+    page_size = None
+    max_page_size = None
+
+    def get_page_size(self, request):
+        page_size = settings.API_PAGE_SIZE if self.page_size is None else self.page_size
+        max_page_size = settings.API_MAX_PAGE_SIZE if self.max_page_size is None else self.max_page_size
+        with contextlib.suppress(KeyError, ValueError):
+            return _positive_int(request.query_params[self.page_size_query_param], strict=True, cutoff=max_page_size)
+        return page_size
+
+    def _get_position_from_instance(self, instance, ordering):
+        get_position = super()._get_position_from_instance
+        return "|".join(get_position(instance, [field]) for field in ordering)
+
+    def decode_cursor(self, request):
+        cursor = super().decode_cursor(request)
+        # Cursors from before the tiebreak held only the timestamp
+        if cursor is not None and cursor.position is not None and cursor.position.count("|") != 1:
+            raise NotFound(self.invalid_cursor_message)
+        return cursor
+
+    def position_filter(self, position, reverse):
+        (field, tiebreak), (value, pk) = [name.lstrip("-") for name in self.ordering], position.split("|")
+        before = self.ordering[0].startswith("-") != reverse
+        lookup = "lt" if before else "gt"
+        # The first condition is the range the index scans; the second drops the rows tied on value up to pk
+        return Q(**{f"{field}__{lookup}e": value}) & (Q(**{f"{field}__{lookup}": value}) | Q(**{f"{tiebreak}__{lookup}": pk}))
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.cursor = self.decode_cursor(request)
+        reverse = self.cursor is not None and self.cursor.reverse
+        current_position = self.cursor.position if self.cursor is not None else None
+
+        queryset = queryset.order_by(*(_reverse_ordering(self.ordering) if reverse else self.ordering))
+        if current_position is not None:
+            queryset = queryset.filter(self.position_filter(current_position, reverse))
+
+        results = list(queryset[:self.page_size + 1])
+        self.page = results[:self.page_size]
+        following_position = None
+        if len(results) > len(self.page):
+            following_position = self._get_position_from_instance(results[-1], self.ordering)
+
+        # Positions are unique, so the links never need an offset
+        if reverse:
+            self.page.reverse()
+            self.has_next, self.next_position = current_position is not None, current_position
+            self.has_previous, self.previous_position = following_position is not None, following_position
+        else:
+            self.has_next, self.next_position = following_position is not None, following_position
+            self.has_previous, self.previous_position = current_position is not None, current_position
+
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+        return self.page
+
+
+class MenuItemCursorPagination(CatalogCursorPagination):
+    ordering = ("-created_at", "-id")
+
+
+class OrderCursorPagination(CatalogCursorPagination):
+    ordering = ("-ordered_at", "-id")
+
+
+class ReviewCursorPagination(CatalogCursorPagination):
+    ordering = ("-created_at", "-id")
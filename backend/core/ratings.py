@@ -0,0 +1,92 @@
+from django.db import transaction
+from django.db.models import Count, F, FloatField, Sum
+from django.db.models.functions import Cast, Coalesce, NullIf, Round
+
+from .cache import RATINGS_SCOPE, bump_scopes, item_scope
+from .menu_changes import record_menu_changes
+from .models import MenuItem, Review
+
+
+def average_expression(rating_sum, review_count):
+    return Coalesce(Round(Cast(rating_sum, FloatField()) / NullIf(review_count, 0), 2), 0.0)
+
+
+def apply_rating_change(menu_item_id, count_delta, sum_delta):
+    """Shifts a menu item's review aggregates in a single UPDATE, safe under concurrent reviews."""
+    review_count = F('review_count') + count_delta
+    rating_sum = F('rating_sum') + sum_delta
+    MenuItem.objects.filter(pk=menu_item_id).update(
+        review_count=review_count,
+        rating_sum=rating_sum,
+        rating_average=average_expression(rating_sum, review_count),
+    )
+    record_menu_changes([menu_item_id])
+    # Only the responses that show this item's ratings, not the whole catalog
+    bump_scopes(RATINGS_SCOPE, item_scope(menu_item_id))
+
+
+def review_created(review):
+    apply_rating_change(review.menu_item_id, 1, review.rating)
+
+
+def review_updated(review, old_menu_item_id, old_rating):
+    if review.menu_item_id != old_menu_item_id:
+        apply_rating_change(old_menu_item_id, -1, -old_rating)
+        apply_rating_change(review.menu_item_id, 1, review.rating)
+    elif review.rating != old_rating:
+        apply_rating_change(review.menu_item_id, 0, review.rating - old_rating)
+
+
+def review_deleted(review):
+    apply_rating_change(review.menu_item_id, -1, -review.rating)
+
+
+AGGREGATE_FIELDS = ('review_count', 'rating_sum', 'rating_average')
+
+
+def _drifted(menu_items):
+    """The items whose stored aggregates disagree with their reviews, set to what they should hold."""
+    actual = {
+        row['menu_item']: (row['count'], row['total'])
+        for row in Review.objects.filter(menu_item__in=[menu_item.id for menu_item in menu_items])
+        .values('menu_item').annotate(count=Count('id'), total=Sum('rating'))
+    }
+    drifted = []
+    for menu_item in menu_items:
+        count, total = actual.get(menu_item.id, (0, 0))
+        average = round(total / count, 2) if count else 0.0
+        if (menu_item.review_count, menu_item.rating_sum, menu_item.rating_average) != (count, total, average):
+            menu_item.review_count, menu_item.rating_sum, menu_item.rating_average = count, total, average
+            drifted.append(menu_item)
+    return drifted
+
+
+def find_drift(batch_size=1000):
+    """Yields the drifted items batch by batch, reading batch_size menu items at a time."""
+    last_id = 0
+    while True:
+        menu_items = list(
+            MenuItem.objects.only('id', *AGGREGATE_FIELDS).filter(id__gt=last_id).order_by('id')[:batch_size]
+        )
+        if not menu_items:
+            return
+        last_id = menu_items[-1].id
+        drifted = _drifted(menu_items)
+        if drifted:
+            yield drifted
+
+
+def repair_drift(menu_item_ids):
+    """
+    Re-checks the items with their rows locked and repairs those still
+    drifted. A review written since find_drift() read them either committed
+    first and is counted, or waits for the lock and shifts the repaired values.
+    """
+    with transaction.atomic():
+        menu_items = list(
+            MenuItem.objects.select_for_update().only('id', *AGGREGATE_FIELDS).filter(id__in=menu_item_ids).order_by('id')
+        )
+        drifted = _drifted(menu_items)
+        MenuItem.objects.bulk_update(drifted, AGGREGATE_FIELDS)
+        record_menu_changes(menu_item.id for menu_item in drifted)
+    return drifted
@@ -0,0 +1,95 @@
+"""
+Primary/replica routing for the read-heavy API.
+
+Writes always go to the primary ("default"). Reads go to a replica only
+inside a ReplicaReadMixin view handling a safe request, and only when
+nothing says the replicas may be behind:
+
+- a user who just wrote (cart change, review, order from the webhook) is
+  pinned to the primary for DATABASE_REPLICA_PIN_SECONDS, so they read
+  their own writes;
+- a catalog change pins the menu views the same way, so a cache miss can't
+  store what a lagging replica still has under the new catalog version.
+
+Pins live in the DATABASE_PIN_CACHE cache, so a pin set by the Stripe
+worker holds in every web worker; settings refuse replicas unless that
+cache is file or redis. With no DATABASE_REPLICAS everything stays on the
+primary and nothing is pinned.
+"""
+import random
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.permissions import SAFE_METHODS
+
+CATALOG_PIN = "catalog"
+
+# The replica chosen for the current request, if it may read from one
+read_database = ContextVar("read_database", default=None)
+
+
+def _pin_key(name):
+    return f"db:pin:{name}"
+
+
+def user_pin(user_id):
+    return f"user:{user_id}"
+
+
+def pin_to_primary(*names):
+    if not settings.DATABASE_REPLICAS:
+        return
+    caches[settings.DATABASE_PIN_CACHE].set_many(
+        {_pin_key(name): True for name in names}, settings.DATABASE_REPLICA_PIN_SECONDS
+    )
+
+
+def pinned(*names):
+    return bool(caches[settings.DATABASE_PIN_CACHE].get_many([_pin_key(name) for name in names]))
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        return read_database.get()
+
+    def db_for_write(self, model, **hints):
+        return "default"
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the primary's data, so objects read from any of them may be related
+        databases = {"default", *settings.DATABASE_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+
+class ReplicaReadMixin:
+    """
+    Runs safe requests against a random replica unless the user, or the
+    catalog for views that set ``catalog_reads``, is pinned to the primary.
+    """
+
+    catalog_reads = False
+
+    def replica_for(self, request):
+        if not settings.DATABASE_REPLICAS or request.method not in SAFE_METHODS:
+            return None
+        pins = [user_pin(request.user.pk)] if request.user.is_authenticated else []
+        if self.catalog_reads:
+            pins.append(CATALOG_PIN)
+        if pins and pinned(*pins):
+            return None
+        return random.choice(settings.DATABASE_REPLICAS)
+
+    def initial(self, request, *args, **kwargs):
+        # Authentication and permission checks have run, so request.user is known
+        super().initial(request, *args, **kwargs)
+        read_database.set(self.replica_for(request))
+
+    def dispatch(self, request, *args, **kwargs):
+        token = read_database.set(None)
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        finally:
+            read_database.reset(token)
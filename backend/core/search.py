@@ -0,0 +1,202 @@
+import bisect
+import math
+import re
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import OperationalError, connections
+from django.db.models import BooleanField, Case, FloatField, IntegerField, Value, When
+from django.db.models.expressions import RawSQL
+from rest_framework import filters
+
+from .cache import get_catalog_version
+from .models import MenuItem
+
+TOKEN_RE = re.compile(r"\w+")
+FTS_TABLE = "core_menuitem_fts"
+TITLE_WEIGHT = 10.0
+DESCRIPTION_WEIGHT = 1.0
+
+
+def result_limit():
+    return getattr(settings, "SEARCH_RESULT_LIMIT", 200)
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(text.lower())
+
+
+def order_by_ids(queryset, ids):
+    if not ids:
+        return queryset.none()
+    ranking = Case(
+        *[When(pk=pk, then=Value(position)) for position, pk in enumerate(ids)],
+        output_field=IntegerField(),
+    )
+    return queryset.filter(pk__in=ids).order_by(ranking)
+
+
+# SQLite: FTS5 external-content table kept in sync by triggers
+class SQLiteFTSBackend:
+    def search(self, queryset, terms):
+        match = " ".join(f'"{term}"*' for term in terms)
+        with connections[queryset.db].cursor() as cursor:
+            cursor.execute(
+                f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s "
+                f"ORDER BY bm25({FTS_TABLE}, {TITLE_WEIGHT}, {DESCRIPTION_WEIGHT}) LIMIT %s",
+                [match, result_limit()],
+            )
+            ids = [row[0] for row in cursor.fetchall()]
+        return order_by_ids(queryset, ids)
+
+
+# PostgreSQL: tsvector expression matching the GIN index from migration 0004
+class PostgresSearchBackend:
+    document = (
+        "(setweight(to_tsvector('simple', coalesce(\"core_menuitem\".\"title\", '')), 'A') || "
+        "setweight(to_tsvector('simple', coalesce(\"core_menuitem\".\"description\", '')), 'B'))"
+    )
+
+    def search(self, queryset, terms):
+        query = " & ".join(f"{term}:*" for term in terms)
+        ranked = (
+            queryset.filter(
+                RawSQL(f"{self.document} @@ to_tsquery('simple', %s)", [query], output_field=BooleanField())
+            )
+            .annotate(
+                search_rank=RawSQL(
+                    f"ts_rank({self.document}, to_tsquery('simple', %s))", [query], output_field=FloatField()
+                )
+            )
+            .order_by("-search_rank", "-created_at")
+        )
+        # An unsliced queryset, like the other backends: detail routes filter it again by pk
+        return order_by_ids(queryset, list(ranked.values_list("pk", flat=True)[: result_limit()]))
+
+
+# Fallback for other databases: in-process inverted index rebuilt per catalog version
+class InvertedIndexBackend:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._terms = []
+        self._postings = {}
+
+    def _build(self, using):
+        postings = defaultdict(lambda: defaultdict(float))
+        rows = MenuItem.objects.using(using).values_list("id", "title", "description")
+        for pk, title, description in rows.iterator(chunk_size=2000):
+            for term in tokenize(title):
+                postings[term][pk] += TITLE_WEIGHT
+            for term in tokenize(description):
+                postings[term][pk] += DESCRIPTION_WEIGHT
+
+        documents = len({pk for docs in postings.values() for pk in docs}) or 1
+        self._postings = {
+            term: {pk: weight * math.log(1 + documents / len(docs)) for pk, weight in docs.items()}
+            for term, docs in postings.items()
+        }
+        self._terms = sorted(self._postings)
+
+    def _ensure_index(self, using):
+        version = (using, get_catalog_version())
+        if self._version != version:
+            with self._lock:
+                if self._version != version:
+                    self._build(using)
+                    self._version = version
+
+    def _prefix_scores(self, prefix):
+        scores = defaultdict(float)
+        start = bisect.bisect_left(self._terms, prefix)
+        for term in self._terms[start:]:
+            if not term.startswith(prefix):
+                break
+            for pk, score in self._postings[term].items():
+                scores[pk] = max(scores[pk], score)
+        return scores
+
+    def search(self, queryset, terms):
+        self._ensure_index(queryset.db)
+        totals = None
+        for term in terms:
+            scores = self._prefix_scores(term)
+            if totals is None:
+                totals = scores
+            else:
+                totals = {pk: totals[pk] + scores[pk] for pk in totals.keys() & scores.keys()}
+            if not totals:
+                break
+        ranked = sorted(totals, key=lambda pk: (-totals[pk], -pk))[: result_limit()]
+        return order_by_ids(queryset, ranked)
+
+
+sqlite_backend = SQLiteFTSBackend()
+postgres_backend = PostgresSearchBackend()
+inverted_backend = InvertedIndexBackend()
+_fts_ready = set()
+
+
+def has_fts_table(using):
+    if using not in _fts_ready:
+        if FTS_TABLE not in connections[using].introspection.table_names():
+            return False
+        _fts_ready.add(using)
+    return True
+
+
+def get_backend(using):
+    vendor = connections[using].vendor
+    if vendor == "postgresql":
+        return postgres_backend
+    if vendor == "sqlite" and has_fts_table(using):
+        return sqlite_backend
+    return inverted_backend
+
+
+SQLITE_FTS_SQL = [
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+    "title, description, content='core_menuitem', content_rowid='id', "
+    "tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON core_menuitem BEGIN "
+    f"INSERT INTO {FTS_TABLE}(rowid, title, description) VALUES (new.id, new.title, new.description); END",
+    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON core_menuitem BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, description) "
+    "VALUES ('delete', old.id, old.title, old.description); END",
+    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF title, description ON core_menuitem BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, description) "
+    "VALUES ('delete', old.id, old.title, old.description); "
+    f"INSERT INTO {FTS_TABLE}(rowid, title, description) VALUES (new.id, new.title, new.description); END",
+]
+SQLITE_FTS_TRIGGERS = {f"{FTS_TABLE}_ai", f"{FTS_TABLE}_ad", f"{FTS_TABLE}_au"}
+
+
+def install_sqlite_fts(using):
+    """
+    Creates the FTS5 table and its triggers if any are missing. SQLite drops
+    triggers whenever a migration rebuilds core_menuitem, so this runs after
+    every migrate and rebuilds the index when it had to recreate them.
+    """
+    connection = connections[using]
+    if connection.vendor != "sqlite":
+        return
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'core_menuitem'")
+        if SQLITE_FTS_TRIGGERS <= {row[0] for row in cursor.fetchall()}:
+            return
+        try:
+            for statement in SQLITE_FTS_SQL:
+                cursor.execute(statement)
+        except OperationalError:
+            # SQLite built without FTS5: searches use the inverted index
+            return
+        cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+
+
+class MenuItemSearchFilter(filters.SearchFilter):
+    def filter_queryset(self, request, queryset, view):
+        terms = tokenize(" ".join(self.get_search_terms(request)))
+        if not terms:
+            return queryset
+        return get_backend(queryset.db).search(queryset, terms)
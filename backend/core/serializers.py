@@ -2,28 +2,36 @@ from rest_framework import serializers
 from .models import MenuItem, CartItem, Order, Review, OrderItem
 from django.contrib.auth.models import User
 
+from .images import srcset
+from .metrics import TimedListSerializer, TimedSerializerMixin
 
-class UserSerializer(serializers.ModelSerializer):
+
+class UserSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ["id", "username"]
 
 
-class MenuItemSerializer(serializers.ModelSerializer):
-    image = serializers.SerializerMethodField()
+class MenuItemSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    # URLs are built once when the item is saved (see MenuItem.refresh_image_urls)
+    image = serializers.URLField(source="image_url", read_only=True)
+    image_srcset = serializers.SerializerMethodField()
 
     class Meta:
         model = MenuItem
-        fields = ["id", "title", "description", "price", "image"]
+        list_serializer_class = TimedListSerializer
+        fields = [
+            "id", "title", "description", "price", "image", "image_variants", "image_srcset",
+            "review_count", "rating_average",
+        ]
+        read_only_fields = ["image_variants", "review_count", "rating_average"]
 
-    def get_image(self, obj):
-        if obj.image:
-            return obj.image.url.replace("http://", "https://")
-        return None
+    def get_image_srcset(self, obj):
+        return srcset(obj.image_variants) or None
 
 
 
-class CartItemSerializer(serializers.ModelSerializer):
+class CartItemSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     menu_item = MenuItemSerializer(read_only=True)
     menu_item_id = serializers.PrimaryKeyRelatedField(
         queryset=MenuItem.objects.all(), write_only=True, source="menu_item"
@@ -31,14 +39,17 @@ class CartItemSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = CartItem
+        list_serializer_class = TimedListSerializer
         fields = ["id", "menu_item", "menu_item_id", "quantity"]
+        extra_kwargs = {"quantity": {"min_value": 1}}
 
 
-class ReviewSerializer(serializers.ModelSerializer):
+class ReviewSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     user = UserSerializer(read_only=True)
 
     class Meta:
         model = Review
+        list_serializer_class = TimedListSerializer
         fields = "__all__"
 
     def create(self, validated_data):
@@ -46,7 +57,7 @@ class ReviewSerializer(serializers.ModelSerializer):
         return super().create(validated_data)
 
 
-class OrderItemSerializer(serializers.ModelSerializer):
+class OrderItemSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     menu_item = MenuItemSerializer(read_only=True)
 
     class Meta:
@@ -54,12 +65,13 @@ class OrderItemSerializer(serializers.ModelSerializer):
         fields = ["id", "menu_item", "quantity", "price_at_order"]
 
 
-class OrderSerializer(serializers.ModelSerializer):
+class OrderSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     user = UserSerializer(read_only=True)
     order_items = OrderItemSerializer(many=True, read_only=True)
 
     class Meta:
         model = Order
+        list_serializer_class = TimedListSerializer
         fields = [
             "id",
             "user",
@@ -72,7 +84,7 @@ class OrderSerializer(serializers.ModelSerializer):
         read_only_fields = fields  # Make all fields read-only
 
 
-class RegisterSerializer(serializers.ModelSerializer):
+class RegisterSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     password = serializers.CharField(write_only=True)
 
     class Meta:
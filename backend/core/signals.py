@@ -0,0 +1,73 @@
+from functools import partial
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models.signals import post_delete, post_migrate, post_save
+from django.dispatch import receiver
+
+from .authentication import forget_user, remember_user, revoke_user_tokens
+from .cache import bump_catalog_version
+from .menu_changes import record_menu_changes
+from .models import CartItem, MenuItem, Order, Review
+from .routers import pin_to_primary, user_pin
+from .search import install_sqlite_fts
+from .stripe_catalog import sync_menu_item_by_id
+
+
+# Any MenuItem change (API, admin or shell) invalidates cached catalog responses
+@receiver(post_save, sender=MenuItem)
+@receiver(post_delete, sender=MenuItem)
+def invalidate_menu_cache(sender, **kwargs):
+    bump_catalog_version()
+
+
+# Log the change for incremental sync; a delete leaves a tombstone
+@receiver(post_save, sender=MenuItem)
+def log_menu_change(sender, instance, **kwargs):
+    record_menu_changes([instance.pk])
+
+
+@receiver(post_delete, sender=MenuItem)
+def log_menu_deletion(sender, instance, **kwargs):
+    record_menu_changes([instance.pk], deleted=True)
+
+
+# Keep the Stripe Price mapping in step with the menu price
+@receiver(post_save, sender=MenuItem)
+def sync_stripe_price(sender, instance, raw=False, **kwargs):
+    if raw or not settings.STRIPE_SECRET_KEY or not settings.STRIPE_PRICE_SYNC_ON_SAVE:
+        return
+    transaction.on_commit(partial(sync_menu_item_by_id, instance.pk))
+
+
+# The writer reads from the primary until the replicas have their change. Deletes pin
+# in the views instead: a post_delete receiver would stop cascades deleting in bulk.
+@receiver(post_save, sender=CartItem)
+@receiver(post_save, sender=Order)
+@receiver(post_save, sender=Review)
+def pin_writer_to_primary(sender, instance, **kwargs):
+    pin_to_primary(user_pin(instance.user_id))
+
+
+# Keep the auth user cache in step. Deactivating or deleting also revokes the user's access tokens,
+# which other processes refuse from their next revocation sync (REVOKED_TOKENS_SYNC_SECONDS)
+@receiver(post_save, sender=User)
+def refresh_cached_user(sender, instance, **kwargs):
+    remember_user(instance)
+    if not instance.is_active:
+        revoke_user_tokens(instance.pk)
+
+
+@receiver(post_delete, sender=User)
+def drop_cached_user(sender, instance, **kwargs):
+    forget_user(instance.pk)
+    # The tokens carry their own claims, so nothing else would notice the row is gone
+    revoke_user_tokens(instance.pk)
+
+
+# Table rebuilds in later SQLite migrations drop the FTS triggers; put them back
+@receiver(post_migrate)
+def ensure_search_index(sender, app_config, using, **kwargs):
+    if app_config.name == "core":
+        install_sqlite_fts(using)
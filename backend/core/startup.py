@@ -0,0 +1,56 @@
+"""
+Cold-start measurements for `manage.py benchmark_startup` and the startup
+budget in core/test_performance.py.
+
+Each target runs in a fresh interpreter under -X importtime, the way a
+newly scaled-up worker or a management command starts, and reports its wall
+time and the import time of every module it loaded.
+"""
+import subprocess
+import sys
+import time
+from collections import namedtuple
+
+from django.conf import settings
+
+TARGETS = {
+    "import cloudbite.wsgi": ["-c", "import cloudbite.wsgi"],
+    "manage.py check": ["manage.py", "check"],
+}
+# Wall-time budgets in ms; both took about 2.5x longer while the SDKs loaded at import
+BUDGETS_MS = {"import cloudbite.wsgi": 1500, "manage.py check": 2000}
+# Imported on first use (core/integrations.py), so starting up must not pull them in
+LAZY_MODULES = ("stripe", "httpx")
+
+Startup = namedtuple("Startup", "seconds modules")
+
+
+def parse_importtime(stderr):
+    """Maps each module in -X importtime output to its own import time in seconds."""
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or line.endswith("imported package"):
+            continue
+        self_us, _, name = line.removeprefix("import time:").split("|")
+        modules[name.strip()] = int(self_us) / 1e6
+    return modules
+
+
+def measure(target):
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", *TARGETS[target]],
+        cwd=settings.BASE_DIR, capture_output=True, text=True,
+    )
+    seconds = time.perf_counter() - start
+    if result.returncode:
+        raise RuntimeError(f"{target} failed:\n{result.stderr[-2000:]}")
+    return Startup(seconds, parse_importtime(result.stderr))
+
+
+def by_package(modules):
+    totals = {}
+    for name, seconds in modules.items():
+        package = name.split(".")[0]
+        totals[package] = totals.get(package, 0) + seconds
+    return sorted(totals.items(), key=lambda item: item[1], reverse=True)
@@ -0,0 +1,104 @@
+import logging
+from decimal import Decimal
+
+from .integrations import get_stripe
+from .models import MenuItem, StripePrice
+
+logger = logging.getLogger(__name__)
+CURRENCY = "usd"
+
+
+def to_cents(price):
+    return int((Decimal(price) * 100).quantize(Decimal("1")))
+
+
+def get_mapping(menu_item):
+    try:
+        return menu_item.stripe_price
+    except StripePrice.DoesNotExist:
+        return None
+
+
+def is_current(mapping, menu_item):
+    return (
+        mapping is not None
+        and mapping.unit_amount == to_cents(menu_item.price)
+        and mapping.currency == CURRENCY
+    )
+
+
+def sync_menu_item(menu_item, force=False):
+    """
+    Makes sure ``menu_item`` has a Stripe Product and an active Price matching
+    its current price. Stripe prices are immutable, so a price change creates a
+    new Price and archives the old one. Returns the StripePrice mapping.
+    """
+    mapping = get_mapping(menu_item)
+    if not force and is_current(mapping, menu_item) and mapping.product_name == menu_item.title:
+        return mapping
+
+    stripe = get_stripe()
+    product_fields = {"name": menu_item.title}
+    if menu_item.description:
+        product_fields["description"] = menu_item.description
+
+    if mapping is None:
+        product_id = stripe.Product.create(metadata={"menu_item_id": menu_item.id}, **product_fields).id
+    else:
+        product_id = mapping.product_id
+        if force or mapping.product_name != menu_item.title:
+            stripe.Product.modify(product_id, **product_fields)
+
+    price_id = mapping.price_id if is_current(mapping, menu_item) else None
+    if price_id is None:
+        price_id = stripe.Price.create(
+            product=product_id, unit_amount=to_cents(menu_item.price), currency=CURRENCY
+        ).id
+        if mapping is not None:
+            stripe.Price.modify(mapping.price_id, active=False)
+
+    mapping, _ = StripePrice.objects.update_or_create(
+        menu_item=menu_item,
+        defaults={
+            "product_id": product_id,
+            "price_id": price_id,
+            "product_name": menu_item.title,
+            "unit_amount": to_cents(menu_item.price),
+            "currency": CURRENCY,
+        },
+    )
+    return mapping
+
+
+def sync_menu_item_by_id(menu_item_id):
+    # Runs after commit from the MenuItem save hook; a Stripe outage must not break saves
+    try:
+        menu_item = MenuItem.objects.select_related("stripe_price").get(pk=menu_item_id)
+        sync_menu_item(menu_item)
+    except MenuItem.DoesNotExist:
+        pass
+    except get_stripe().error.StripeError as e:
+        logger.error(f"Stripe price sync failed for menu item {menu_item_id}: {e}")
+
+
+def line_item_for(menu_item, quantity, with_description=False):
+    """
+    Checkout line for a menu item loaded with select_related('stripe_price'):
+    a compact Price reference when the synced price is current, inline
+    price_data otherwise (never synced, or changed and not yet re-synced).
+    """
+    mapping = get_mapping(menu_item)
+    if is_current(mapping, menu_item):
+        return {"price": mapping.price_id, "quantity": quantity}
+
+    product_data = {"name": menu_item.title}
+    if with_description and menu_item.description:
+        product_data["description"] = menu_item.description
+    return {
+        "price_data": {
+            "currency": CURRENCY,
+            "product_data": product_data,
+            "unit_amount": to_cents(menu_item.price),
+        },
+        "quantity": quantity,
+    }
@@ -0,0 +1,103 @@
+"""
+HTTP transport for the Stripe SDK.
+
+Sync calls go through requests, which keeps a keep-alive session per
+thread. The async API (``create_async`` and friends) goes through httpx,
+with a bounded keep-alive pool per event loop, closed when the loop shuts
+down. Only an ASGI server keeps one loop for the life of the process:
+under WSGI every async view runs in a loop of its own, so the pool would
+never be reused, and create_checkout_session() makes the sync call from
+the worker's own thread instead. httpx is optional: without it, ASGI
+checkouts make the sync call in a worker thread so the event loop is never
+blocked. Both paths are timed as the "stripe" span.
+"""
+import asyncio
+import ssl
+import weakref
+
+import stripe
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from .metrics import span
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+
+class InstrumentedRequestsClient(stripe.RequestsClient):
+    def request_with_retries(self, *args, **kwargs):
+        with span("stripe"):
+            return super().request_with_retries(*args, **kwargs)
+
+    async def request_with_retries_async(self, *args, **kwargs):
+        with span("stripe"):
+            return await super().request_with_retries_async(*args, **kwargs)
+
+
+class PooledHTTPXClient(stripe.HTTPXClient):
+    """
+    stripe.HTTPXClient with connection limits and an AsyncClient per event
+    loop: pooled connections can't be reused from a loop other than the one
+    that opened them. Each client is closed when its loop shuts down.
+    """
+
+    def __init__(self, timeout, connect_timeout, max_connections, max_keepalive_connections):
+        self._loop_clients = weakref.WeakKeyDictionary()
+        self._client_options = {
+            "verify": ssl.create_default_context(cafile=stripe.ca_bundle_path),
+            "limits": httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive_connections),
+        }
+        super().__init__(timeout=httpx.Timeout(timeout, connect=connect_timeout))
+
+    @property
+    def _client_async(self):
+        loop = asyncio.get_running_loop()
+        entry = self._loop_clients.get(loop)
+        if entry is None:
+            client = httpx.AsyncClient(**self._client_options)
+            closer = _close_with_loop(client)
+            # Run it up to its yield; the generator is kept here, as the loop only holds it weakly
+            loop.create_task(closer.__anext__())
+            entry = self._loop_clients[loop] = client, closer
+        return entry[0]
+
+    @_client_async.setter
+    def _client_async(self, client):
+        # HTTPXClient.__init__ builds a single unbounded client; the per-loop ones above replace it
+        pass
+
+
+async def _close_with_loop(client):
+    # Loops finalize the async generators still open when they shut down
+    # (asyncio.run and async_to_sync both do), which runs the finally
+    try:
+        yield
+    finally:
+        await client.aclose()
+
+
+def build_http_client():
+    async_client = None
+    if httpx is not None:
+        async_client = PooledHTTPXClient(
+            timeout=settings.STRIPE_TIMEOUT,
+            connect_timeout=settings.STRIPE_CONNECT_TIMEOUT,
+            max_connections=settings.STRIPE_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.STRIPE_MAX_KEEPALIVE_CONNECTIONS,
+        )
+    return InstrumentedRequestsClient(
+        timeout=(settings.STRIPE_CONNECT_TIMEOUT, settings.STRIPE_TIMEOUT),
+        async_fallback_client=async_client,
+    )
+
+
+async def create_checkout_session(serving_asgi=False, **params):
+    if not serving_asgi:
+        # The WSGI worker's thread, whose requests session stays open between checkouts
+        return await sync_to_async(stripe.checkout.Session.create)(**params)
+    if httpx is None:
+        return await sync_to_async(stripe.checkout.Session.create, thread_sensitive=False)(**params)
+    return await stripe.checkout.Session.create_async(**params)
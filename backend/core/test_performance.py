@@ -0,0 +1,378 @@
+"""
+Per-endpoint performance budgets.
+
+Every route in core/urls.py is called against a realistically sized data set
+and must stay within a maximum SQL query count and, with PERF_WALL_TIME=on,
+a wall-time budget (scaled by PERF_WALL_TIME_FACTOR for slow machines). The
+SQL each route runs is re-run under EXPLAIN, and the test fails if a table
+that is meant to be indexed is read with a full scan. Cold starts have a
+budget too (see core/startup.py).
+"""
+import json
+import os
+import re
+import time
+from contextlib import contextmanager
+from decimal import Decimal
+
+import stripe
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from . import integrations, startup
+from .authentication import ClaimsRefreshToken, revoked_tokens
+from .cache import bump_catalog_version
+from .checkout import record_checkout_session
+from .fake_stripe import FakeStripeServer, sign_payload
+from .menu_changes import record_menu_changes
+from .models import CartItem, MenuItem, Order, OrderItem, Review, StripeEvent, StripePrice
+from .ratings import AGGREGATE_FIELDS, find_drift
+from .search import get_backend
+from .webhooks import claim_events, process_event
+
+# Timing depends on the machine, so the normal suite only holds the query budgets
+WALL_TIME_ENABLED = os.getenv("PERF_WALL_TIME", "off").lower() in ("1", "on", "true")
+WALL_TIME_FACTOR = float(os.getenv("PERF_WALL_TIME_FACTOR", "1"))
+WEBHOOK_SECRET = "whsec_perf"
+
+# Tables whose hot-path reads must always go through an index
+INDEXED_TABLES = {
+    "core_menuitem",
+    "core_menuchange",
+    "core_cartitem",
+    "core_checkoutsession",
+    "core_checkoutsessionitem",
+    "core_order",
+    "core_orderitem",
+    "core_review",
+    "core_stripeevent",
+    "core_stripeprice",
+    "token_blacklist_outstandingtoken",
+    "token_blacklist_blacklistedtoken",
+}
+SQLITE_FULL_SCAN = re.compile(r"\bSCAN (\w+)(?! USING (?:COVERING |INTEGER PRIMARY KEY |PRIMARY KEY )?INDEX)")
+POSTGRES_FULL_SCAN = re.compile(r"Seq Scan on (\w+)")
+
+MENU_ITEMS = 1000
+USERS = 30
+ORDERS = 50
+ITEMS_PER_ORDER = 5
+CART_LINES = 20
+REVIEWS_PER_USER = 100
+
+
+@override_settings(
+    PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher"],
+    STRIPE_WEBHOOK_SECRET=WEBHOOK_SECRET,
+    REVOKED_TOKENS_SYNC_SECONDS=3600,
+)
+class EndpointBudgetTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.fake_stripe = FakeStripeServer().start()
+        cls.addClassCleanup(cls.fake_stripe.stop)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username="perf", password="perf-pass")
+        others = User.objects.bulk_create(User(username=f"customer{i}") for i in range(USERS))
+        cls.menu_items = MenuItem.objects.bulk_create(
+            MenuItem(
+                title=f"Dish {i} {('pizza', 'pasta', 'curry', 'salad', 'burger')[i % 5]}",
+                description=f"House special number {i} with seasonal vegetables",
+                price=Decimal("4.50") + i % 20,
+            )
+            for i in range(MENU_ITEMS)
+        )
+        cls.item = cls.menu_items[0]
+
+        StripePrice.objects.bulk_create(
+            StripePrice(
+                menu_item=item, product_id=f"prod_{item.id}", price_id=f"price_{item.id}",
+                product_name=item.title, unit_amount=int(item.price * 100),
+            )
+            for item in cls.menu_items[:CART_LINES]
+        )
+        CartItem.objects.bulk_create(
+            CartItem(user=cls.user, menu_item=item, quantity=2) for item in cls.menu_items[:CART_LINES]
+        )
+
+        cls.orders = Order.objects.bulk_create(
+            Order(user=user, total_price=Decimal("42.00"), is_paid=True)
+            for user in [cls.user] + others
+            for _ in range(ORDERS)
+        )
+        OrderItem.objects.bulk_create(
+            OrderItem(order=order, menu_item=cls.menu_items[(order.id + n) % MENU_ITEMS], quantity=1, price_at_order=Decimal("8.40"))
+            for order in cls.orders
+            for n in range(ITEMS_PER_ORDER)
+        )
+
+        Review.objects.bulk_create(
+            Review(user=user, menu_item=cls.menu_items[(n * 7) % 50], rating=n % 5 + 1, comment=f"Review {n}")
+            for user in others
+            for n in range(REVIEWS_PER_USER)
+        )
+        cls.review = Review.objects.create(user=cls.user, menu_item=cls.item, rating=4, comment="Mine")
+        # The aggregates the review views would have kept
+        for batch in find_drift():
+            MenuItem.objects.bulk_update(batch, AGGREGATE_FIELDS)
+
+    def setUp(self):
+        # Set the SDK up first, or its first use would replace the fake's address
+        integrations.get_stripe()
+        previous = stripe.api_key, stripe.api_base
+        stripe.api_key, stripe.api_base = "sk_test_fake", self.fake_stripe.url
+        self.addCleanup(setattr, stripe, "api_key", previous[0])
+        self.addCleanup(setattr, stripe, "api_base", previous[1])
+
+        # Tokens as login_view issues them, so the user comes from the claims instead of a query
+        self.refresh = ClaimsRefreshToken.for_user(self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.refresh.access_token}")
+        # Measure the uncached path; the cache has its own budget below
+        bump_catalog_version()
+        # The periodic reload of revoked tokens is not part of any one endpoint
+        revoked_tokens.sync()
+
+    @contextmanager
+    def budget(self, max_queries, max_ms):
+        with CaptureQueriesContext(connection) as context:
+            start = time.perf_counter()
+            yield
+            elapsed_ms = (time.perf_counter() - start) * 1000
+
+        queries = [query["sql"] for query in context.captured_queries]
+        self.assertLessEqual(
+            len(queries), max_queries,
+            f"{len(queries)} queries, budget {max_queries}:\n" + "\n".join(queries),
+        )
+        if WALL_TIME_ENABLED:
+            self.assertLessEqual(
+                elapsed_ms, max_ms * WALL_TIME_FACTOR,
+                f"took {elapsed_ms:.1f}ms, budget {max_ms * WALL_TIME_FACTOR:.0f}ms",
+            )
+        self.assert_no_full_scans(queries)
+
+    def assert_no_full_scans(self, queries):
+        for sql in queries:
+            if not sql.lstrip().upper().startswith(("SELECT", "UPDATE", "DELETE")):
+                continue
+            for table in self.full_scans(sql):
+                self.fail(f"Full scan of indexed table {table}:\n{sql}")
+
+    def full_scans(self, sql):
+        with connection.cursor() as cursor:
+            if connection.vendor == "sqlite":
+                cursor.execute(f"EXPLAIN QUERY PLAN {sql}")
+                plan, pattern = "\n".join(row[-1] for row in cursor.fetchall()), SQLITE_FULL_SCAN
+            elif connection.vendor == "postgresql":
+                # Tiny test tables make seq scans look cheap; only report unavoidable ones
+                cursor.execute("SET LOCAL enable_seqscan = off")
+                cursor.execute(f"EXPLAIN {sql}")
+                plan, pattern = "\n".join(row[0] for row in cursor.fetchall()), POSTGRES_FULL_SCAN
+            else:
+                return []
+        return [table for table in pattern.findall(plan) if table in INDEXED_TABLES]
+
+    # Menu
+    def test_menu_list(self):
+        with self.budget(max_queries=1, max_ms=150):
+            response = self.client.get("/api/menu-items/")
+        self.assertEqual(len(response.json()["results"]), 20)
+
+    def test_menu_list_deep_page(self):
+        url = "/api/menu-items/?page_size=100"
+        for _ in range(5):
+            url = self.client.get(url).json()["next"]
+        with self.budget(max_queries=1, max_ms=150):
+            response = self.client.get(url)
+        self.assertEqual(len(response.json()["results"]), 100)
+
+    def test_menu_list_cache_hit(self):
+        self.client.get("/api/menu-items/")
+        # Served from the cache, and the user comes from the token: no queries at all
+        with self.budget(max_queries=0, max_ms=50):
+            response = self.client.get("/api/menu-items/")
+        self.assertEqual(response["X-Cache"], "HIT")
+
+    def test_menu_changes(self):
+        record_menu_changes(item.id for item in self.menu_items[-CART_LINES:])
+        with self.budget(max_queries=2, max_ms=150):
+            response = self.client.get("/api/menu-items/changes/?since=0&format=json")
+        self.assertEqual(len(response.json()["items"]), CART_LINES)
+        with self.budget(max_queries=1, max_ms=50):
+            self.client.get(f"/api/menu-items/changes/?since={response.json()['version']}&format=json")
+
+    def test_menu_search(self):
+        get_backend(connection.alias)
+        with self.budget(max_queries=2, max_ms=250):
+            response = self.client.get("/api/menu-items/?search=pizz")
+        self.assertEqual(len(response.json()), 200)
+
+    def test_menu_detail(self):
+        with self.budget(max_queries=1, max_ms=100):
+            self.client.get(f"/api/menu-items/{self.item.id}/")
+
+    def test_menu_top_rated(self):
+        with self.budget(max_queries=1, max_ms=100):
+            self.client.get("/api/menu-items/top-rated/")
+
+    def test_menu_item_reviews(self):
+        with self.budget(max_queries=2, max_ms=100):
+            response = self.client.get(f"/api/menu-items/{self.item.id}/reviews/")
+        self.assertEqual(len(response.json()["results"]), 20)
+
+    # Cart
+    def test_cart_list(self):
+        with self.budget(max_queries=1, max_ms=150):
+            response = self.client.get("/api/cart-items/")
+        self.assertEqual(len(response.json()), CART_LINES)
+
+    def test_cart_create(self):
+        with self.budget(max_queries=7, max_ms=300):
+            response = self.client.post(
+                "/api/cart-items/", {"menu_item_id": self.menu_items[-1].id, "quantity": 1}, format="json"
+            )
+        self.assertEqual(response.status_code, 201)
+
+    def test_cart_update_and_delete(self):
+        cart_item = CartItem.objects.filter(user=self.user).first()
+        with self.budget(max_queries=2, max_ms=100):
+            self.client.patch(f"/api/cart-items/{cart_item.id}/", {"quantity": 5}, format="json")
+        with self.budget(max_queries=2, max_ms=100):
+            response = self.client.delete(f"/api/cart-items/{cart_item.id}/")
+        self.assertEqual(response.status_code, 204)
+
+    def test_merge_cart(self):
+        items = [{"menu_item_id": item.id, "quantity": 1} for item in self.menu_items[:100]]
+        with self.budget(max_queries=5, max_ms=200):
+            self.client.post("/api/merge-cart/", {"items": items}, format="json")
+
+    # Orders
+    def test_order_history(self):
+        with self.budget(max_queries=2, max_ms=250):
+            response = self.client.get("/api/orders/")
+        self.assertEqual(len(response.json()["results"]), 20)
+
+    def test_order_detail(self):
+        order = Order.objects.filter(user=self.user).first()
+        with self.budget(max_queries=2, max_ms=100):
+            self.client.get(f"/api/orders/{order.id}/")
+
+    # Order export
+    def test_order_export(self):
+        staff = User.objects.create_user(username="accounts", password="perf-pass", is_staff=True)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {ClaimsRefreshToken.for_user(staff).access_token}")
+        since = self.orders[-ORDERS].ordered_at.isoformat()
+        with self.budget(max_queries=2, max_ms=300):
+            response = self.client.get("/api/orders/export/", {"since": since, "status": "success"})
+            b"".join(response.streaming_content)
+        self.assertEqual(response.status_code, 200)
+
+    # Reviews
+    def test_review_list(self):
+        with self.budget(max_queries=1, max_ms=150):
+            response = self.client.get("/api/reviews/")
+        self.assertEqual(len(response.json()["results"]), 20)
+
+    def test_review_create(self):
+        payload = {"menu_item": self.item.id, "rating": 5, "comment": "Great"}
+        # Two of them replace the item's entry in the menu change log
+        with self.budget(max_queries=7, max_ms=100):
+            response = self.client.post("/api/reviews/", payload, format="json")
+        self.assertEqual(response.status_code, 201)
+
+    # Like create: the review write, the aggregate UPDATE and the change log, in a savepoint
+    def test_review_update_and_delete(self):
+        with self.budget(max_queries=7, max_ms=100):
+            response = self.client.patch(f"/api/reviews/{self.review.id}/", {"rating": 2}, format="json")
+        self.assertEqual(response.status_code, 200)
+        with self.budget(max_queries=7, max_ms=100):
+            response = self.client.delete(f"/api/reviews/{self.review.id}/")
+        self.assertEqual(response.status_code, 204)
+
+    # Auth
+    def test_register(self):
+        payload = {"username": "newbie", "email": "new@example.com", "password": "Str0ng-pass!"}
+        with self.budget(max_queries=2, max_ms=250):
+            response = self.client.post("/api/register/", payload, format="json")
+        self.assertEqual(response.status_code, 201)
+
+    def test_login_and_token(self):
+        credentials = {"username": "perf", "password": "perf-pass"}
+        with self.budget(max_queries=2, max_ms=150):
+            self.assertEqual(self.client.post("/api/login/", credentials, format="json").status_code, 200)
+        # The token views don't authenticate the request, so nothing was saved there
+        with self.budget(max_queries=2, max_ms=150):
+            self.assertEqual(self.client.post("/api/token/", credentials, format="json").status_code, 200)
+
+    def test_token_refresh(self):
+        with self.budget(max_queries=2, max_ms=100):
+            response = self.client.post("/api/token/refresh/", {"refresh": str(self.refresh)}, format="json")
+        self.assertEqual(response.status_code, 200)
+
+    def test_me_and_logout(self):
+        with self.budget(max_queries=0, max_ms=100):
+            self.client.get("/api/me/")
+        # Blacklist check and outstanding-token lookup, then one insert per revoked token
+        with self.budget(max_queries=4, max_ms=100):
+            self.client.post("/api/logout/", {"refresh": str(self.refresh)}, format="json")
+
+    # Checkout
+    # Both record the cart snapshot after Stripe answers: two inserts in a savepoint
+    def test_single_checkout(self):
+        with self.budget(max_queries=5, max_ms=300):
+            response = self.client.post("/api/create-checkout-session/", {"menu_item_id": self.item.id}, format="json")
+        self.assertEqual(response.status_code, 200)
+
+    def test_multi_checkout(self):
+        with self.budget(max_queries=5, max_ms=300):
+            response = self.client.post("/api/create-multi-checkout-session/")
+        self.assertEqual(response.status_code, 200)
+
+    # Webhook and worker
+    def test_webhook_and_worker(self):
+        record_checkout_session("cs_perf", self.user, [(item, 1) for item in self.menu_items[:CART_LINES]])
+        payload = json.dumps({
+            "id": "evt_perf",
+            "object": "event",
+            "type": "checkout.session.completed",
+            "data": {"object": {
+                "id": "cs_perf",
+                "object": "checkout.session",
+                "metadata": {"user_id": str(self.user.id)},
+            }},
+        }).encode()
+
+        with self.budget(max_queries=1, max_ms=100):
+            response = self.client.post(
+                "/api/stripe-webhook/", payload, content_type="application/json",
+                HTTP_STRIPE_SIGNATURE=sign_payload(payload, WEBHOOK_SECRET),
+            )
+        self.assertEqual(response.status_code, 200)
+
+        with self.budget(max_queries=3, max_ms=100):
+            events = claim_events("perf-worker", 10)
+        # One snapshot read replaces the user and menu item lookups
+        with self.budget(max_queries=7, max_ms=200):
+            process_event(events[0])
+        self.assertEqual(StripeEvent.objects.get(event_id="evt_perf").status, StripeEvent.DONE)
+
+
+class StartupBudgetTests(SimpleTestCase):
+    # A fresh worker or management command must not pay for the Stripe SDK up front
+    def test_cold_start(self):
+        for target, budget_ms in startup.BUDGETS_MS.items():
+            result = startup.measure(target)
+            loaded = [name for name in startup.LAZY_MODULES if name in result.modules]
+            self.assertEqual(loaded, [], f"{target} imports {', '.join(loaded)} at startup")
+            if WALL_TIME_ENABLED:
+                self.assertLessEqual(
+                    result.seconds * 1000, budget_ms * WALL_TIME_FACTOR,
+                    f"{target} took {result.seconds * 1000:.0f}ms, budget {budget_ms * WALL_TIME_FACTOR:.0f}ms",
+                )
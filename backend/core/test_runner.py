@@ -0,0 +1,21 @@
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+class TestRunner(DiscoverRunner):
+    """
+    Runs the menu cache on locmem, the way Django swaps in the locmem email
+    backend: each run starts empty and leaves the shared file or redis cache
+    of a local server alone.
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        menu = {**settings.MENU_CACHES["locmem"], "TIMEOUT": settings.MENU_CACHE_TIMEOUT}
+        self._menu_cache = override_settings(CACHES={**settings.CACHES, "menu": menu})
+        self._menu_cache.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self._menu_cache.disable()
+        super().teardown_test_environment(**kwargs)
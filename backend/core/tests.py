@@ -1,3 +1,1582 @@
-from django.test import TestCase
+import asyncio
+import csv
+import datetime
+import gzip
+import importlib
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import warnings
+from decimal import Decimal
+from io import StringIO
+from pathlib import Path
 
-# Create your tests here.
+import msgpack
+import stripe
+from asgiref.sync import async_to_sync
+from cloudbite.asgi import application as asgi_application
+from django.apps import apps as django_apps
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import IntegrityError, connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from . import (
+    checkout, integrations, loadtest, menu_changes, menu_io, metrics, ratings, renderers, routers, search, views,
+    webhooks,
+)
+from .authentication import (
+    ClaimsRefreshToken, TTLCache, revoke_user_tokens, revoked_tokens, user_cache, user_revocation,
+)
+from .cache import VERSION_KEY, bump_catalog_version, get_cache, get_catalog_version, get_stats, reset_stats
+from .fake_stripe import FakeStripeServer
+from .fast_serializers import menu_item_rows, order_rows
+from .models import (
+    CartItem, CheckoutSession, MenuChange, MenuItem, Order, OrderItem, Review, RevokedToken, StripeEvent, StripePrice,
+)
+from .serializers import MenuItemSerializer, OrderSerializer
+from .stripe_http import PooledHTTPXClient
+from .stripe_catalog import sync_menu_item
+from .webhooks import claim_events, enqueue_event, process_batch
+
+
+class OrderHistoryQueryTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username="alice", password="secret-pass")
+        cls.menu_items = MenuItem.objects.bulk_create(
+            MenuItem(title=f"Dish {i}", description="Tasty", price=Decimal("5.00") + i)
+            for i in range(5)
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def create_orders(self, count, items_per_order=5):
+        orders = Order.objects.bulk_create(
+            Order(user=self.user, total_price=Decimal("25.00"), is_paid=True) for _ in range(count)
+        )
+        OrderItem.objects.bulk_create(
+            OrderItem(order=order, menu_item=item, quantity=1, price_at_order=item.price)
+            for order in orders
+            for item in self.menu_items[:items_per_order]
+        )
+        return orders
+
+    def test_list_query_count_is_constant(self):
+        self.create_orders(2)
+        with self.assertNumQueries(2):
+            small = self.client.get("/api/orders/?page_size=100")
+
+        self.create_orders(48)
+        with self.assertNumQueries(2):
+            large = self.client.get("/api/orders/?page_size=100")
+
+        self.assertEqual(len(small.json()["results"]), 2)
+        self.assertEqual(len(large.json()["results"]), 50)
+        self.assertEqual(len(large.json()["results"][0]["order_items"]), 5)
+
+    def test_detail_query_count(self):
+        order = self.create_orders(1)[0]
+        with self.assertNumQueries(2):
+            response = self.client.get(f"/api/orders/{order.id}/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["user"]["username"], "alice")
+        self.assertEqual(len(response.json()["order_items"]), 5)
+
+    def test_other_users_orders_are_hidden(self):
+        other = User.objects.create_user(username="bob", password="secret-pass")
+        order = Order.objects.create(user=other, total_price=Decimal("5.00"))
+        response = self.client.get(f"/api/orders/{order.id}/")
+        self.assertEqual(response.status_code, 404)
+
+
+class CursorPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username="pia", password="secret-pass")
+        cls.items = MenuItem.objects.bulk_create(
+            MenuItem(title=f"Dish {i}", description="Tasty", price=Decimal("5.00")) for i in range(7)
+        )
+        orders = Order.objects.bulk_create(Order(user=cls.user, total_price=Decimal("5.00")) for _ in range(7))
+        # Rows created in one go share their timestamps: pairs of them here, and every menu item
+        now = timezone.now()
+        for n, order in enumerate(orders):
+            Order.objects.filter(pk=order.pk).update(ordered_at=now + datetime.timedelta(seconds=n // 2))
+        MenuItem.objects.update(created_at=now)
+        cls.order_ids = sorted((order.id for order in orders), reverse=True)
+
+    def setUp(self):
+        bump_catalog_version()
+        self.addCleanup(bump_catalog_version)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def walk(self, url):
+        ids, pages = [], []
+        while url:
+            page = self.client.get(url).json()
+            pages.append(page)
+            ids += [row["id"] for row in page["results"]]
+            url = page["next"]
+        return ids, pages
+
+    def test_tied_timestamps_page_in_id_order(self):
+        ids, pages = self.walk("/api/menu-items/?page_size=2&format=json")
+        self.assertEqual(ids, sorted((item.id for item in self.items), reverse=True))
+        self.assertEqual([len(page["results"]) for page in pages], [2, 2, 2, 1])
+
+        ids, _ = self.walk("/api/orders/?page_size=3&format=json")
+        self.assertEqual(ids, self.order_ids)
+
+    def test_previous_page(self):
+        _, pages = self.walk("/api/orders/?page_size=2&format=json")
+        self.assertIsNone(pages[0]["previous"])
+        # Walking back from the last page sees every row before it exactly once
+        url, seen = pages[-1]["previous"], [row["id"] for row in pages[-1]["results"]]
+        while url:
+            page = self.client.get(url).json()
+            seen[:0] = [row["id"] for row in page["results"]]
+            url = page["previous"]
+        self.assertEqual(seen, self.order_ids)
+
+    def test_invalid_cursor(self):
+        self.assertEqual(self.client.get("/api/orders/?cursor=bogus").status_code, 404)
+
+    def test_page_size(self):
+        self.assertEqual(len(self.client.get("/api/orders/").json()["results"]), 7)
+        self.assertEqual(len(self.client.get("/api/orders/?page_size=4").json()["results"]), 4)
+        with self.settings(API_PAGE_SIZE=3, API_MAX_PAGE_SIZE=5):
+            self.assertEqual(len(self.client.get("/api/orders/").json()["results"]), 3)
+            self.assertEqual(len(self.client.get("/api/orders/?page_size=1000").json()["results"]), 5)
+
+
+class StripeEventQueueTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username="carol", password="secret-pass")
+        cls.pizza = MenuItem.objects.create(title="Pizza", description="Cheesy", price=Decimal("9.50"))
+        cls.pasta = MenuItem.objects.create(title="Pasta", description="Saucy", price=Decimal("7.25"))
+
+    def completed_event(self, event_id="evt_1", session_id="cs_test_1"):
+        cart = [
+            {"menu_item_id": self.pizza.id, "quantity": 2, "price": 9.5},
+            {"menu_item_id": self.pasta.id, "quantity": 1, "price": 7.25},
+        ]
+        return {
+            "id": event_id,
+            "type": "checkout.session.completed",
+            "data": {"object": {
+                "id": session_id,
+                "metadata": {"user_id": str(self.user.id), "cart": json.dumps(cart)},
+            }},
+        }
+
+    def test_worker_creates_order_and_clears_cart(self):
+        CartItem.objects.create(user=self.user, menu_item=self.pizza, quantity=2)
+        enqueue_event(self.completed_event())
+        self.assertFalse(Order.objects.exists())
+
+        self.assertEqual(process_batch("test-worker", 10), 1)
+        order = Order.objects.get(user=self.user)
+        self.assertEqual(order.total_price, Decimal("26.25"))
+        self.assertEqual(order.order_items.count(), 2)
+        self.assertFalse(CartItem.objects.filter(user=self.user).exists())
+        self.assertEqual(StripeEvent.objects.get().status, StripeEvent.DONE)
+
+    def test_redelivery_is_a_no_op(self):
+        enqueue_event(self.completed_event())
+        enqueue_event(self.completed_event())
+        enqueue_event(self.completed_event(event_id="evt_2"))
+        self.assertEqual(StripeEvent.objects.count(), 2)
+
+        process_batch("test-worker", 10)
+        self.assertEqual(Order.objects.filter(user=self.user).count(), 1)
+        self.assertEqual(OrderItem.objects.count(), 2)
+        self.assertEqual(StripeEvent.objects.filter(status=StripeEvent.DONE).count(), 2)
+
+    def test_other_integrity_errors_are_retried(self):
+        def fail(event):
+            raise IntegrityError("FOREIGN KEY constraint failed")
+
+        self.addCleanup(webhooks.EVENT_HANDLERS.update, dict(webhooks.EVENT_HANDLERS))
+        webhooks.EVENT_HANDLERS["checkout.session.completed"] = fail
+        enqueue_event(self.completed_event())
+
+        with self.assertLogs("core.webhooks", "WARNING"):
+            process_batch("test-worker", 10)
+        stripe_event = StripeEvent.objects.get()
+        self.assertEqual(stripe_event.status, StripeEvent.PENDING)
+        self.assertIn("FOREIGN KEY", stripe_event.last_error)
+
+    def test_claimed_events_are_not_claimed_twice(self):
+        enqueue_event(self.completed_event())
+        self.assertEqual(len(claim_events("worker-a", 10)), 1)
+        self.assertEqual(claim_events("worker-b", 10), [])
+
+    def test_failures_are_retried_with_backoff(self):
+        event = self.completed_event()
+        event["data"]["object"]["metadata"]["user_id"] = "999999"
+        enqueue_event(event)
+
+        with self.assertLogs("core.webhooks", "WARNING"):
+            process_batch("test-worker", 10)
+        stripe_event = StripeEvent.objects.get()
+        self.assertEqual(stripe_event.status, StripeEvent.PENDING)
+        self.assertEqual(stripe_event.attempts, 1)
+        self.assertGreater(stripe_event.available_at, timezone.now())
+        self.assertEqual(process_batch("test-worker", 10), 0)
+
+
+class MergeCartTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username="dave", password="secret-pass")
+        cls.menu_items = MenuItem.objects.bulk_create(
+            MenuItem(title=f"Dish {i}", description="Tasty", price=Decimal("4.00")) for i in range(100)
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def merge(self, items):
+        return self.client.post("/api/merge-cart/", {"items": items}, format="json")
+
+    def test_query_count_does_not_grow_with_cart_size(self):
+        small = [{"menu_item_id": item.id, "quantity": 1} for item in self.menu_items[:2]]
+        large = [{"menu_item_id": item.id, "quantity": 2} for item in self.menu_items]
+
+        with self.assertNumQueries(5):
+            self.merge(small)
+        with self.assertNumQueries(5):
+            self.merge(large)
+
+        self.assertEqual(CartItem.objects.filter(user=self.user).count(), 100)
+        self.assertEqual(CartItem.objects.get(user=self.user, menu_item=self.menu_items[0]).quantity, 3)
+        self.assertEqual(CartItem.objects.get(user=self.user, menu_item=self.menu_items[50]).quantity, 2)
+
+    def test_unknown_and_invalid_lines_are_skipped(self):
+        first = self.menu_items[0].id
+        self.merge([
+            {"menu_item_id": first, "quantity": 1},
+            {"menu_item_id": first, "quantity": 2},
+            {"menu_item_id": 999999, "quantity": 1},
+            {"menu_item_id": "abc"},
+            {"menu_item_id": self.menu_items[1].id, "quantity": -4},
+        ])
+        self.assertEqual(
+            list(CartItem.objects.filter(user=self.user).values_list("menu_item_id", "quantity")),
+            [(first, 3)],
+        )
+
+    def test_adding_an_item_twice_increments_quantity(self):
+        payload = {"menu_item_id": self.menu_items[0].id, "quantity": 2}
+        self.client.post("/api/cart-items/", payload, format="json")
+        response = self.client.post("/api/cart-items/", payload, format="json")
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()["quantity"], 4)
+        self.assertEqual(CartItem.objects.filter(user=self.user).count(), 1)
+
+    def test_quantity_must_be_positive(self):
+        payload = {"menu_item_id": self.menu_items[0].id, "quantity": 0}
+        response = self.client.post("/api/cart-items/", payload, format="json")
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("quantity", response.json())
+        self.assertFalse(CartItem.objects.filter(user=self.user).exists())
+
+
+class StripePriceCatalogTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.fake_stripe = FakeStripeServer().start()
+        cls.addClassCleanup(cls.fake_stripe.stop)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username="erin", password="secret-pass")
+        cls.pizza = MenuItem.objects.create(title="Pizza", description="Cheesy", price=Decimal("9.50"))
+        cls.pasta = MenuItem.objects.create(title="Pasta", description="", price=Decimal("7.25"))
+
+    def setUp(self):
+        # Set the SDK up first, or its first use would replace the fake's address
+        integrations.get_stripe()
+        previous = stripe.api_key, stripe.api_base
+        stripe.api_key, stripe.api_base = "sk_test_fake", self.fake_stripe.url
+        self.addCleanup(setattr, stripe, "api_key", previous[0])
+        self.addCleanup(setattr, stripe, "api_base", previous[1])
+        self.fake_stripe.requests.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_sync_command_maps_every_item_once(self):
+        call_command("sync_stripe_prices", stdout=StringIO())
+        mapping = StripePrice.objects.get(menu_item=self.pizza)
+        self.assertEqual(mapping.unit_amount, 950)
+        self.assertEqual(len(self.fake_stripe.requests_to("/v1/prices")), 2)
+
+        call_command("sync_stripe_prices", stdout=StringIO())
+        self.assertEqual(len(self.fake_stripe.requests_to("/v1/prices")), 2)
+
+    def test_price_change_creates_new_price_on_save(self):
+        old_price_id = sync_menu_item(self.pizza).price_id
+        self.pizza.price = Decimal("10.00")
+        # Changing the Stripe settings sets the SDK up again from them
+        with self.settings(STRIPE_SECRET_KEY="sk_test_fake", STRIPE_API_BASE=self.fake_stripe.url):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.pizza.save()
+
+        mapping = StripePrice.objects.get(menu_item=self.pizza)
+        self.assertNotEqual(mapping.price_id, old_price_id)
+        self.assertEqual(mapping.unit_amount, 1000)
+        self.assertEqual(self.fake_stripe.requests_to(f"/v1/prices/{old_price_id}"), [{"active": "false"}])
+
+    def test_multi_checkout_sends_price_references(self):
+        call_command("sync_stripe_prices", stdout=StringIO())
+        CartItem.objects.create(user=self.user, menu_item=self.pizza, quantity=2)
+        CartItem.objects.create(user=self.user, menu_item=self.pasta, quantity=1)
+        self.fake_stripe.requests.clear()
+
+        # The joined cart read, then the snapshot: two inserts in a savepoint
+        with self.assertNumQueries(5):
+            response = self.client.post("/api/create-multi-checkout-session/")
+
+        self.assertEqual(response.status_code, 200)
+        params = self.fake_stripe.requests_to("/v1/checkout/sessions")[0]
+        self.assertEqual(params["line_items[0][price]"], self.pizza.stripe_price.price_id)
+        self.assertEqual(params["line_items[0][quantity]"], "2")
+        self.assertFalse(any("price_data" in key for key in params))
+
+    def test_unsynced_item_falls_back_to_inline_price(self):
+        response = self.client.post("/api/create-checkout-session/", {"menu_item_id": self.pizza.id}, format="json")
+
+        self.assertEqual(response.status_code, 200)
+        params = self.fake_stripe.requests_to("/v1/checkout/sessions")[0]
+        self.assertEqual(params["line_items[0][price_data][unit_amount]"], "950")
+        self.assertEqual(params["line_items[0][price_data][product_data][description]"], "Cheesy")
+
+
+class RatingAggregateTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username="frank", password="secret-pass")
+        cls.pizza = MenuItem.objects.create(title="Pizza", description="Cheesy", price=Decimal("9.50"))
+        cls.pasta = MenuItem.objects.create(title="Pasta", description="Saucy", price=Decimal("7.25"))
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def review(self, menu_item, rating):
+        response = self.client.post(
+            "/api/reviews/", {"menu_item": menu_item.id, "rating": rating, "comment": "ok"}, format="json"
+        )
+        return response.json()["id"]
+
+    def aggregates(self, menu_item):
+        menu_item.refresh_from_db()
+        return menu_item.review_count, menu_item.rating_sum, menu_item.rating_average
+
+    def test_aggregates_follow_review_writes(self):
+        first = self.review(self.pizza, 5)
+        self.review(self.pizza, 4)
+        self.assertEqual(self.aggregates(self.pizza), (2, 9, 4.5))
+
+        self.client.patch(f"/api/reviews/{first}/", {"rating": 2}, format="json")
+        self.assertEqual(self.aggregates(self.pizza), (2, 6, 3.0))
+
+        self.client.patch(f"/api/reviews/{first}/", {"menu_item": self.pasta.id}, format="json")
+        self.assertEqual(self.aggregates(self.pizza), (1, 4, 4.0))
+        self.assertEqual(self.aggregates(self.pasta), (1, 2, 2.0))
+
+        self.client.delete(f"/api/reviews/{first}/")
+        self.assertEqual(self.aggregates(self.pasta), (0, 0, 0.0))
+
+    def test_top_rated_orders_by_average(self):
+        self.review(self.pizza, 3)
+        self.review(self.pasta, 5)
+        response = self.client.get("/api/menu-items/top-rated/")
+        self.assertEqual([item["title"] for item in response.json()], ["Pasta", "Pizza"])
+        self.assertEqual(response.json()[0]["rating_average"], 5.0)
+
+    def test_top_rated_limit_is_clamped(self):
+        self.review(self.pizza, 3)
+        self.review(self.pasta, 5)
+        for limit, count in (("-1", 1), ("0", 1), ("1000", 2)):
+            response = self.client.get(f"/api/menu-items/top-rated/?limit={limit}")
+            self.assertEqual((response.status_code, len(response.json())), (200, count))
+
+    def test_reviews_invalidate_only_what_they_change(self):
+        bump_catalog_version()
+        self.addCleanup(bump_catalog_version)
+        urls = {
+            "list": "/api/menu-items/?format=json",
+            "top_rated": "/api/menu-items/top-rated/?format=json",
+            "pizza": f"/api/menu-items/{self.pizza.id}/?format=json",
+            "pizza_reviews": f"/api/menu-items/{self.pizza.id}/reviews/?format=json",
+            "pasta": f"/api/menu-items/{self.pasta.id}/?format=json",
+        }
+        for url in urls.values():
+            self.client.get(url)
+        version = get_catalog_version()
+
+        self.review(self.pizza, 4)
+        self.assertEqual(get_catalog_version(), version)
+        cache = {name: self.client.get(url)["X-Cache"] for name, url in urls.items()}
+        self.assertEqual(cache, {
+            "list": "HIT", "top_rated": "MISS", "pizza": "MISS", "pizza_reviews": "MISS", "pasta": "HIT",
+        })
+        self.assertEqual(self.client.get(urls["pizza"]).json()["review_count"], 1)
+
+    def test_reconcile_repairs_drift(self):
+        self.review(self.pizza, 4)
+        MenuItem.objects.filter(pk=self.pizza.pk).update(review_count=7, rating_sum=1, rating_average=0.1)
+        MenuItem.objects.filter(pk=self.pasta.pk).update(review_count=2)
+
+        out = StringIO()
+        call_command("reconcile_ratings", "--batch-size", "1", stdout=out)
+        self.assertIn("Repaired 2 menu items", out.getvalue())
+        self.assertEqual(self.aggregates(self.pizza), (1, 4, 4.0))
+        self.assertEqual(self.aggregates(self.pasta), (0, 0, 0.0))
+
+    def test_repair_counts_reviews_written_after_the_scan(self):
+        MenuItem.objects.filter(pk=self.pizza.pk).update(review_count=3)
+        [batch] = list(ratings.find_drift())
+        self.review(self.pizza, 5)
+
+        ratings.repair_drift([menu_item.id for menu_item in batch])
+        self.assertEqual(self.aggregates(self.pizza), (1, 5, 5.0))
+
+
+class MenuItemReviewListTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [User.objects.create_user(username=f"reviewer{i}", password="secret-pass") for i in range(6)]
+        cls.pizza = MenuItem.objects.create(title="Pizza", description="Cheesy", price=Decimal("9.50"))
+        cls.pasta = MenuItem.objects.create(title="Pasta", description="Saucy", price=Decimal("7.25"))
+        for i, user in enumerate(cls.users):
+            Review.objects.create(user=user, menu_item=cls.pizza, rating=i % 5 + 1, comment=f"Review {i}")
+        Review.objects.create(user=cls.users[0], menu_item=cls.pasta, rating=5, comment="Other item")
+
+    def test_lists_only_this_items_reviews_newest_first(self):
+        with self.assertNumQueries(2):
+            response = self.client.get(f"/api/menu-items/{self.pizza.id}/reviews/?page_size=10")
+
+        results = response.json()["results"]
+        self.assertEqual([review["comment"] for review in results], [f"Review {i}" for i in range(5, -1, -1)])
+        self.assertEqual(results[0]["user"]["username"], "reviewer5")
+
+    def test_rating_filters_and_paging(self):
+        response = self.client.get(f"/api/menu-items/{self.pizza.id}/reviews/?min_rating=4")
+        self.assertEqual(sorted(review["rating"] for review in response.json()["results"]), [4, 5])
+
+        response = self.client.get(f"/api/menu-items/{self.pizza.id}/reviews/?rating=1")
+        self.assertEqual(len(response.json()["results"]), 2)
+
+        first = self.client.get(f"/api/menu-items/{self.pizza.id}/reviews/?page_size=4").json()
+        second = self.client.get(first["next"]).json()
+        self.assertEqual(len(first["results"]) + len(second["results"]), 6)
+        self.assertIsNone(second["next"])
+
+    def test_unknown_item_is_404(self):
+        self.assertEqual(self.client.get("/api/menu-items/999999/reviews/").status_code, 404)
+
+
+@override_settings(ALLOWED_HOSTS=[loadtest.HOST], STRIPE_WEBHOOK_SECRET=loadtest.WEBHOOK_SECRET)
+class LoadTestHarnessTests(TestCase):
+    def test_journey_completes_against_wsgi_app(self):
+        from cloudbite.wsgi import application
+
+        recorder = loadtest.Recorder()
+        with loadtest.stub_cloudinary(), loadtest.fake_stripe() as fake:
+            menu_ids, accounts = loadtest.seed(30, 1)
+            steps = loadtest.journey(accounts[0][1], menu_ids, random.Random(1), fake)
+            request = loadtest._step(steps, None)
+            while request is not None:
+                response = loadtest.call_wsgi(application, request)
+                recorder.record(request.name, response.status, 0.01)
+                request = loadtest._step(steps, response)
+
+        report = recorder.report(1.0)
+        self.assertEqual(report["total"]["errors"], 0)
+        self.assertIn("POST /api/stripe-webhook/ (replay)", report["endpoints"])
+        self.assertEqual(loadtest.drain_webhook_queue(), 1)
+        self.assertEqual(Order.objects.filter(user=accounts[0][0]).count(), 1)
+
+    def test_runs_leave_the_site_cache_alone(self):
+        get_cache().set("menu:live", "entry")
+        self.addCleanup(get_cache().delete, "menu:live")
+        with loadtest.scratch_cache():
+            self.assertIsNone(get_cache().get("menu:live"))
+            get_cache().clear()
+        self.assertEqual(get_cache().get("menu:live"), "entry")
+
+    def test_percentiles_use_nearest_rank(self):
+        stats = loadtest.summarize([i / 1000 for i in range(1, 101)], errors=0, duration=2.0)
+        self.assertEqual((stats["p50_ms"], stats["p95_ms"], stats["p99_ms"]), (50.0, 95.0, 99.0))
+        self.assertEqual(stats["rps"], 50.0)
+
+
+@override_settings(METRICS_TOKEN="scrape-token")
+class InstrumentationTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.fake_stripe = FakeStripeServer().start()
+        cls.addClassCleanup(cls.fake_stripe.stop)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username="ivy", password="secret-pass")
+        cls.menu_item = MenuItem.objects.create(title="Pho", description="Soup", price=Decimal("11.00"))
+
+    def setUp(self):
+        # Set the SDK up first, or its first use would replace the fake's address
+        integrations.get_stripe()
+        previous = stripe.api_key, stripe.api_base
+        stripe.api_key, stripe.api_base = "sk_test_fake", self.fake_stripe.url
+        self.addCleanup(setattr, stripe, "api_key", previous[0])
+        self.addCleanup(setattr, stripe, "api_base", previous[1])
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        metrics.clear()
+
+    def server_timing(self, response):
+        return dict(part.split(";", 1) for part in response["Server-Timing"].split(", "))
+
+    def test_server_timing_reports_sql_and_serialization(self):
+        response = self.client.get(f"/api/reviews/?menu_item={self.menu_item.id}")
+        timing = self.server_timing(response)
+        self.assertIn('desc="1 queries"', timing["db"])
+        self.assertIn("serialize", timing)
+        self.assertIn("render", timing)
+
+    def test_stripe_calls_are_timed(self):
+        response = self.client.post("/api/create-checkout-session/", {"menu_item_id": self.menu_item.id}, format="json")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("stripe", self.server_timing(response))
+
+    def test_metrics_endpoint_requires_token(self):
+        self.client.get("/api/reviews/")
+        self.assertEqual(self.client.get("/metrics/").status_code, 403)
+
+        response = self.client.get("/metrics/", HTTP_AUTHORIZATION="Bearer scrape-token")
+        self.assertEqual(response.status_code, 200)
+        body = response.content.decode()
+        self.assertIn('cloudbite_http_request_duration_seconds_count{method="GET",status="200",view="review-list"} 1.0', body)
+        self.assertIn('cloudbite_db_queries_per_request_bucket{le="+Inf",view="review-list"} 1.0', body)
+
+    def test_metrics_are_summed_across_worker_processes(self):
+        observe = "from core import metrics; metrics.DB_QUERIES.labels('menu-list').observe(2)"
+        expose = "from core import metrics; print(metrics.expose().decode())"
+        with tempfile.TemporaryDirectory() as directory:
+            env = {**os.environ, "PROMETHEUS_MULTIPROC_DIR": directory}
+            results = [
+                subprocess.run(
+                    [sys.executable, "manage.py", "shell", "-c", code],
+                    cwd=settings.BASE_DIR, env=env, capture_output=True, text=True, check=True,
+                )
+                for code in (observe, observe, expose)
+            ]
+        self.assertIn('cloudbite_db_queries_per_request_count{view="menu-list"} 2.0', results[-1].stdout)
+
+    @override_settings(SLOW_REQUEST_MS=0, SLOW_REQUEST_QUERY_SAMPLE_RATE=1.0)
+    def test_sampled_slow_request_logs_queries(self):
+        with self.assertLogs("core.performance", "WARNING") as logs:
+            self.client.get("/api/reviews/")
+        self.assertIn('FROM "core_review"', logs.output[0])
+
+
+class RowSerializerTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username="rowan", password="secret-pass")
+        cls.menu_items = MenuItem.objects.bulk_create([
+            MenuItem(title="Ramen", description="Noodles", price=Decimal("12.50"), image="image/upload/v1712/menu/ramen.jpg"),
+            MenuItem(title="Gyoza", description="Dumplings", price=Decimal("6"), rating_average=4.25, review_count=4),
+        ])
+        cls.orders = Order.objects.bulk_create(
+            Order(user=cls.user, total_price=Decimal("31.00"), is_paid=bool(i % 2)) for i in range(3)
+        )
+        OrderItem.objects.bulk_create(
+            OrderItem(order=order, menu_item=item, quantity=2, price_at_order=item.price)
+            for order in cls.orders[:2]
+            for item in cls.menu_items
+        )
+
+    def setUp(self):
+        self.enterContext(loadtest.stub_cloudinary())
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def assertSameJSON(self, fast, slow):
+        renderer = JSONRenderer()
+        self.assertEqual(renderer.render(fast), renderer.render(slow))
+
+    def test_menu_items_match_model_serializer(self):
+        rows = MenuItem.objects.order_by("id").values(*menu_item_rows.columns)
+        self.assertSameJSON(menu_item_rows.serialize(rows), MenuItemSerializer(MenuItem.objects.order_by("id"), many=True).data)
+
+    def test_orders_match_model_serializer(self):
+        orders = Order.objects.order_by("id")
+        self.assertSameJSON(
+            order_rows.serialize(orders.values(*order_rows.columns)),
+            OrderSerializer(orders.prefetch_related("order_items__menu_item"), many=True).data,
+        )
+
+    def test_order_endpoints(self):
+        order = self.orders[0]
+        response = self.client.get(f"/api/orders/{order.id}/")
+        self.assertEqual(response.content, JSONRenderer().render(OrderSerializer(order).data))
+        self.assertEqual(self.client.get("/api/orders/999999/").status_code, 404)
+
+        other = User.objects.create_user(username="mallory", password="secret-pass")
+        self.client.force_authenticate(other)
+        self.assertEqual(self.client.get(f"/api/orders/{order.id}/").status_code, 404)
+
+    def test_menu_detail_and_pagination(self):
+        item = MenuItem.objects.get(pk=self.menu_items[0].pk)
+        response = self.client.get(f"/api/menu-items/{item.id}/?format=json")
+        self.assertEqual(response.content, JSONRenderer().render(MenuItemSerializer(item).data))
+
+        page = self.client.get("/api/menu-items/?page_size=1&format=json").json()
+        self.assertEqual(len(page["results"]), 1)
+        self.assertEqual(len(self.client.get(page["next"]).json()["results"]), 1)
+
+
+class MenuSearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.pasta = MenuItem.objects.create(title="Pasta Arrabbiata", description="Spicy tomato", price=Decimal("9.00"))
+        cls.pizza = MenuItem.objects.create(title="Pizza", description="With a side of pasta salad", price=Decimal("11.00"))
+        cls.salad = MenuItem.objects.create(title="Green Salad", description="Crisp leaves", price=Decimal("6.00"))
+
+    def setUp(self):
+        bump_catalog_version()
+        self.addCleanup(bump_catalog_version)
+        self.client = APIClient()
+
+    def search(self, term):
+        response = self.client.get("/api/menu-items/", {"search": term, "format": "json"})
+        self.assertEqual(response.status_code, 200)
+        return [item["title"] for item in response.json()]
+
+    def test_title_matches_rank_first(self):
+        self.assertEqual(self.search("pasta"), ["Pasta Arrabbiata", "Pizza"])
+        self.assertEqual(self.search("salad"), ["Green Salad", "Pizza"])
+
+    def test_prefix_and_all_terms(self):
+        self.assertEqual(self.search("pas"), ["Pasta Arrabbiata", "Pizza"])
+        self.assertEqual(self.search("spic tom"), ["Pasta Arrabbiata"])
+        self.assertEqual(self.search("pasta leaves"), [])
+
+    def test_detail_routes_accept_a_search(self):
+        # get_object() runs the filter backends too, then filters the result by pk
+        response = self.client.get(f"/api/menu-items/{self.pasta.id}/", {"search": "pasta", "format": "json"})
+        self.assertEqual(response.json()["title"], "Pasta Arrabbiata")
+        response = self.client.get(f"/api/menu-items/{self.pasta.id}/reviews/", {"search": "pasta", "format": "json"})
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get(f"/api/menu-items/{self.salad.id}/", {"search": "pasta", "format": "json"})
+        self.assertEqual(response.status_code, 404)
+
+    def test_index_follows_updates_and_deletes(self):
+        self.salad.title = "Caesar"
+        self.salad.save()
+        self.assertEqual(self.search("caesar"), ["Caesar"])
+        self.assertEqual(self.search("green"), [])
+
+        self.pasta.delete()
+        self.assertEqual(self.search("pasta"), ["Pizza"])
+
+    def test_inverted_index_ranks_the_same(self):
+        # The fallback for databases without FTS5 or tsvector
+        backend = search.InvertedIndexBackend()
+        ranked = backend.search(MenuItem.objects.all(), ["pas"])
+        self.assertEqual([item.title for item in ranked], ["Pasta Arrabbiata", "Pizza"])
+        self.salad.delete()
+        bump_catalog_version()
+        self.assertEqual(list(backend.search(MenuItem.objects.all(), ["salad"])), [self.pizza])
+
+
+class CatalogCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.soup = MenuItem.objects.create(title="Soup", description="Hot", price=Decimal("4.00"))
+
+    def setUp(self):
+        bump_catalog_version()
+        self.addCleanup(bump_catalog_version)
+        reset_stats()
+        self.client = APIClient()
+
+    def test_hit_after_miss(self):
+        first = self.client.get("/api/menu-items/?format=json")
+        with self.assertNumQueries(0):
+            second = self.client.get("/api/menu-items/?format=json")
+        self.assertEqual((first["X-Cache"], second["X-Cache"]), ("MISS", "HIT"))
+        self.assertEqual(second.content, first.content)
+        # Other query strings and formats are cached on their own
+        self.assertEqual(self.client.get("/api/menu-items/?format=json&page_size=5")["X-Cache"], "MISS")
+        self.assertEqual((get_stats()["hits"], get_stats()["misses"]), (1, 2))
+
+    def test_menu_writes_invalidate(self):
+        self.client.get(f"/api/menu-items/{self.soup.id}/?format=json")
+        version = get_catalog_version()
+        self.soup.price = Decimal("4.50")
+        self.soup.save()
+        self.assertGreater(get_catalog_version(), version)
+
+        response = self.client.get(f"/api/menu-items/{self.soup.id}/?format=json")
+        self.assertEqual((response["X-Cache"], response.json()["price"]), ("MISS", "4.50"))
+        self.soup.delete()
+        self.assertEqual(self.client.get(f"/api/menu-items/{self.soup.id}/?format=json").status_code, 404)
+
+    def test_version_survives_eviction_and_clear_command(self):
+        version = get_catalog_version()
+        self.assertEqual(bump_catalog_version(), version + 1)
+        # An evicted version is reseeded from the clock rather than reusing old keys
+        get_cache().delete(VERSION_KEY)
+        self.assertNotIn(get_catalog_version(), (version, version + 1))
+
+        version = get_catalog_version()
+        out = StringIO()
+        call_command("menu_cache_stats", "--clear", stdout=out)
+        self.assertIn("Catalog cache invalidated", out.getvalue())
+        self.assertEqual(get_catalog_version(), version + 1)
+
+    def test_locmem_is_refused_without_debug(self):
+        env = {**os.environ, "DEBUG": "False", "MENU_CACHE_BACKEND": "locmem"}
+        result = subprocess.run([sys.executable, "manage.py", "check"], cwd=settings.BASE_DIR, env=env, capture_output=True, text=True)
+        self.assertNotEqual(result.returncode, 0)
+        self.assertIn("MENU_CACHE_BACKEND=locmem is per process", result.stderr)
+
+
+class RendererTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username="ren", password="secret-pass")
+        cls.items = MenuItem.objects.bulk_create(
+            MenuItem(title=f"Curry {i}", description="Mild \u2028 and creamy " * 5, price=Decimal("9.95") + i)
+            for i in range(30)
+        )
+
+    def setUp(self):
+        # bulk_create skips the signal that moves the catalog version; keep cached pages out of other tests
+        bump_catalog_version()
+        self.addCleanup(bump_catalog_version)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_orjson_matches_drf_json(self):
+        data = {
+            "price": Decimal("9.95"),
+            "when": timezone.datetime(2026, 5, 4, 3, 2, 1, 123456, tzinfo=datetime.timezone.utc),
+            "day": timezone.datetime(2026, 5, 4).date(),
+            "lazy": _("Token has been revoked"),
+            "big": 2 ** 70,
+            "text": "caf\u00e9 \u2029",
+            "nested": [{"a": None, "b": True, "c": 1.5}],
+        }
+        self.assertEqual(renderers.ORJSONRenderer().render(data), JSONRenderer().render(data))
+        page = self.client.get("/api/menu-items/?page_size=30&format=json").data
+        self.assertEqual(renderers.ORJSONRenderer().render(page), JSONRenderer().render(page))
+
+    def test_parser(self):
+        response = self.client.post("/api/cart-items/", b'{"menu_item_id": ', content_type="application/json")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("JSON parse error", response.json()["detail"])
+
+    def test_messagepack(self):
+        response = self.client.get("/api/menu-items/?page_size=30", HTTP_ACCEPT="application/msgpack")
+        self.assertEqual(response["Content-Type"], "application/msgpack")
+        self.assertEqual(msgpack.unpackb(response.content), self.client.get("/api/menu-items/?page_size=30&format=json").json())
+        # Cached under its own key, like JSON
+        again = self.client.get("/api/menu-items/?page_size=30", HTTP_ACCEPT="application/msgpack")
+        self.assertEqual((again["X-Cache"], again.content), ("HIT", response.content))
+
+        body = msgpack.packb({"menu_item_id": self.items[0].id, "quantity": 2})
+        response = self.client.post("/api/cart-items/", body, content_type="application/msgpack")
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(CartItem.objects.get(user=self.user).quantity, 2)
+
+    def test_large_responses_are_gzipped(self):
+        large = self.client.get("/api/menu-items/?page_size=30&format=json", HTTP_ACCEPT_ENCODING="gzip")
+        self.assertEqual(large["Content-Encoding"], "gzip")
+        self.assertEqual(json.loads(gzip.decompress(large.content))["results"][0]["title"], "Curry 29")
+
+        small = self.client.get(f"/api/menu-items/{self.items[0].id}/?format=json", HTTP_ACCEPT_ENCODING="gzip")
+        self.assertFalse(small.has_header("Content-Encoding"))
+
+
+class MenuChangeTests(TestCase):
+    def setUp(self):
+        bump_catalog_version()
+        self.addCleanup(bump_catalog_version)
+        self.client = APIClient()
+
+    def changes(self, since):
+        response = self.client.get(f"/api/menu-items/changes/?since={since}&format=json")
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_changes_since_a_version(self):
+        soup = MenuItem.objects.create(title="Soup", description="Hot", price=Decimal("4.00"))
+        salad = MenuItem.objects.create(title="Salad", description="Cold", price=Decimal("6.00"))
+        start = self.changes(0)
+        self.assertEqual([item["title"] for item in start["items"]], ["Soup", "Salad"])
+        self.assertEqual((start["deleted"], start["has_more"]), ([], False))
+
+        unchanged = self.changes(start["version"])
+        self.assertEqual((unchanged["version"], unchanged["items"], unchanged["deleted"]), (start["version"], [], []))
+
+        soup.price = Decimal("4.50")
+        soup.save()
+        salad_id = salad.id
+        salad.delete()
+        delta = self.changes(start["version"])
+        self.assertEqual([(item["id"], item["price"]) for item in delta["items"]], [(soup.id, "4.50")])
+        self.assertEqual(delta["deleted"], [salad_id])
+        self.assertGreater(delta["version"], start["version"])
+
+        # One entry per item however often it changes, so the log stays as long as the menu
+        for price in ("4.60", "4.70"):
+            soup.price = Decimal(price)
+            soup.save()
+        self.assertEqual(MenuChange.objects.count(), 2)
+        self.assertEqual(self.changes(delta["version"])["items"][0]["price"], "4.70")
+
+    def test_rating_changes_and_paging(self):
+        user = User.objects.create_user(username="kim", password="secret-pass")
+        items = [MenuItem.objects.create(title=f"Dish {i}", description="Tasty", price=Decimal("5.00")) for i in range(3)]
+        version = MenuChange.objects.latest("id").id
+        self.client.force_authenticate(user)
+        self.client.post("/api/reviews/", {"menu_item": items[0].id, "rating": 4, "comment": "Good"}, format="json")
+        delta = self.changes(version)
+        self.assertEqual([(item["id"], item["review_count"]) for item in delta["items"]], [(items[0].id, 1)])
+
+        version, first, _, has_more = menu_changes.changes_since(0, limit=2)
+        self.assertTrue(has_more)
+        self.assertEqual([item.id for item in first], [items[1].id, items[2].id])
+        version, rest, _, has_more = menu_changes.changes_since(version, limit=2)
+        self.assertEqual(([item.id for item in rest], has_more), ([items[0].id], False))
+
+    def test_invalid_version(self):
+        self.assertEqual(self.client.get("/api/menu-items/changes/?since=latest").status_code, 400)
+
+    def test_transaction_pages_keep_each_transaction_whole(self):
+        # How PostgreSQL pages: by writing transaction, holding back those newer than the oldest still running
+        items = [MenuItem.objects.create(title=f"Dish {i}", description="Tasty", price=Decimal("5.00")) for i in range(4)]
+        for item, txid in zip(items, (10, 12, 12, 20)):
+            MenuChange.objects.filter(menu_item_id=item.id).update(txid=txid)
+        running = MenuChange.objects.filter(txid__lt=20)
+
+        version, first, _, has_more = menu_changes.page_changes(running, "txid", 0, 2, caught_up=19)
+        self.assertEqual((version, [item.id for item in first], has_more), (10, [items[0].id], True))
+        version, rest, _, has_more = menu_changes.page_changes(running, "txid", version, 1, caught_up=19)
+        self.assertEqual((version, [item.id for item in rest], has_more), (12, [items[1].id, items[2].id], True))
+        version, rest, _, has_more = menu_changes.page_changes(running, "txid", version, 1, caught_up=19)
+        self.assertEqual((version, list(rest), has_more), (19, [], False))
+
+    def test_etag_on_the_menu(self):
+        MenuItem.objects.create(title="Bun", description="Soft", price=Decimal("2.00"))
+        first = self.client.get("/api/menu-items/?format=json")
+        etag = first["ETag"]
+        self.assertEqual(self.client.get("/api/menu-items/?format=json", HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        # GZipMiddleware sends the tag back weakened
+        self.assertEqual(self.client.get("/api/menu-items/?format=json", HTTP_IF_NONE_MATCH=f"W/{etag}").status_code, 304)
+        self.assertEqual(self.client.get("/api/menu-items/?format=msgpack", HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+        MenuItem.objects.create(title="Roll", description="Crisp", price=Decimal("2.50"))
+        changed = self.client.get("/api/menu-items/?format=json", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed["ETag"], etag)
+
+
+# The primary stands in for the replica: what matters is which reads the router sends there
+@override_settings(DATABASE_REPLICAS=["default"])
+class ReplicaRoutingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username="rae", password="secret-pass")
+        cls.other = User.objects.create_user(username="sam", password="secret-pass")
+        cls.dish = MenuItem.objects.create(title="Stew", description="Slow", price=Decimal("9.00"))
+
+    def setUp(self):
+        bump_catalog_version()
+        self.addCleanup(bump_catalog_version)
+        self.unpin()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+        self.routed = []
+        db_for_read = routers.PrimaryReplicaRouter.db_for_read
+
+        def spy(router, model, **hints):
+            self.routed.append(db_for_read(router, model, **hints))
+            return self.routed[-1]
+
+        routers.PrimaryReplicaRouter.db_for_read = spy
+        self.addCleanup(setattr, routers.PrimaryReplicaRouter, "db_for_read", db_for_read)
+
+    def unpin(self):
+        # What the pins' expiry does after DATABASE_REPLICA_PIN_SECONDS
+        keys = [routers.CATALOG_PIN, routers.user_pin(self.user.pk), routers.user_pin(self.other.pk)]
+        caches[settings.DATABASE_PIN_CACHE].delete_many([routers._pin_key(key) for key in keys])
+
+    def reads(self, path, client=None):
+        self.routed.clear()
+        response = (client or self.client).get(path, {"format": "json"})
+        self.assertEqual(response.status_code, 200)
+        return set(self.routed)
+
+    def test_reads_go_to_the_replica_until_the_user_writes(self):
+        self.assertEqual(self.reads("/api/orders/"), {"default"})
+        self.assertEqual(self.reads("/api/reviews/"), {"default"})
+
+        # The Stripe webhook creates the order
+        Order.objects.create(user=self.user, total_price=Decimal("9.00"))
+        self.assertEqual(self.reads("/api/orders/"), {None})
+        other = APIClient()
+        other.force_authenticate(self.other)
+        self.assertEqual(self.reads("/api/orders/", other), {"default"})
+
+        self.unpin()
+        self.assertEqual(self.reads("/api/orders/"), {"default"})
+
+    def test_cart_and_review_writes_pin_the_user(self):
+        self.client.post("/api/cart-items/", {"menu_item_id": self.dish.id, "quantity": 1}, format="json")
+        self.assertEqual(self.reads("/api/orders/"), {None})
+
+        self.unpin()
+        self.client.delete(f"/api/cart-items/{CartItem.objects.get(user=self.user).id}/")
+        self.assertEqual(self.reads("/api/reviews/"), {None})
+
+        self.unpin()
+        self.routed.clear()
+        response = self.client.post("/api/reviews/", {"menu_item": self.dish.id, "rating": 5, "comment": "Rich"}, format="json")
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(set(self.routed), {None})
+        self.assertEqual(self.reads(f"/api/reviews/{response.json()['id']}/"), {None})
+
+    def test_menu_changes_pin_menu_reads(self):
+        anonymous = APIClient()
+        self.assertEqual(self.reads("/api/menu-items/", anonymous), {"default"})
+        self.dish.price = Decimal("9.50")
+        self.dish.save()
+        # A cache miss read from a lagging replica would be stored under the new catalog version
+        self.assertEqual(self.reads("/api/menu-items/", anonymous), {None})
+        self.assertEqual(self.reads("/api/orders/"), {"default"})
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_without_replicas(self):
+        Order.objects.create(user=self.user, total_price=Decimal("9.00"))
+        self.assertFalse(routers.pinned(routers.user_pin(self.user.pk)))
+        self.assertEqual(self.reads("/api/orders/"), {None})
+
+
+# A real replica in its own SQLite file, with the web and worker in separate processes
+class ReplicaProcessTests(TestCase):
+    setup = (
+        "import shutil; from django.conf import settings; from django.core.management import call_command; "
+        "from django.contrib.auth.models import User; call_command('migrate', verbosity=0); "
+        "User.objects.create_user(username='rae', password='secret-pass'); "
+        "shutil.copy(settings.DATABASES['default']['NAME'], settings.DATABASES['replica1']['NAME'])"
+    )
+    worker = (
+        "from django.contrib.auth.models import User; from core.models import Order; "
+        "Order.objects.create(user=User.objects.get(username='rae'), total_price=9)"
+    )
+    web = (
+        "from django.contrib.auth.models import User; from rest_framework.test import APIClient; "
+        "client = APIClient(); client.force_authenticate(User.objects.get(username='rae')); "
+        "print(len(client.get('/api/orders/', {'format': 'json'}).json()['results']))"
+    )
+
+    def setUp(self):
+        directory = Path(self.enterContext(tempfile.TemporaryDirectory()))
+        self.pin_cache = directory / "cache"
+        self.env = {
+            **os.environ,
+            "DATABASE_URL": f"sqlite:///{directory / 'primary.sqlite3'}",
+            "DATABASE_REPLICA_URLS": f"sqlite:///{directory / 'replica.sqlite3'}",
+            "MENU_CACHE_BACKEND": "file",
+            "MENU_CACHE_DIR": str(self.pin_cache),
+            "ALLOWED_HOSTS": "testserver",
+        }
+
+    def manage(self, *args, **env):
+        return subprocess.run(
+            [sys.executable, "manage.py", *args],
+            cwd=settings.BASE_DIR, env={**self.env, **env}, capture_output=True, text=True,
+        )
+
+    def test_worker_writes_are_read_from_the_primary(self):
+        self.assertEqual(self.manage("shell", "-c", self.setup).returncode, 0)
+        self.assertEqual(self.manage("shell", "-c", self.worker).returncode, 0)
+        # The replica never got the order; the worker's pin sends the web process to the primary
+        self.assertEqual(self.manage("shell", "--no-imports", "-c", self.web).stdout.strip(), "1")
+
+        shutil.rmtree(self.pin_cache)
+        self.assertEqual(self.manage("shell", "--no-imports", "-c", self.web).stdout.strip(), "0")
+
+    def test_replicas_refuse_a_per_process_pin_cache(self):
+        result = self.manage("check", MENU_CACHE_BACKEND="locmem", DEBUG="True")
+        self.assertNotEqual(result.returncode, 0)
+        self.assertIn("DATABASE_PIN_CACHE", result.stderr)
+
+
+class MenuItemImageTests(TestCase):
+    def setUp(self):
+        # A fake cloud name and local uploads, so nothing goes over the network
+        self.enterContext(loadtest.stub_cloudinary())
+
+    def test_urls_are_built_on_save(self):
+        item = MenuItem.objects.create(
+            title="Bao", description="Buns", price=Decimal("7.00"), image="image/upload/v1712/menu/bao.jpg"
+        )
+        self.assertEqual(item.image_url, "https://res.cloudinary.com/cloudbite-loadtest/image/upload/v1712/menu/bao.jpg")
+        self.assertEqual({name: variant["width"] for name, variant in item.image_variants.items()},
+                         {"thumbnail": 160, "card": 480, "hero": 1200})
+        self.assertIn("/c_limit,f_auto,q_auto,w_480/", item.image_variants["card"]["url"])
+
+        data = APIClient().get(f"/api/menu-items/{item.id}/?format=json").json()
+        self.assertEqual(data["image"], item.image_url)
+        self.assertEqual(data["image_variants"], item.image_variants)
+        self.assertEqual(data["image_srcset"].count("w, "), 2)
+        self.assertTrue(data["image_srcset"].endswith(" 1200w"))
+
+    def test_uploaded_file_gets_urls(self):
+        item = MenuItem(title="Udon", description="Noodles", price=Decimal("9.00"))
+        item.image = SimpleUploadedFile("udon.jpg", b"not really a jpeg", content_type="image/jpeg")
+        item.save()
+        item.refresh_from_db()
+        self.assertTrue(item.image_url.startswith("https://res.cloudinary.com/cloudbite-loadtest/"))
+        self.assertEqual(len(item.image_variants), 3)
+
+    def test_no_image(self):
+        item = MenuItem.objects.create(title="Tea", description="Hot", price=Decimal("2.00"))
+        self.assertEqual((item.image_url, item.image_variants), (None, {}))
+        data = APIClient().get(f"/api/menu-items/{item.id}/?format=json").json()
+        self.assertEqual((data["image"], data["image_srcset"]), (None, None))
+
+    def test_backfill_command(self):
+        MenuItem.objects.bulk_create(
+            MenuItem(title=f"Dish {i}", description="Tasty", price=Decimal("5.00"), image=f"menu/dish_{i}")
+            for i in range(3)
+        )
+        out = StringIO()
+        call_command("backfill_image_urls", stdout=out)
+        self.assertIn("Updated 3 of 3", out.getvalue())
+        self.assertFalse(MenuItem.objects.filter(image_url__isnull=True).exists())
+
+        call_command("backfill_image_urls", stdout=out)
+        self.assertIn("Updated 0 of 3", out.getvalue())
+
+    def test_migration_backfills_existing_items(self):
+        migration = importlib.import_module("core.migrations.0012_menuitem_image_urls")
+        [item] = MenuItem.objects.bulk_create(
+            [MenuItem(title="Pho", description="Soup", price=Decimal("11.00"), image="image/upload/v1712/menu/pho.jpg")]
+        )
+        MenuItem.objects.bulk_create([MenuItem(title="Water", description="Still", price=Decimal("1.00"))])
+
+        migration.backfill_image_urls(django_apps, connection.schema_editor())
+        item.refresh_from_db()
+        stored = item.image_url, item.image_variants
+        item.refresh_image_urls()
+        self.assertEqual(stored, (item.image_url, item.image_variants))
+        self.assertEqual(MenuItem.objects.get(title="Water").image_url, None)
+
+
+class OrderExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user(username="finance", password="secret-pass", is_staff=True)
+        cls.customer = User.objects.create_user(username="bea", password="secret-pass")
+        cls.menu_item = MenuItem.objects.create(title="Pho", description="Soup, with herbs", price=Decimal("11.50"))
+        cls.orders = Order.objects.bulk_create(
+            Order(user=cls.customer, total_price=Decimal("23.00"), is_paid=True, status=status)
+            for status in ("success", "canceled", "success")
+        )
+        # Spread over three days; bulk_create leaves auto_now_add at "now"
+        for day, order in enumerate(cls.orders, 1):
+            Order.objects.filter(pk=order.pk).update(ordered_at=timezone.make_aware(timezone.datetime(2026, 3, day, 12)))
+        OrderItem.objects.bulk_create(
+            OrderItem(order=order, menu_item=cls.menu_item, quantity=2, price_at_order=Decimal("11.50"))
+            for order in cls.orders[:2]
+        )
+
+    def export(self, query="", user=None):
+        client = APIClient()
+        client.force_authenticate(user or self.staff)
+        return client.get(f"/api/orders/export/{query}")
+
+    def test_staff_only(self):
+        self.assertEqual(self.export(user=self.customer).status_code, 403)
+        self.assertEqual(APIClient().get("/api/orders/export/").status_code, 401)
+
+    def test_csv_has_a_line_per_item(self):
+        response = self.export()
+        self.assertTrue(response.streaming)
+        self.assertEqual(response["Content-Type"], "text/csv")
+        rows = list(csv.reader(b"".join(response.streaming_content).decode().splitlines()))
+        self.assertEqual(rows[0][:3], ["order_id", "ordered_at", "user_id"])
+        self.assertEqual([row[0] for row in rows[1:]], [str(order.id) for order in self.orders])
+        self.assertEqual(rows[1][10:], ["Pho", "2", "11.50"])
+        # The third order has no items left, but accounting still needs it
+        self.assertEqual(rows[3][8:], ["", "", "", "", ""])
+
+    def test_streams_under_asgi(self):
+        token = ClaimsRefreshToken.for_user(self.staff).access_token
+        request = loadtest.Request("export", "GET", "/api/orders/export/", b"", {"Authorization": f"Bearer {token}"})
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter("always")
+            response = async_to_sync(loadtest.call_asgi)(asgi_application, request)
+        # Django warns when it has to buffer a sync iterator
+        self.assertEqual([str(warning.message) for warning in caught], [])
+        self.assertEqual(response.content, b"".join(self.export().streaming_content))
+
+    def test_ndjson_filters(self):
+        response = self.export("?export_format=ndjson&since=2026-03-02&until=2026-03-03&status=success")
+        orders = [json.loads(line) for line in b"".join(response.streaming_content).decode().splitlines()]
+        self.assertEqual([order["id"] for order in orders], [self.orders[2].id])
+        self.assertEqual(orders[0]["user"], {"id": self.customer.id, "username": "bea"})
+        self.assertEqual(orders[0]["items"], [])
+
+        response = self.export("?export_format=ndjson&until=2026-03-01")
+        orders = [json.loads(line) for line in b"".join(response.streaming_content).decode().splitlines()]
+        self.assertEqual(len(orders), 1)
+        self.assertEqual(orders[0]["items"][0]["price_at_order"], "11.50")
+
+    def test_invalid_parameters(self):
+        for query in ("?since=yesterday", "?status=lost", "?export_format=xml"):
+            self.assertEqual(self.export(query).status_code, 400, query)
+
+    def test_command(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / "orders.csv"
+            call_command("export_orders", str(path), "--status", "canceled", stderr=StringIO())
+            lines = path.read_text().splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertTrue(lines[1].startswith(f"{self.orders[1].id},"))
+
+
+class MenuImportExportTests(TestCase):
+    def setUp(self):
+        self.enterContext(loadtest.stub_cloudinary())
+        self.dir = Path(self.enterContext(tempfile.TemporaryDirectory()))
+
+    def run_import(self, name, content, *args):
+        path = self.dir / name
+        path.write_text(content, encoding="utf-8")
+        out, err = StringIO(), StringIO()
+        call_command("import_menu", str(path), *args, stdout=out, stderr=err)
+        return out.getvalue(), err.getvalue()
+
+    def test_csv_import_creates_updates_and_reports_bad_rows(self):
+        existing = MenuItem.objects.create(title="Soup", description="Hot", price=Decimal("4.00"))
+        (self.dir / "ramen.jpg").write_bytes(b"not really a jpeg")
+        content = (
+            "id,title,description,price,image\n"
+            f"{existing.id},Miso soup,Hot,4.50,\n"
+            ",Ramen,Noodles,12.00,ramen.jpg\n"
+            ",Gyoza,Dumplings,6.25,image/upload/v7/menu/gyoza.jpg\n"
+            ",,No title,1.00,\n"
+            ",Sake,Rice wine,lots,\n"
+            "999999,Ghost,Gone,1.00,\n"
+        )
+        out, err = self.run_import("menu.csv", content, "--batch-size", "2")
+
+        self.assertIn("Created 2 and updated 1 menu items, uploaded 1 images (3 rows skipped)", out)
+        self.assertIn("Line 5: title:", err)
+        self.assertIn("Line 6: price:", err)
+        self.assertIn("Line 7: id: menu item 999999 does not exist", err)
+        existing.refresh_from_db()
+        self.assertEqual((existing.title, existing.price), ("Miso soup", Decimal("4.50")))
+        ramen, gyoza = MenuItem.objects.get(title="Ramen"), MenuItem.objects.get(title="Gyoza")
+        self.assertTrue(ramen.image_url.startswith("https://res.cloudinary.com/cloudbite-loadtest/"))
+        self.assertEqual(gyoza.image_url, "https://res.cloudinary.com/cloudbite-loadtest/image/upload/v7/menu/gyoza.jpg")
+        self.assertEqual(len(gyoza.image_variants), 3)
+
+    def test_blank_image_leaves_the_existing_image(self):
+        item = MenuItem.objects.create(
+            title="Soup", description="Hot", price=Decimal("4.00"), image="image/upload/v1/menu/soup.jpg"
+        )
+        item.refresh_from_db()
+        image, image_url = str(item.image), item.image_url
+        self.run_import("menu.csv", f"id,title,description,price,image\n{item.id},Miso soup,Hot,4.50,\n")
+        item.refresh_from_db()
+        self.assertEqual(item.title, "Miso soup")
+        self.assertEqual((str(item.image), item.image_url), (image, image_url))
+
+    def test_created_items_are_logged_without_returned_ids(self):
+        # MySQL's bulk INSERT doesn't return the new ids
+        features = connection.features
+        self.addCleanup(setattr, features, "can_return_columns_from_insert", features.can_return_columns_from_insert)
+        features.can_return_columns_from_insert = False
+        MenuItem.objects.create(title="Tea", description="Hot", price=Decimal("2.00"))
+        MenuChange.objects.all().delete()
+        self.run_import("menu.csv", "id,title,description,price,image\n,Tea,Hot,2.00,\n,Tea,Iced,2.00,\n,Tea,Hot,2.0,\n")
+
+        created = list(MenuItem.objects.order_by("id").values_list("id", flat=True)[1:])
+        self.assertEqual(sorted(MenuChange.objects.values_list("menu_item_id", flat=True)), created)
+
+    def test_dry_run_writes_nothing(self):
+        out, _ = self.run_import("menu.ndjson", '{"title": "Tea", "description": "Hot", "price": "2.00"}\n', "--dry-run")
+        self.assertIn("Would create 1 and update 0 menu items", out)
+        self.assertFalse(MenuItem.objects.exists())
+
+    def test_export_import_round_trip(self):
+        MenuItem.objects.bulk_create(
+            MenuItem(title=f"Dish {i}", description="Tasty \"quoted\", with commas", price=Decimal("5.10") + i,
+                     image=f"image/upload/v1/menu/dish_{i}.jpg")
+            for i in range(25)
+        )
+        for fmt in ("ndjson", "csv"):
+            path = self.dir / f"menu.{fmt}"
+            call_command("export_menu", str(path), "--chunk-size", "10", stderr=StringIO())
+            exported = list(menu_io.read_rows(path.open(newline="", encoding="utf-8"), fmt))
+            self.assertEqual(len(exported), 25)
+            self.assertEqual(menu_io.clean_row(exported[0][1])["image"], "image/upload/v1/menu/dish_0.jpg")
+
+            before = list(MenuItem.objects.order_by("id").values_list("id", "title", "description", "price", "image"))
+            # Five batches of five, each an id lookup, then in a savepoint one UPDATE and the change log's DELETE and INSERT
+            with self.assertNumQueries(5 * 6):
+                call_command("import_menu", str(path), "--batch-size", "5", stdout=StringIO())
+            after = list(MenuItem.objects.order_by("id").values_list("id", "title", "description", "price", "image"))
+            self.assertEqual([row[:4] for row in after], [row[:4] for row in before])
+            self.assertEqual(MenuItem.objects.count(), 25)
+
+
+@override_settings(REVOKED_TOKENS_SYNC_SECONDS=3600)
+class ClaimsAuthenticationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username="jun", password="secret-pass", email="jun@example.com")
+
+    def setUp(self):
+        user_cache.clear()
+        revoked_tokens.sync()
+        self.client = APIClient()
+
+    def authenticate(self, token_class=ClaimsRefreshToken):
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token_class.for_user(self.user).access_token}")
+
+    def test_login_tokens_carry_claims(self):
+        response = self.client.post("/api/token/", {"username": "jun", "password": "secret-pass"}, format="json")
+        access = response.json()["access"]
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {access}")
+        with self.assertNumQueries(0):
+            response = self.client.get("/api/me/")
+        self.assertEqual(response.json(), {"id": self.user.id, "username": "jun"})
+
+    def test_other_fields_load_once_through_the_cache(self):
+        self.authenticate()
+        request = self.client.get("/api/me/").wsgi_request
+        user = request.user
+        self.assertEqual(user.get_deferred_fields(), {f.attname for f in User._meta.concrete_fields} - {"id", "username", "is_active"})
+        with self.assertNumQueries(1):
+            self.assertEqual(user.email, "jun@example.com")
+            self.assertFalse(user.is_staff)
+        self.assertEqual(user, self.user)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get("/api/me/").wsgi_request.user.email, "jun@example.com")
+
+    def test_deactivated_user_is_refused(self):
+        self.authenticate()
+        self.assertEqual(self.client.get("/api/me/").status_code, 200)
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.get("/api/me/").status_code, 401)
+
+    def test_deleted_user_is_refused(self):
+        self.authenticate()
+        self.assertEqual(self.client.get("/api/me/").status_code, 200)
+        self.user.delete()
+        self.assertEqual(self.client.get("/api/me/").status_code, 401)
+        # A write would otherwise fail on the user foreign key
+        self.assertEqual(self.client.post("/api/cart-items/", {"menu_item_id": 1, "quantity": 1}, format="json").status_code, 401)
+
+    def test_deactivation_reaches_other_processes_on_sync(self):
+        self.authenticate()
+        self.assertEqual(self.client.get("/api/me/").status_code, 200)
+        # Another process deactivates the user: its own caches change, ours don't until the sync
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        revoke_user_tokens(self.user.pk)
+        revoked_tokens.clear()
+        revoked_tokens.sync()
+        self.assertEqual(self.client.get("/api/me/").status_code, 401)
+
+        # Tokens issued after the deactivation work once the user is active again
+        User.objects.filter(pk=self.user.pk).update(is_active=True)
+        revoked_at = timezone.now() - timezone.timedelta(seconds=2)
+        RevokedToken.objects.filter(jti=user_revocation(self.user.pk)).update(revoked_at=revoked_at)
+        revoked_tokens.sync()
+        self.authenticate()
+        self.assertEqual(self.client.get("/api/me/").status_code, 200)
+
+    def test_tokens_without_claims_still_work(self):
+        self.authenticate(RefreshToken)
+        with self.assertNumQueries(1):
+            response = self.client.get("/api/me/")
+        self.assertEqual(response.json()["username"], "jun")
+
+    def test_ttl_cache_is_bounded_and_expires(self):
+        cache = TTLCache(maxsize=2, ttl=60)
+        for key in "abc":
+            cache.set(key, key.upper())
+        self.assertEqual((cache.get("a"), cache.get("c"), len(cache)), (None, "C", 2))
+        cache.invalidate("c")
+        self.assertIsNone(cache.get("c"))
+
+        cache.ttl = 0
+        cache.set("d", "D")
+        self.assertIsNone(cache.get("d"))
+
+
+@override_settings(REVOKED_TOKENS_SYNC_SECONDS=3600)
+class TokenRevocationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username="kai", password="secret-pass")
+
+    def setUp(self):
+        revoked_tokens.clear()
+        self.addCleanup(revoked_tokens.clear)
+        self.refresh = ClaimsRefreshToken.for_user(self.user)
+        self.access = self.refresh.access_token
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.access}")
+
+    def test_logout_revokes_access_and_refresh_tokens(self):
+        response = self.client.post("/api/logout/", {"refresh": str(self.refresh)}, format="json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.get("/api/me/").status_code, 401)
+
+        response = APIClient().post("/api/token/refresh/", {"refresh": str(self.refresh)}, format="json")
+        self.assertEqual(response.status_code, 401)
+
+    def test_cannot_revoke_someone_elses_refresh_token(self):
+        other = ClaimsRefreshToken.for_user(User.objects.create_user(username="lee", password="secret-pass"))
+        response = self.client.post("/api/logout/", {"refresh": str(other)}, format="json")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.get("/api/me/").status_code, 200)
+
+    def test_revocations_from_other_processes_arrive_on_sync(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get("/api/me/").status_code, 200)
+        RevokedToken.objects.create(jti=self.access["jti"], expires_at=timezone.now() + timezone.timedelta(minutes=5))
+
+        # Still served from memory until the next sync
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get("/api/me/").status_code, 200)
+        with override_settings(REVOKED_TOKENS_SYNC_SECONDS=0):
+            self.assertEqual(self.client.get("/api/me/").status_code, 401)
+
+    def test_prune_tokens_deletes_only_expired_rows(self):
+        past, future = timezone.now() - timezone.timedelta(days=1), timezone.now() + timezone.timedelta(days=1)
+        RevokedToken.objects.bulk_create(
+            RevokedToken(jti=f"jti-{i}", expires_at=past if i < 5 else future) for i in range(7)
+        )
+        self.client.post("/api/logout/", {"refresh": str(self.refresh)}, format="json")
+        OutstandingToken.objects.create(user=self.user, jti="old", token="old", expires_at=past)
+        BlacklistedToken.objects.create(token=OutstandingToken.objects.get(jti="old"))
+
+        out = StringIO()
+        call_command("prune_tokens", "--batch-size", "2", stdout=out)
+        self.assertIn("Deleted 1 expired outstanding refresh tokens", out.getvalue())
+        self.assertIn("Deleted 5 expired revoked access tokens", out.getvalue())
+        self.assertEqual(RevokedToken.objects.count(), 3)
+        self.assertEqual(BlacklistedToken.objects.count(), 1)
+
+
+@override_settings(ALLOWED_HOSTS=[loadtest.HOST, "testserver"], REVOKED_TOKENS_SYNC_SECONDS=3600)
+# Committed data: under ASGI the views query from the loop's executor threads, outside any test transaction
+class AsyncCheckoutTests(TransactionTestCase):
+    LATENCY = 0.3
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.fake_stripe = FakeStripeServer(latency=cls.LATENCY).start()
+        cls.addClassCleanup(cls.fake_stripe.stop)
+
+    def setUp(self):
+        self.users = User.objects.bulk_create(User(username=f"async{i}", password="!") for i in range(10))
+        self.item = MenuItem.objects.create(title="Ramen", description="Broth", price=Decimal("12.00"))
+        CartItem.objects.bulk_create(CartItem(user=user, menu_item=self.item, quantity=2) for user in self.users)
+        # Set the SDK up first, or its first use would replace the fake's address
+        integrations.get_stripe()
+        previous = stripe.api_key, stripe.api_base
+        stripe.api_key, stripe.api_base = "sk_test_fake", self.fake_stripe.url
+        self.addCleanup(setattr, stripe, "api_key", previous[0])
+        self.addCleanup(setattr, stripe, "api_base", previous[1])
+        revoked_tokens.sync()
+        self.client = APIClient()
+
+    def checkout(self, user):
+        token = ClaimsRefreshToken.for_user(user).access_token
+        return loadtest.Request(
+            "checkout", "POST", "/api/create-multi-checkout-session/", b"",
+            {"Authorization": f"Bearer {token}", "Content-Type": "application/json"},
+        )
+
+    def test_concurrent_checkouts_overlap_on_one_event_loop(self):
+        requests = [self.checkout(user) for user in self.users]
+        # The in-memory test database fails writers that collide instead of making them wait, as a file or
+        # PostgreSQL would, so the snapshots take turns; the threads they run on are what's checked
+        record, lock, threads = views.record_checkout_session, threading.Lock(), set()
+
+        def record_in_turn(*args):
+            threads.add(threading.get_ident())
+            with lock:
+                return record(*args)
+
+        views.record_checkout_session = record_in_turn
+        self.addCleanup(setattr, views, "record_checkout_session", record)
+
+        async def run_all():
+            return await asyncio.gather(*(loadtest.call_asgi(asgi_application, request) for request in requests))
+
+        start = time.perf_counter()
+        responses = async_to_sync(run_all)()
+        elapsed = time.perf_counter() - start
+
+        self.assertEqual([response.status for response in responses], [200] * len(self.users))
+        self.assertEqual(len({response.json()["sessionId"] for response in responses}), len(self.users))
+        # Run one after another, the Stripe latency alone would add up to 3s
+        self.assertLess(elapsed, self.LATENCY * len(self.users) / 2)
+        # Not queued on the one thread asgiref keeps for thread-sensitive code
+        self.assertGreater(len(threads), 1)
+
+    def test_sequential_checkouts_reuse_one_connection(self):
+        client = stripe.default_http_client._async_fallback_client
+        self.assertIsInstance(client, PooledHTTPXClient)
+        requests = [self.checkout(user) for user in self.users[:3]]
+
+        async def run_all():
+            statuses = [(await loadtest.call_asgi(asgi_application, request)).status for request in requests]
+            return statuses, client._client_async._transport._pool.connections
+
+        statuses, connections = async_to_sync(run_all)()
+        self.assertEqual(statuses, [200, 200, 200])
+        self.assertEqual(len(connections), 1)
+
+    def test_loop_clients_close_with_their_loop(self):
+        client = stripe.default_http_client._async_fallback_client
+        request = self.checkout(self.users[0])
+
+        async def checkout():
+            await loadtest.call_asgi(asgi_application, request)
+            return client._client_async
+
+        loop_client = async_to_sync(checkout)()
+        self.assertTrue(loop_client.is_closed)
+
+    def test_wsgi_checkouts_reuse_the_sync_session(self):
+        http_client = stripe.default_http_client
+        loop_clients, sessions = len(http_client._async_fallback_client._loop_clients), []
+        for user in self.users[:3]:
+            self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {ClaimsRefreshToken.for_user(user).access_token}")
+            self.assertEqual(self.client.post("/api/create-multi-checkout-session/").status_code, 200)
+            sessions.append(http_client._thread_local.session)
+        self.assertEqual(len(set(map(id, sessions))), 1)
+        # No loop-bound httpx clients: each WSGI request would have opened one
+        self.assertEqual(len(http_client._async_fallback_client._loop_clients), loop_clients)
+
+    def test_checkout_uses_the_drf_parsers_and_renderers(self):
+        self.client.force_authenticate(self.users[0])
+        body = msgpack.packb({"menu_item_id": self.item.id, "quantity": 2})
+        response = self.client.post(
+            "/api/create-checkout-session/", body, content_type="application/msgpack", HTTP_ACCEPT="application/msgpack"
+        )
+        self.assertEqual(response["Content-Type"], "application/msgpack")
+        session_id = msgpack.unpackb(response.content)["sessionId"]
+        self.assertEqual(CheckoutSession.objects.get(stripe_session_id=session_id).total_amount, 2400)
+
+    def test_missing_token_is_refused_like_drf(self):
+        response = APIClient().post("/api/create-multi-checkout-session/")
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.json(), {"detail": "Authentication credentials were not provided."})
+        self.assertEqual(response["WWW-Authenticate"], 'Bearer realm="api"')
+
+
+class CheckoutSnapshotTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.fake_stripe = FakeStripeServer().start()
+        cls.addClassCleanup(cls.fake_stripe.stop)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username="noor", password="secret-pass")
+        cls.items = MenuItem.objects.bulk_create(
+            MenuItem(title=f"Tapas {i}", description="Small plate", price=Decimal("3.10") + i) for i in range(60)
+        )
+
+    def setUp(self):
+        # Set the SDK up first, or its first use would replace the fake's address
+        integrations.get_stripe()
+        previous = stripe.api_key, stripe.api_base
+        stripe.api_key, stripe.api_base = "sk_test_fake", self.fake_stripe.url
+        self.addCleanup(setattr, stripe, "api_key", previous[0])
+        self.addCleanup(setattr, stripe, "api_base", previous[1])
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def fulfill(self, session_id):
+        session = self.fake_stripe.objects[session_id]
+        enqueue_event({"id": f"evt_{session_id}", "type": "checkout.session.completed", "data": {"object": session}})
+        process_batch("test-worker", 10)
+        return Order.objects.get(stripe_session_id=session_id)
+
+    def test_large_cart_round_trips_in_cents(self):
+        CartItem.objects.bulk_create(CartItem(user=self.user, menu_item=item, quantity=3) for item in self.items)
+        session_id = self.client.post("/api/create-multi-checkout-session/").json()["sessionId"]
+
+        checkout = CheckoutSession.objects.get(stripe_session_id=session_id)
+        self.assertEqual(checkout.items.count(), 60)
+        self.assertEqual(checkout.total_amount, sum(310 + i * 100 for i in range(60)) * 3)
+        self.assertEqual(self.fake_stripe.objects[session_id]["metadata"], {"user_id": str(self.user.id)})
+
+        order = self.fulfill(session_id)
+        self.assertEqual(order.total_price, Decimal(checkout.total_amount) / 100)
+        self.assertEqual(order.order_items.count(), 60)
+        self.assertFalse(CartItem.objects.filter(user=self.user).exists())
+
+    def test_single_item_checkout_and_deleted_items(self):
+        item, gone = self.items[0], self.items[1]
+        session_id = self.client.post(
+            "/api/create-checkout-session/", {"menu_item_id": item.id, "quantity": 2}, format="json"
+        ).json()["sessionId"]
+        CheckoutSession.objects.get(stripe_session_id=session_id).items.create(menu_item=gone, quantity=1, unit_amount=410)
+        gone.delete()
+
+        with self.assertLogs("core.webhooks", "WARNING"):
+            order = self.fulfill(session_id)
+        self.assertEqual(order.total_price, Decimal("6.20"))
+        self.assertEqual(list(order.order_items.values_list("menu_item_id", "quantity")), [(item.id, 2)])
+
+    def test_snapshot_is_read_with_one_query(self):
+        with self.assertNumQueries(1):
+            self.assertIsNone(checkout.snapshot_lines("cs_missing"))
@@ -4,7 +4,7 @@ from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 from .views import (
     MenuItemViewSet, CartItemViewSet, OrderViewSet, ReviewViewSet,
     RegisterView, login_view, logout_view, me_view, merge_cart_view,
-    create_checkout_session, create_multi_checkout_session, stripe_webhook
+    create_checkout_session, create_multi_checkout_session, stripe_webhook, metrics_view
 )
 
 router = DefaultRouter()
@@ -33,4 +33,7 @@ urlpatterns = [
     path("api/create-checkout-session/", create_checkout_session, name="create-checkout-session"),
     path("api/create-multi-checkout-session/", create_multi_checkout_session, name="create-multi-checkout-session"),
     path('api/stripe-webhook/', stripe_webhook, name='stripe-webhook'),
+
+    # Prometheus
+    path('metrics/', metrics_view, name='metrics'),
 ]
@@ -1,22 +1,37 @@
 import os
+import hmac
 import json
 import logging
-import stripe
 
 from django.conf import settings
-from django.utils import timezone
 from django.views.decorators.csrf import csrf_exempt
 from django.contrib.auth import authenticate
-from django.contrib.auth.models import User
-from django.http import JsonResponse, HttpResponse
-
-from rest_framework import viewsets, status, filters
-from rest_framework.decorators import api_view, permission_classes
-from rest_framework.permissions import IsAuthenticated, AllowAny
+from django.core.handlers.asgi import ASGIRequest
+from django.db import transaction
+from django.http import JsonResponse, HttpResponse, StreamingHttpResponse
+
+from rest_framework import viewsets, status
+from rest_framework.decorators import action, api_view, permission_classes
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import IsAdminUser, IsAuthenticated, AllowAny
 from rest_framework.response import Response
-from rest_framework_simplejwt.tokens import RefreshToken
-
-from .models import MenuItem, CartItem, Order, Review, OrderItem
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+
+from . import integrations, metrics, order_export, ratings
+from .async_views import AsyncAPIView
+from .authentication import ClaimsRefreshToken, revoke_access_token, revoke_refresh_token
+from .cache import CatalogCacheMixin
+from .cart import merge_cart_items
+from .checkout import record_checkout_session
+from .fast_serializers import FastReadMixin, menu_item_rows, order_rows
+from .menu_changes import changes_since
+from .models import MenuItem, CartItem, Order, Review
+from .pagination import MenuItemCursorPagination, OrderCursorPagination, ReviewCursorPagination
+from .routers import ReplicaReadMixin, pin_to_primary, user_pin
+from .search import MenuItemSearchFilter
+from .stripe_catalog import line_item_for
+from .webhooks import enqueue_event
 from .serializers import (
     MenuItemSerializer,
     CartItemSerializer,
@@ -27,18 +42,85 @@ from .serializers import (
 )
 
 logger = logging.getLogger(__name__)
-stripe.api_key = settings.STRIPE_SECRET_KEY
 FRONTEND_URL = os.getenv("FRONTEND_URL", "http://localhost:3000")
 
 
 # Menu Item ViewSet
-class MenuItemViewSet(viewsets.ModelViewSet):
-    queryset = MenuItem.objects.all().order_by('-created_at')
+class MenuItemViewSet(ReplicaReadMixin, CatalogCacheMixin, FastReadMixin, viewsets.ModelViewSet):
+    catalog_reads = True
+    queryset = MenuItem.objects.all().order_by('-created_at', '-id')
     serializer_class = MenuItemSerializer
-    filter_backends = [filters.SearchFilter]
+    row_serializer = menu_item_rows
+    filter_backends = [MenuItemSearchFilter]
     search_fields = ['title', 'description']
+    pagination_class = MenuItemCursorPagination
     permission_classes = [AllowAny]
 
+    @action(detail=False, url_path='top-rated')
+    def top_rated(self, request):
+        return self.cached_response(request, self._top_rated)
+
+    def _top_rated(self, request):
+        try:
+            limit = max(1, min(int(request.query_params.get('limit', 10)), 50))
+            min_reviews = int(request.query_params.get('min_reviews', 1))
+        except ValueError:
+            return Response({"error": "limit and min_reviews must be integers"}, status=400)
+
+        queryset = (
+            self.get_queryset()
+            .filter(review_count__gte=min_reviews)
+            .order_by('-rating_average', '-review_count')
+            .values(*self.row_serializer.columns)[:limit]
+        )
+        return Response(self.row_serializer.serialize(queryset))
+
+    # Newest-first reviews for one item, paged along the (menu_item, -created_at) index
+    @action(detail=True)
+    def reviews(self, request, pk=None):
+        return self.cached_response(request, self._reviews, pk=pk)
+
+    def _reviews(self, request, pk=None):
+        menu_item = self.get_object()
+        queryset = Review.objects.filter(menu_item=menu_item).select_related('user')
+        try:
+            if 'rating' in request.query_params:
+                queryset = queryset.filter(rating=int(request.query_params['rating']))
+            if 'min_rating' in request.query_params:
+                queryset = queryset.filter(rating__gte=int(request.query_params['min_rating']))
+        except ValueError:
+            return Response({"error": "rating and min_rating must be integers"}, status=400)
+
+        paginator = ReviewCursorPagination()
+        page = paginator.paginate_queryset(queryset, request, view=self)
+        serializer = ReviewSerializer(page, many=True, context=self.get_serializer_context())
+        return paginator.get_paginated_response(serializer.data)
+
+    # What changed after a menu version (see core/menu_changes.py), so clients don't re-download the menu
+    @action(detail=False)
+    def changes(self, request):
+        return self.cached_response(request, self._changes)
+
+    def _changes(self, request):
+        try:
+            since = int(request.query_params.get('since', 0))
+        except ValueError:
+            return Response({"error": "since must be an integer"}, status=400)
+
+        version, items, deleted, has_more = changes_since(since)
+        return Response({
+            "version": version,
+            "has_more": has_more,
+            "items": self.row_serializer.serialize(items.values(*self.row_serializer.columns)),
+            "deleted": deleted,
+        })
+
+    def paginate_queryset(self, queryset):
+        # Ranked search results are already capped at SEARCH_RESULT_LIMIT
+        if self.request.query_params.get(MenuItemSearchFilter.search_param):
+            return None
+        return super().paginate_queryset(queryset)
+
 
 # Cart Item ViewSet
 class CartItemViewSet(viewsets.ModelViewSet):
@@ -46,31 +128,88 @@ class CartItemViewSet(viewsets.ModelViewSet):
     serializer_class = CartItemSerializer
 
     def get_queryset(self):
-        return CartItem.objects.filter(user=self.request.user)
+        return CartItem.objects.filter(user=self.request.user).select_related('menu_item')
 
     def perform_create(self, serializer):
-        serializer.save(user=self.request.user)
+        # Adding an item that is already in the cart increases its quantity
+        menu_item = serializer.validated_data['menu_item']
+        merge_cart_items(self.request.user, {menu_item.id: serializer.validated_data.get('quantity', 1)})
+        serializer.instance = self.get_queryset().get(menu_item=menu_item)
+
+    def perform_destroy(self, instance):
+        instance.delete()
+        pin_to_primary(user_pin(instance.user_id))
 
 
 # Order ViewSet
-class OrderViewSet(viewsets.ReadOnlyModelViewSet):
+class OrderViewSet(ReplicaReadMixin, FastReadMixin, viewsets.ReadOnlyModelViewSet):
     permission_classes = [IsAuthenticated]
     serializer_class = OrderSerializer
+    row_serializer = order_rows
+    pagination_class = OrderCursorPagination
 
     def get_queryset(self):
+        # The row serializer joins the user and loads all items and menu items in
+        # one more query, so a page of history is two queries however long it is
         return Order.objects.filter(user=self.request.user)
 
+    # Every user's orders for accounting, streamed as they are read
+    @action(detail=False, url_path='export', permission_classes=[IsAdminUser])
+    def export(self, request):
+        # ?format= is taken by DRF's renderer negotiation
+        export_format = request.query_params.get('export_format', 'csv')
+        if export_format not in order_export.FORMATS:
+            raise ValidationError({"export_format": f"Must be one of {', '.join(order_export.FORMATS)}."})
+        try:
+            filters = order_export.order_filters(
+                request.query_params.get('since'),
+                request.query_params.get('until'),
+                request.query_params.get('status'),
+            )
+        except ValueError as exc:
+            raise ValidationError({"detail": str(exc)})
+
+        # Under ASGI a sync iterator would be read to the end before the first byte went out
+        chunks = order_export.aexport_chunks if isinstance(request._request, ASGIRequest) else order_export.export_chunks
+        response = StreamingHttpResponse(
+            chunks(export_format, filters), content_type=order_export.CONTENT_TYPES[export_format],
+        )
+        response['Content-Disposition'] = f'attachment; filename="orders.{export_format}"'
+        return response
+
 
 # Review ViewSet
-class ReviewViewSet(viewsets.ModelViewSet):
+class ReviewViewSet(ReplicaReadMixin, viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated]
     serializer_class = ReviewSerializer
+    pagination_class = ReviewCursorPagination
 
     def get_queryset(self):
-        return Review.objects.all()
-
+        queryset = Review.objects.select_related('user')
+        menu_item_id = self.request.query_params.get('menu_item')
+        if menu_item_id is not None:
+            if not menu_item_id.isdigit():
+                raise ValidationError({"menu_item": "Must be an integer."})
+            queryset = queryset.filter(menu_item_id=menu_item_id)
+        return queryset
+
+    # Every write also shifts the menu item's stored rating aggregates
+    @transaction.atomic
     def perform_create(self, serializer):
-        serializer.save(user=self.request.user)
+        review = serializer.save(user=self.request.user)
+        ratings.review_created(review)
+
+    @transaction.atomic
+    def perform_update(self, serializer):
+        old_menu_item_id, old_rating = serializer.instance.menu_item_id, serializer.instance.rating
+        review = serializer.save()
+        ratings.review_updated(review, old_menu_item_id, old_rating)
+
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        instance.delete()
+        ratings.review_deleted(instance)
+        pin_to_primary(user_pin(instance.user_id))
 
 
 # Register View
@@ -93,7 +232,7 @@ def login_view(request):
 
     user = authenticate(request, username=username, password=password)
     if user is not None:
-        refresh = RefreshToken.for_user(user)
+        refresh = ClaimsRefreshToken.for_user(user)
         access_token = str(refresh.access_token)
         refresh_token = str(refresh)
 
@@ -111,6 +250,17 @@ def login_view(request):
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def logout_view(request):
+    refresh = request.data.get("refresh")
+    if refresh:
+        try:
+            token = ClaimsRefreshToken(refresh)
+        except TokenError:
+            return Response({"error": "Invalid refresh token"}, status=400)
+        if token.get(jwt_settings.USER_ID_CLAIM) != request.user.id:
+            return Response({"error": "Invalid refresh token"}, status=400)
+        revoke_refresh_token(token, request.user)
+    if request.auth is not None:
+        revoke_access_token(request.auth)
     response = JsonResponse({"message": "Logged out"})
     return response
 
@@ -127,116 +277,85 @@ def me_view(request):
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def merge_cart_view(request):
-    user = request.user
-    items = request.data.get("items", [])
-
-    for item in items:
-        menu_item_id = item.get("menu_item_id")
-        quantity = item.get("quantity", 1)
+    quantities = {}
+    for item in request.data.get("items", []):
         try:
-            menu_item = MenuItem.objects.get(id=menu_item_id)
-            cart_item, created = CartItem.objects.get_or_create(
-                user=user,
-                menu_item=menu_item,
-                defaults={"quantity": quantity}
-            )
-            if not created:
-                cart_item.quantity += quantity
-                cart_item.save()
-        except MenuItem.DoesNotExist:
+            menu_item_id = int(item.get("menu_item_id"))
+            quantity = int(item.get("quantity", 1))
+        except (AttributeError, TypeError, ValueError):
             continue
+        if quantity > 0:
+            quantities[menu_item_id] = quantities.get(menu_item_id, 0) + quantity
 
+    merge_cart_items(request.user, quantities)
     return Response({"message": "Cart merged successfully"})
 
 
 # Stripe Checkout Single Item
-@api_view(['POST'])
-@permission_classes([IsAuthenticated])
-def create_checkout_session(request):
-    try:
-        item_id = request.data.get("menu_item_id")
-        quantity = request.data.get("quantity", 1)
-
-        item = MenuItem.objects.get(id=item_id)
-
-        session = stripe.checkout.Session.create(
-            payment_method_types=["card"],
-            line_items=[{
-                "price_data": {
-                    "currency": "usd",
-                    "product_data": {
-                        "name": item.title,
-                        "description": item.description,
-                    },
-                    "unit_amount": int(item.price * 100),
-                },
-                "quantity": quantity,
-            }],
-            mode="payment",
-            success_url=f"{FRONTEND_URL}/success?session_id={{CHECKOUT_SESSION_ID}}",
-            cancel_url=f"{FRONTEND_URL}/cancel",
-            metadata={
-                "user_id": str(request.user.id),
-                "cart": json.dumps([{
-                    "menu_item_id": item.id,
-                    "quantity": quantity,
-                    "price": float(item.price)
-                }])
-            }
-        )
+# Async so a worker isn't held for the Stripe round trip when served over ASGI; under WSGI
+# (gunicorn as shipped) the Stripe call is a plain sync one on the worker's keep-alive session
+class CheckoutSessionView(AsyncAPIView):
+    permission_classes = [IsAuthenticated]
 
-        return Response({"sessionId": session.id})
-    except Exception as e:
-        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    async def post(self, request):
+        try:
+            item_id = request.data.get("menu_item_id")
+            quantity = int(request.data.get("quantity", 1))
+
+            item = await self.db_call(MenuItem.objects.select_related("stripe_price").get)(id=item_id)
+
+            session = await integrations.create_checkout_session(
+                serving_asgi=self.serving_asgi,
+                payment_method_types=["card"],
+                line_items=[line_item_for(item, quantity, with_description=True)],
+                mode="payment",
+                success_url=f"{FRONTEND_URL}/success?session_id={{CHECKOUT_SESSION_ID}}",
+                cancel_url=f"{FRONTEND_URL}/cancel",
+                metadata={"user_id": str(request.user.id)}
+            )
+            # The webhook builds the order from this snapshot, not from metadata
+            await self.db_call(record_checkout_session)(session.id, request.user, [(item, quantity)])
+
+            return Response({"sessionId": session.id})
+        except Exception as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
 
 # Stripe Checkout Multiple Cart Items
-@api_view(['POST'])
-@permission_classes([IsAuthenticated])
-def create_multi_checkout_session(request):
-    user = request.user
-    cart_items = CartItem.objects.filter(user=user)
-
-    if not cart_items.exists():
-        return Response({"error": "Your cart is empty"}, status=400)
-
-    line_items = []
-    cart_metadata = []
-
-    for item in cart_items:
-        menu_item = item.menu_item
-        line_items.append({
-            'price_data': {
-                'currency': 'usd',
-                'product_data': {
-                    'name': menu_item.title,
-                },
-                'unit_amount': int(menu_item.price * 100),
-            },
-            'quantity': item.quantity,
-        })
-        cart_metadata.append({
-            "menu_item_id": menu_item.id,
-            "quantity": item.quantity,
-            "price": float(menu_item.price)
-        })
+class MultiCheckoutSessionView(AsyncAPIView):
+    permission_classes = [IsAuthenticated]
 
-    try:
-        session = stripe.checkout.Session.create(
-            payment_method_types=['card'],
-            line_items=line_items,
-            mode='payment',
-            success_url=f"{FRONTEND_URL}/success?session_id={{CHECKOUT_SESSION_ID}}",
-            cancel_url=f"{FRONTEND_URL}/cancel",
-            metadata={
-                'user_id': str(user.id),
-                'cart': json.dumps(cart_metadata)
-            }
-        )
-        return Response({"sessionId": session.id})
-    except Exception as e:
-        logger.error(f"Stripe multi-checkout error: {e}")
-        return Response({"error": str(e)}, status=500)
+    async def post(self, request):
+        user = request.user
+        # Cart lines, menu items and Stripe prices in one joined query
+        cart_items = await self.db_call(list)(CartItem.objects.filter(user=user).select_related("menu_item__stripe_price"))
+
+        if not cart_items:
+            return Response({"error": "Your cart is empty"}, status=400)
+
+        line_items = [line_item_for(item.menu_item, item.quantity) for item in cart_items]
+
+        try:
+            session = await integrations.create_checkout_session(
+                serving_asgi=self.serving_asgi,
+                payment_method_types=['card'],
+                line_items=line_items,
+                mode='payment',
+                success_url=f"{FRONTEND_URL}/success?session_id={{CHECKOUT_SESSION_ID}}",
+                cancel_url=f"{FRONTEND_URL}/cancel",
+                metadata={'user_id': str(user.id)}
+            )
+            await self.db_call(record_checkout_session)(
+                session.id, user, [(item.menu_item, item.quantity) for item in cart_items]
+            )
+            return Response({"sessionId": session.id})
+        except Exception as e:
+            logger.error(f"Stripe multi-checkout error: {e}")
+            return Response({"error": str(e)}, status=500)
+
+
+create_checkout_session = CheckoutSessionView.as_view()
+create_multi_checkout_session = MultiCheckoutSessionView.as_view()
 
 
 # Stripe Webhook
@@ -244,6 +363,7 @@ def create_multi_checkout_session(request):
 def stripe_webhook(request):
     payload = request.body
     sig_header = request.META.get('HTTP_STRIPE_SIGNATURE', '')
+    stripe = integrations.get_stripe()
 
     try:
         event = stripe.Webhook.construct_event(payload, sig_header, settings.STRIPE_WEBHOOK_SECRET)
@@ -256,37 +376,24 @@ def stripe_webhook(request):
 
     logger.info(f"Received event: {event['type']}")
 
-    if event['type'] == 'checkout.session.completed':
-        session = event['data']['object']
-        metadata = session.get('metadata', {})
-
-        try:
-            user = User.objects.get(id=metadata.get('user_id'))
-            cart_items = json.loads(metadata.get('cart'))
-
-            CartItem.objects.filter(user=user).delete()
-
-            order = Order.objects.create(
-                user=user,
-                total_price=sum(item['price'] * item['quantity'] for item in cart_items),
-                is_paid=True,
-                status='success',
-                ordered_at=timezone.now()
-            )
-
-            for item in cart_items:
-                menu_item = MenuItem.objects.get(id=item['menu_item_id'])
-                OrderItem.objects.create(
-                    order=order,
-                    menu_item=menu_item,
-                    quantity=item['quantity'],
-                    price_at_order=item['price']
-                )
+    # Orders are built by `manage.py process_stripe_events`; just persist the event here
+    try:
+        enqueue_event(json.loads(payload))
+    except Exception as e:
+        logger.error(f"Error queueing event: {e}")
+        return HttpResponse(status=500)
 
-            logger.info(f"Order #{order.id} created for user {user.username}")
+    return HttpResponse(status=200)
 
-        except Exception as e:
-            logger.error(f"Error creating order: {e}")
-            return HttpResponse(status=500)
 
-    return HttpResponse(status=200)
+# Prometheus Metrics
+def metrics_view(request):
+    token = settings.METRICS_TOKEN
+    if token:
+        sent = request.META.get('HTTP_AUTHORIZATION', '').removeprefix('Bearer ')
+        allowed = hmac.compare_digest(sent.encode(), token.encode())
+    else:
+        allowed = settings.DEBUG
+    if not allowed:
+        return HttpResponse(status=403)
+    return HttpResponse(metrics.expose(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,162 @@
+import json
+import logging
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import IntegrityError, connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .checkout import snapshot_lines
+from .models import CartItem, MenuItem, Order, OrderItem, StripeEvent
+
+logger = logging.getLogger(__name__)
+
+MAX_ATTEMPTS = getattr(settings, "STRIPE_EVENT_MAX_ATTEMPTS", 8)
+RETRY_BASE_SECONDS = getattr(settings, "STRIPE_EVENT_RETRY_BASE_SECONDS", 10)
+RETRY_MAX_SECONDS = getattr(settings, "STRIPE_EVENT_RETRY_MAX_SECONDS", 3600)
+LEASE_SECONDS = getattr(settings, "STRIPE_EVENT_LEASE_SECONDS", 300)
+
+
+def metadata_lines(session):
+    # Sessions created before checkout snapshots carried the cart JSON in their metadata
+    metadata = session.get("metadata") or {}
+    user = User.objects.get(id=metadata.get("user_id"))
+    cart = json.loads(metadata.get("cart") or "[]")
+    if not cart:
+        raise ValueError(f"No checkout snapshot or cart metadata for session {session['id']}")
+    existing = set(MenuItem.objects.filter(id__in={line["menu_item_id"] for line in cart}).values_list("id", flat=True))
+    return user.id, [
+        (line["menu_item_id"] if line["menu_item_id"] in existing else None, line["quantity"], Decimal(str(line["price"])))
+        for line in cart
+    ]
+
+
+def fulfill_checkout_session(session):
+    snapshot = snapshot_lines(session["id"])
+    user_id, cart = snapshot if snapshot is not None else metadata_lines(session)
+
+    lines = []
+    for menu_item_id, quantity, price in cart:
+        if menu_item_id is None:
+            logger.warning(f"A menu item in session {session['id']} no longer exists, skipping line")
+            continue
+        lines.append((menu_item_id, quantity, price))
+
+    order = Order.objects.create(
+        user_id=user_id,
+        total_price=sum(price * quantity for _, quantity, price in lines),
+        is_paid=True,
+        status='success',
+        stripe_session_id=session["id"],
+    )
+    OrderItem.objects.bulk_create(
+        OrderItem(order=order, menu_item_id=menu_item_id, quantity=quantity, price_at_order=price)
+        for menu_item_id, quantity, price in lines
+    )
+    CartItem.objects.filter(user_id=user_id).delete()
+
+    logger.info(f"Order #{order.id} created for user {user_id}")
+    return order
+
+
+EVENT_HANDLERS = {
+    "checkout.session.completed": lambda event: fulfill_checkout_session(event["data"]["object"]),
+}
+
+
+def enqueue_event(event):
+    """
+    Stores a verified Stripe event for the worker. Redeliveries of the same
+    event ID are dropped by the unique constraint. Returns False for event
+    types we don't handle.
+    """
+    if event["type"] not in EVENT_HANDLERS:
+        return False
+    StripeEvent.objects.bulk_create(
+        [StripeEvent(event_id=event["id"], type=event["type"], payload=event)],
+        ignore_conflicts=True,
+    )
+    return True
+
+
+def _ready_filter(now):
+    stale = now - timedelta(seconds=LEASE_SECONDS)
+    return (
+        Q(status=StripeEvent.PENDING, available_at__lte=now)
+        | Q(status=StripeEvent.PROCESSING, locked_at__lt=stale)
+    )
+
+
+def claim_events(worker_id, limit):
+    """
+    Leases up to ``limit`` due events to ``worker_id``. Uses SELECT ... FOR
+    UPDATE SKIP LOCKED where supported; elsewhere (SQLite) each candidate is
+    claimed with a compare-and-swap UPDATE so parallel workers never share one.
+    Events whose lease expired (crashed worker) are picked up again.
+    """
+    now = timezone.now()
+    claim = dict(status=StripeEvent.PROCESSING, locked_by=worker_id, locked_at=now, attempts=F("attempts") + 1)
+    candidates = StripeEvent.objects.filter(_ready_filter(now)).order_by("available_at")
+
+    if connections[candidates.db].features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            ids = list(candidates.select_for_update(skip_locked=True).values_list("pk", flat=True)[:limit])
+            StripeEvent.objects.filter(pk__in=ids).update(**claim)
+    else:
+        ids = [
+            pk
+            for pk, status, locked_at in candidates.values_list("pk", "status", "locked_at")[:limit]
+            if StripeEvent.objects.filter(pk=pk, status=status, locked_at=locked_at).update(**claim)
+        ]
+
+    return list(StripeEvent.objects.filter(pk__in=ids, locked_by=worker_id).order_by("available_at"))
+
+
+def process_event(stripe_event):
+    done = StripeEvent.objects.filter(pk=stripe_event.pk, locked_by=stripe_event.locked_by)
+    try:
+        with transaction.atomic():
+            EVENT_HANDLERS[stripe_event.type](stripe_event.payload)
+            done.update(status=StripeEvent.DONE, processed_at=timezone.now(), last_error="")
+    except IntegrityError as e:
+        session_id = stripe_event.payload["data"]["object"].get("id")
+        if not Order.objects.filter(stripe_session_id=session_id).exists():
+            # Some other constraint failed, so the order was never created
+            schedule_retry(stripe_event, e)
+            return False
+        # Another event for the same checkout session already created the order
+        logger.info(f"Stripe event {stripe_event.event_id} duplicates a processed session, skipping")
+        done.update(status=StripeEvent.DONE, processed_at=timezone.now(), last_error="duplicate session")
+    except Exception as e:
+        schedule_retry(stripe_event, e)
+        return False
+    return True
+
+
+def schedule_retry(stripe_event, error):
+    attempts = StripeEvent.objects.values_list("attempts", flat=True).get(pk=stripe_event.pk)
+    if attempts >= MAX_ATTEMPTS:
+        logger.error(f"Stripe event {stripe_event.event_id} failed permanently after {attempts} attempts: {error}")
+        status, delay = StripeEvent.FAILED, 0
+    else:
+        logger.warning(f"Stripe event {stripe_event.event_id} failed (attempt {attempts}), retrying: {error}")
+        status, delay = StripeEvent.PENDING, min(RETRY_BASE_SECONDS * 2 ** (attempts - 1), RETRY_MAX_SECONDS)
+
+    StripeEvent.objects.filter(pk=stripe_event.pk, locked_by=stripe_event.locked_by).update(
+        status=status,
+        available_at=timezone.now() + timedelta(seconds=delay),
+        locked_by="",
+        locked_at=None,
+        last_error=str(error),
+    )
+
+
+def process_batch(worker_id, batch_size):
+    """Claims and processes one batch. Returns the number of events claimed."""
+    events = claim_events(worker_id, batch_size)
+    for stripe_event in events:
+        process_event(stripe_event)
+    return len(events)
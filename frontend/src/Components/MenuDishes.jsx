@@ -50,6 +50,8 @@ const MenuDishes = ({ dishes = [], handleBuyNow = () => {}, loading = false }) =
             </h3>
             <img
               src={item.image || "https://via.placeholder.com/300x200?text=No+Image"}
+              srcSet={item.image_srcset || undefined}
+              sizes="(min-width: 640px) 384px, 100vw"
               alt={item.title}
               className="w-full h-48 sm:h-52 object-cover rounded-md mb-4"
             />
@@ -110,6 +110,7 @@ export default function CartPage() {
               >
                 <img
                   src={
+                    item.menu_item.image_variants?.thumbnail?.url ||
                     item.menu_item.image ||
                     "https://via.placeholder.com/100x100?text=No+Image"
                   }
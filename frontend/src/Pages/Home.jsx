@@ -24,9 +24,9 @@ export default function Home() {
   useEffect(() => {
     const fetchTopDishes = async () => {
       try {
-        const res = await axiosInstance.get("/menu-items/");
-        if (Array.isArray(res.data)) {
-          setTopDishes(res.data.slice(0, 4)); // Take first 4 items
+        const res = await axiosInstance.get("/menu-items/?page_size=4");
+        if (Array.isArray(res.data?.results)) {
+          setTopDishes(res.data.results); // First page holds the 4 newest items
         } else {
           console.warn("Unexpected response data:", res.data);
           toast.error("Failed to load top dishes.");
@@ -11,6 +11,7 @@ const stripePromise = loadStripe(import.meta.env.VITE_STRIPE_PUBLIC_KEY);
 
 const Menu = () => {
   const [menuItems, setMenuItems] = useState([]);
+  const [nextPage, setNextPage] = useState(null);
   const [loading, setLoading] = useState(true);
   const location = useLocation();
   const navigate = useNavigate();
@@ -27,7 +28,11 @@ const Menu = () => {
         const response = await axiosInstance.get(
           `/menu-items/?search=${search}`
         );
-        setMenuItems(Array.isArray(response.data) ? response.data : []);
+        // Search results come back as a ranked list, browsing is cursor-paginated
+        const data = response.data;
+        const items = Array.isArray(data) ? data : data?.results;
+        setMenuItems(Array.isArray(items) ? items : []);
+        setNextPage(Array.isArray(data) ? null : data?.next || null);
       } catch (error) {
         console.error(
           "Error fetching menu:",
@@ -41,6 +46,19 @@ const Menu = () => {
     fetchMenu();
   }, [location.search]);
 
+  // Load the next page of menu items
+  const loadMore = async () => {
+    if (!nextPage) return;
+    try {
+      const response = await axiosInstance.get(nextPage);
+      setMenuItems((items) => [...items, ...response.data.results]);
+      setNextPage(response.data.next);
+    } catch (error) {
+      console.error("Error loading more items:", error.response?.data || error.message);
+      toast.error("Failed to load more menu items.");
+    }
+  };
+
   // Merge guest cart after login
   useEffect(() => {
     const mergeGuestCart = async () => {
@@ -148,6 +166,8 @@ const Menu = () => {
                 item.image ||
                 "https://via.placeholder.com/300x200?text=No+Image"
               }
+              srcSet={item.image_srcset || undefined}
+              sizes="(min-width: 640px) 384px, 100vw"
               alt={item.title}
               className="w-full h-44 sm:h-48 object-cover rounded-md mb-4"
             />
@@ -176,6 +196,17 @@ const Menu = () => {
           </div>
         ))}
       </div>
+
+      {nextPage && (
+        <div className="flex justify-center mt-10">
+          <button
+            className="bg-gray-700 hover:bg-gray-600 border border-white text-white px-6 py-2 rounded-md font-medium"
+            onClick={loadMore}
+          >
+            Load more
+          </button>
+        </div>
+      )}
     </div>
   );
 };
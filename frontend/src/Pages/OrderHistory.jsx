@@ -6,6 +6,7 @@ import { toast } from "react-toastify";
 
 export default function OrderHistoryPage() {
   const [orders, setOrders] = useState([]);
+  const [nextPage, setNextPage] = useState(null);
   const [loading, setLoading] = useState(true);
 
   // Redirect unauthenticated users with toast
@@ -21,11 +22,10 @@ export default function OrderHistoryPage() {
     const fetchOrders = async () => {
       setLoading(true);
       try {
+        // Orders arrive newest first, one cursor page at a time
         const res = await axiosInstance.get("/orders/");
-        const sortedOrders = res.data.sort(
-          (a, b) => new Date(b.ordered_at) - new Date(a.ordered_at)
-        );
-        setOrders(sortedOrders);
+        setOrders(res.data.results);
+        setNextPage(res.data.next);
       } catch (err) {
         console.error("Error fetching orders:", err);
       } finally {
@@ -36,6 +36,17 @@ export default function OrderHistoryPage() {
     fetchOrders();
   }, []);
 
+  const loadMore = async () => {
+    if (!nextPage) return;
+    try {
+      const res = await axiosInstance.get(nextPage);
+      setOrders((current) => [...current, ...res.data.results]);
+      setNextPage(res.data.next);
+    } catch (err) {
+      console.error("Error fetching orders:", err);
+    }
+  };
+
   if (!isAuthenticated()) {
     return <Navigate to="/login" replace />;
   }
@@ -93,7 +104,7 @@ export default function OrderHistoryPage() {
                           <td className="py-2 px-2 w-20">
                             {item.menu_item.image ? (
                               <img
-                                src={item.menu_item.image}
+                                src={item.menu_item.image_variants?.thumbnail?.url || item.menu_item.image}
                                 alt={item.menu_item.title}
                                 className="w-16 h-16 object-cover rounded"
                               />
@@ -119,6 +130,16 @@ export default function OrderHistoryPage() {
                 </p>
               </div>
             ))}
+            {nextPage && (
+              <div className="text-center">
+                <button
+                  className="bg-orange-500 hover:bg-orange-600 text-white px-6 py-2 rounded-md font-medium"
+                  onClick={loadMore}
+                >
+                  Load older orders
+                </button>
+              </div>
+            )}
           </div>
         )}
       </div>
@@ -69,7 +69,12 @@ export const AuthProvider = ({ children }) => {
   };
 
   // Logout handler
-  const logout = () => {
+  const logout = async () => {
+    try {
+      await axiosInstance.post("/logout/", { refresh: localStorage.getItem("refreshToken") });
+    } catch (err) {
+      console.error("Logout error:", err);
+    }
     localStorage.removeItem("token");
     localStorage.removeItem("refreshToken");
     setUser(null);
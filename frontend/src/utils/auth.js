@@ -1,4 +1,5 @@
 // utils/auth.js
+import axiosInstance from "../Components/axiosInstance";
 
 // Decode JWT payload (without verifying signature)
 export const parseJwt = (token) => {
@@ -20,7 +21,15 @@ export const isAuthenticated = () => {
   return payload.exp > now;
 };
 
-export const logout = () => {
+export const logout = async () => {
+  const refreshToken = localStorage.getItem("refreshToken");
+  try {
+    // Revokes both tokens server-side; they are dropped locally either way
+    await axiosInstance.post("/logout/", { refresh: refreshToken });
+  } catch (err) {
+    console.error("Logout error:", err);
+  }
   localStorage.removeItem("token");
+  localStorage.removeItem("refreshToken");
   window.location.href = "/login";
 };